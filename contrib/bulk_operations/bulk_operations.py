@@ -13,6 +13,9 @@ on the viewset which calls `pdc.apps.common.bulk.bulk_op_impl` instead of a
 parent class. Bulk create does not get its own tab in browsable API. If the
 docstrings for these methods are not provided, they come with some generic
 ones.
+
+Viewsets inheriting `SetBulkOperationsMixin` process bulk requests as a whole
+instead of running the single object view for each item.
 """
 
 from functools import wraps
@@ -21,8 +24,14 @@ from collections import OrderedDict
 from rest_framework.settings import api_settings
 
 from rest_framework import routers, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from django.conf import settings
+from django.core.exceptions import ValidationError as ModelValidationError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, Value, When
+from django.db.models.deletion import ProtectedError
+from django.http import Http404
 
 
 def _failure_response(ident, response, data=None):
@@ -64,6 +73,8 @@ def _safe_run(func, *args, **kwargs):
 def bulk_create_wrapper(func):
     @wraps(func)
     def wrapper(self, request, *args, **kwargs):
+        if not getattr(self, 'bulk_create_allowed', lambda request: True)(request):
+            return func(self, request, *args, **kwargs)
         data = request.data
         if not isinstance(data, list):
             return func(self, request, *args, **kwargs)
@@ -138,6 +149,176 @@ def bulk_partial_update_impl(self, request, **kwargs):
     return self.bulk_update(request, **kwargs)
 
 
+def _error_response(exc):
+    """Convert an exception to response the same way as views do."""
+    return api_settings.EXCEPTION_HANDLER(exc, context={})
+
+
+def _bulk_update_fields(model, objs, fields, batch_size):
+    """
+    Write values of `fields` of all objects with one UPDATE query per batch.
+    """
+    fields = [model._meta.get_field(name) for name in fields]
+    for start in range(0, len(objs), batch_size):
+        batch = objs[start:start + batch_size]
+        values = {}
+        for field in fields:
+            values[field.attname] = Case(*[When(pk=obj.pk,
+                                                then=Value(getattr(obj, field.attname), output_field=field))
+                                           for obj in batch],
+                                         output_field=field)
+        model._default_manager.filter(pk__in=[obj.pk for obj in batch]).update(**values)
+
+
+class SetBulkOperationsMixin(object):
+    """
+    Viewset mixin that processes bulk create, update and delete requests as
+    a set instead of calling the single object view for each item.
+
+    All items are validated by the serializer first and errors are reported
+    in the same format as for the other viewsets. Existing objects are loaded
+    with one query by `lookup_field`, new objects are inserted with
+    `bulk_create`, changed fields are written with one UPDATE per batch of
+    `bulk_batch_size` objects and deleted objects are removed together.
+
+    Model `save()` and `delete()` methods and signals sent by them are not
+    called, and serializer `create()` and `update()` methods are not used
+    either. Use this only with plain models and serializers. Objects are
+    still checked with `full_clean()` (without uniqueness checks, which are
+    left to the database). If the model or the database rejects the data
+    (e.g. duplicate values in one request), the request is processed item by
+    item to find the failing one.
+
+    Subclasses can extend `perform_bulk_create`, `perform_bulk_update` and
+    `perform_bulk_destroy` to do additional work for all objects at once.
+    """
+    bulk_batch_size = 500
+
+    def create(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return super(SetBulkOperationsMixin, self).create(request, *args, **kwargs)
+
+        serializer = self.get_serializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            for idx, errors in enumerate(serializer.errors):
+                if errors:
+                    return _failure_response(idx, _error_response(ValidationError(errors)),
+                                             data=request.data[idx])
+        try:
+            with transaction.atomic():
+                self.perform_bulk_create(serializer)
+        except (IntegrityError, ModelValidationError):
+            create = super(SetBulkOperationsMixin, type(self)).create
+            return bulk_create_wrapper(create)(self, request, *args, **kwargs)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def perform_bulk_create(self, serializer):
+        """
+        Insert objects for validated data of the list `serializer` and set
+        them as its instance.
+        """
+        model = serializer.child.Meta.model
+        objs = [model(**attrs) for attrs in serializer.validated_data]
+        for obj in objs:
+            obj.full_clean(validate_unique=False)
+        if connection.features.can_return_ids_from_bulk_insert:
+            model._default_manager.bulk_create(objs, batch_size=self.bulk_batch_size)
+        else:
+            # Primary keys would not be set on the objects.
+            for obj in objs:
+                obj.save(force_insert=True)
+        serializer.instance = objs
+
+    def _get_bulk_objects(self, idents):
+        """
+        Return a dict mapping given identifiers to objects. Identifiers of
+        objects that do not exist are not included.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        objs = queryset.filter(**{'%s__in' % self.lookup_field: idents})
+        result = {}
+        for obj in objs:
+            self.check_object_permissions(self.request, obj)
+            result[unicode(getattr(obj, self.lookup_field))] = obj
+        return result
+
+    def bulk_update(self, request, **kwargs):
+        if not isinstance(request.data, dict):
+            return Response(status=status.HTTP_400_BAD_REQUEST,
+                            data={'detail': 'Bulk update needs a mapping.'})
+        partial = kwargs.pop('partial', self.kwargs.get('partial', False))
+        objs = self._get_bulk_objects([unicode(ident) for ident in request.data])
+        serializers = OrderedDict()
+        for ident, data in request.data.iteritems():
+            obj = objs.get(unicode(ident))
+            if obj is None:
+                return _failure_response(ident, _error_response(Http404()), data=data)
+            serializer = self.get_serializer(obj, data=data, partial=partial)
+            if not serializer.is_valid():
+                return _failure_response(ident, _error_response(ValidationError(serializer.errors)),
+                                         data=data)
+            serializers[ident] = serializer
+        try:
+            with transaction.atomic():
+                self.perform_bulk_update(serializers.values())
+        except (IntegrityError, ModelValidationError):
+            return bulk_update_impl(self, request, **kwargs)
+        return Response(status=status.HTTP_200_OK,
+                        data=dict((ident, serializer.data) for ident, serializer in serializers.iteritems()))
+
+    def perform_bulk_update(self, serializers):
+        """
+        Apply validated data of the serializers to their instances and write
+        them.
+        """
+        if not serializers:
+            return
+        model = serializers[0].Meta.model
+        fields = set()
+        for serializer in serializers:
+            for attr, value in serializer.validated_data.iteritems():
+                field = model._meta.get_field(attr)
+                if field.many_to_many:
+                    getattr(serializer.instance, attr).set(value)
+                else:
+                    setattr(serializer.instance, attr, value)
+                    fields.add(attr)
+        for serializer in serializers:
+            serializer.instance.full_clean(validate_unique=False)
+        if fields:
+            _bulk_update_fields(model, [serializer.instance for serializer in serializers],
+                                fields, self.bulk_batch_size)
+
+    def bulk_destroy(self, request, **kwargs):
+        if not isinstance(request.data, list):
+            return Response(status=status.HTTP_400_BAD_REQUEST,
+                            data={'detail': 'Bulk delete needs a list of identifiers.'})
+        for ident in request.data:
+            if not isinstance(ident, basestring) and not isinstance(ident, int):
+                return Response(status=status.HTTP_400_BAD_REQUEST,
+                                data={'detail': '"%s" is not a valid identifier.' % ident})
+        idents = OrderedDict.fromkeys(request.data).keys()
+        objs = self._get_bulk_objects([unicode(ident) for ident in idents])
+        for ident in idents:
+            if unicode(ident) not in objs:
+                return _failure_response(ident, _error_response(Http404()))
+        try:
+            with transaction.atomic():
+                self.perform_bulk_destroy([objs[unicode(ident)] for ident in idents])
+        except (IntegrityError, ProtectedError):
+            return bulk_destroy_impl(self, request, **kwargs)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def perform_bulk_destroy(self, objs):
+        if objs:
+            model = type(objs[0])
+            model._default_manager.filter(pk__in=[obj.pk for obj in objs]).delete()
+
+    # Keep the documentation shown in browsable API.
+    bulk_update.__doc__ = bulk_update_impl.__doc__
+    bulk_destroy.__doc__ = bulk_destroy_impl.__doc__
+
+
 def bulk_create_dummy_impl():
     """
     It is possible to create this resource in bulk. To do so, use the same
@@ -160,11 +341,15 @@ class BulkRouter(routers.DefaultRouter):
     respectively.
 
     The bulk create does not have a dedicated method (because the URL and
-    method are the same as for regular create). Currently, there is no way to
-    opt-out from having bulk create added. It is however possible to define a
+    method are the same as for regular create). It is possible to define a
     method named `bulk_create` which will provide docstring to be rendered in
     browsable API. This method will never be called. If the method is missing,
-    a generic documentation will be added.
+    a generic documentation will be added. Setting `bulk_create` to `None`
+    opts the viewset out of bulk create; its `create` is then responsible for
+    reading the request body. A viewset can also define method
+    `bulk_create_allowed(request)` returning `False` for requests whose body
+    should be left to `create`. Viewsets using `SetBulkOperationsMixin`
+    handle lists in `create` themselves.
     """
     def get_routes(self, viewset):
         for route in self.routes:
@@ -175,8 +360,9 @@ class BulkRouter(routers.DefaultRouter):
         return super(BulkRouter, self).get_routes(viewset)
 
     def register(self, prefix, viewset, base_name=None):
-        if hasattr(viewset, 'create'):
-            viewset.create = bulk_create_wrapper(viewset.create)
+        if hasattr(viewset, 'create') and getattr(viewset, 'bulk_create', True) is not None:
+            if not issubclass(viewset, SetBulkOperationsMixin):
+                viewset.create = bulk_create_wrapper(viewset.create)
             if not hasattr(viewset, 'bulk_create'):
                 viewset.bulk_create = bulk_create_dummy_impl
         if hasattr(viewset, 'destroy') and not hasattr(viewset, 'bulk_destroy'):
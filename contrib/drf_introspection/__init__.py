@@ -43,6 +43,9 @@ def get_allowed_query_params(view):
         page_size = getattr(view.paginator, 'page_size_query_param', None)
         if page_size:
             allowed_keys.add(page_size)
+        cursor = getattr(view.paginator, 'cursor_query_param', None)
+        if cursor:
+            allowed_keys.add(cursor)
 
     # Add fields from serializer if specified.
     serializer_class = getattr(view, 'serializer_class', None)
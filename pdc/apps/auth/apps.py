@@ -4,7 +4,7 @@
 # http://opensource.org/licenses/MIT
 #
 from django.apps import AppConfig
-from django.db.models.signals import post_migrate
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save
 
 
 class AuthConfig(AppConfig):
@@ -13,5 +13,12 @@ class AuthConfig(AppConfig):
     verbose_name = 'Auth with Kerberos support'
 
     def ready(self, *args, **kwargs):
-        from . import signals
+        from django.contrib.auth import get_user_model
+        from django.contrib.auth.models import Group
+        from . import models, signals
         post_migrate.connect(signals.update_resources, sender=self)
+        for model in (models.Resource, models.ActionPermission, models.ResourcePermission,
+                      models.GroupResourcePermission, Group):
+            post_save.connect(signals.invalidate_permission_matrix, sender=model)
+            post_delete.connect(signals.invalidate_permission_matrix, sender=model)
+        m2m_changed.connect(signals.invalidate_user_groups, sender=get_user_model().groups.through)
@@ -1,4 +1,7 @@
 import re
+import threading
+import time
+
 from restfw_composed_permissions.base import BasePermissionComponent, BaseComposedPermision
 from restfw_composed_permissions.generic.components import AllowAll
 from django.conf import settings
@@ -7,6 +10,85 @@ from pdc.apps.auth.models import Resource, GroupResourcePermission
 from pdc.apps.utils.utils import read_permission_for_all
 
 
+class PermissionMatrix(object):
+    """
+    In-memory copy of resources, permissions granted to groups and groups
+    of users. It is loaded on first use and dropped whenever any of these
+    change in this process (see `pdc.apps.auth.signals`). Changes done by
+    other processes are picked up after `PERMISSION_CACHE_TIMEOUT` seconds;
+    with timeout 0 nothing is cached.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._loaded_on = None
+            self._resources = {}
+            self._grants = frozenset()
+            self._user_groups = {}
+
+    def clear_user(self, user_id):
+        with self._lock:
+            self._user_groups.pop(user_id, None)
+
+    @staticmethod
+    def _compile(name):
+        try:
+            return re.compile(name)
+        except re.error:
+            return None
+
+    def _ensure_loaded(self):
+        timeout = getattr(settings, 'PERMISSION_CACHE_TIMEOUT', 60)
+        loaded_on = self._loaded_on
+        if loaded_on is not None and time.time() - loaded_on < timeout:
+            return
+        resources = {}
+        for pk, name, view in Resource.objects.values_list('id', 'name', 'view'):
+            resources.setdefault(view, []).append((pk, name, self._compile(name)))
+        grants = frozenset(GroupResourcePermission.objects.values_list(
+            'group_id', 'resource_permission__resource_id', 'resource_permission__permission__name'))
+        with self._lock:
+            self._resources = resources
+            self._grants = grants
+            self._user_groups = {}
+            self._loaded_on = time.time()
+
+    def get_resource(self, view, api_name):
+        """
+        Return id of resource controlling access to `api_name` served by
+        `view`, or `None` if the access is not controlled.
+        """
+        self._ensure_loaded()
+        resources = self._resources.get(view, [])
+        if len(resources) == 1:
+            return resources[0][0]
+        # multiple api map to one view
+        resources = [resource for resource in resources if resource[1] == api_name]
+        if len(resources) == 1:
+            return resources[0][0]
+        # maybe resouce name is regexp
+        if len(api_name.split('/')) > 1:
+            for pk, _, pattern in resources:
+                if pattern and pattern.match(api_name):
+                    return pk
+        return None
+
+    def has_permission(self, user, resource_id, permission):
+        self._ensure_loaded()
+        group_ids = self._user_groups.get(user.pk)
+        if group_ids is None:
+            group_ids = frozenset(user.groups.values_list('id', flat=True))
+            with self._lock:
+                self._user_groups[user.pk] = group_ids
+        return any((group_id, resource_id, permission) in self._grants for group_id in group_ids)
+
+
+permission_matrix = PermissionMatrix()
+
+
 class APIPermissionComponent(BasePermissionComponent):
     """
     Allow only anonymous requests.
@@ -23,40 +105,11 @@ class APIPermissionComponent(BasePermissionComponent):
         return self._has_permission(internal_permission, request.user, str(view.__class__), api_name)
 
     def _has_permission(self, internal_permission, user, view, api_name):
-        resources = Resource.objects.filter(view=view).all()
-        resource = None
-
-        if len(resources) == 1:
-            resource = resources[0]
-        elif len(resources) > 1:
-            # multiple api map to one view
-            resources = [obj for obj in Resource.objects.filter(view=view, name=api_name).all()]
-            if len(resources) == 1:
-                resource = resources[0]
-            else:
-                # maybe resouce name is regexp
-                resource = self._try_regexp_resource_match(api_name, resources)
-        if not resource:
+        resource_id = permission_matrix.get_resource(view, api_name)
+        if resource_id is None:
             # not restrict access to resource that is not in permission control
-            result = True
-        else:
-            group_id_list = [group.id for group in user.groups.all()]
-            result = GroupResourcePermission.objects.filter(
-                group__id__in=group_id_list, resource_permission__resource=resource,
-                resource_permission__permission__name=internal_permission).exists()
-
-        return result
-
-    @staticmethod
-    def _try_regexp_resource_match(api_name, resources):
-        result = None
-        api_str_list = api_name.split('/')
-        if len(api_str_list) > 1 and resources:
-            for resource_obj in resources:
-                if re.match(resource_obj.name, api_name):
-                    result = resource_obj
-                    break
-        return result
+            return True
+        return permission_matrix.has_permission(user, resource_id, internal_permission)
 
     @staticmethod
     def _convert_permission(in_method):
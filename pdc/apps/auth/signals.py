@@ -44,3 +44,35 @@ def update_resources(sender, **kwargs):
                 action_permission = action_to_obj_dict[action_name]
                 ResourcePermission.objects.get_or_create(resource=resource_obj,
                                                          permission=action_permission)
+
+
+def invalidate_permission_matrix(sender, **kwargs):
+    """Drop cached permissions when resources or granted permissions change."""
+    from django.db import transaction
+    from pdc.apps.auth.permissions import permission_matrix
+
+    permission_matrix.clear()
+    # Requests served before the change is committed could load old data.
+    transaction.on_commit(permission_matrix.clear)
+
+
+def invalidate_user_groups(sender, instance, action, reverse, pk_set, **kwargs):
+    """Drop cached groups of users whose membership changed."""
+    from django.db import transaction
+    from pdc.apps.auth.permissions import permission_matrix
+
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        user_ids = [instance.pk]
+    elif pk_set is not None:
+        user_ids = list(pk_set)
+    else:
+        invalidate_permission_matrix(sender)
+        return
+
+    def clear():
+        for user_id in user_ids:
+            permission_matrix.clear_user(user_id)
+    clear()
+    transaction.on_commit(clear)
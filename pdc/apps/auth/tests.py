@@ -16,6 +16,7 @@ from rest_framework.authtoken.models import Token
 from rest_framework.test import APITestCase
 
 from . import backends, signals
+from .permissions import permission_matrix
 from .models import Resource, ResourcePermission, GroupResourcePermission, ActionPermission
 from pdc.apps.common.test_utils import TestCaseWithChangeSetMixin
 
@@ -341,6 +342,51 @@ class CurrentUserTestCase(APITestCase):
         self.assertEqual(len(response.data['resource_permissions']), 3)
 
 
+class PermissionMatrixTestCase(TestCase):
+    view = "<class 'pdc.apps.component.views.ReleaseComponentViewSet'>"
+
+    def setUp(self):
+        permission_matrix.clear()
+        self.user = get_user_model().objects.create(username='test', email='test@test.com')
+        self.group = Group.objects.create(name='testers')
+        self.group.user_set.add(self.user)
+        self.resource = Resource.objects.create(name='release-components', view=self.view)
+        self.grant = GroupResourcePermission.objects.create(
+            group=self.group,
+            resource_permission=ResourcePermission.objects.create(
+                resource=self.resource, permission=ActionPermission.objects.get(name='update')))
+
+    def test_check_is_cached(self):
+        self.assertEqual(permission_matrix.get_resource(self.view, 'release-components'), self.resource.pk)
+        self.assertTrue(permission_matrix.has_permission(self.user, self.resource.pk, 'update'))
+        with self.assertNumQueries(0):
+            self.assertEqual(permission_matrix.get_resource(self.view, 'release-components'),
+                             self.resource.pk)
+            self.assertTrue(permission_matrix.has_permission(self.user, self.resource.pk, 'update'))
+            self.assertFalse(permission_matrix.has_permission(self.user, self.resource.pk, 'delete'))
+
+    def test_resource_without_control(self):
+        self.assertIsNone(permission_matrix.get_resource('<class \'Unknown\'>', 'unknown'))
+
+    def test_removed_grant_is_noticed(self):
+        self.assertTrue(permission_matrix.has_permission(self.user, self.resource.pk, 'update'))
+        self.grant.delete()
+        self.assertFalse(permission_matrix.has_permission(self.user, self.resource.pk, 'update'))
+
+    def test_group_membership_change_is_noticed(self):
+        self.assertTrue(permission_matrix.has_permission(self.user, self.resource.pk, 'update'))
+        self.group.user_set.remove(self.user)
+        self.assertFalse(permission_matrix.has_permission(self.user, self.resource.pk, 'update'))
+        self.user.groups.add(self.group)
+        self.assertTrue(permission_matrix.has_permission(self.user, self.resource.pk, 'update'))
+
+    @override_settings(PERMISSION_CACHE_TIMEOUT=0)
+    def test_cache_can_be_disabled(self):
+        permission_matrix.get_resource(self.view, 'release-components')
+        with self.assertNumQueries(2):
+            permission_matrix.get_resource(self.view, 'release-components')
+
+
 @override_settings(ALLOW_ALL_USER_READ=False)
 @override_settings(DISABLE_RESOURCE_PERMISSION_CHECK=False)
 class GroupResourcePermissionsTestCase(APITestCase):
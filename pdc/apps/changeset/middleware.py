@@ -7,6 +7,7 @@ import sys
 import logging
 
 from django.db import transaction
+from pdc.apps.messaging.middleware import store_messages
 from . import models
 
 # trap wrong HTTP methods
@@ -32,7 +33,7 @@ class ChangesetMiddleware(MiddlewareMixin):
     def _may_announce_big_change(self, changeset, request):
         if (not hasattr(settings, 'CHANGESET_SIZE_ANNOUNCE') or
                 not isinstance(settings.CHANGESET_SIZE_ANNOUNCE, int) or
-                len(changeset.tmp_changes) < settings.CHANGESET_SIZE_ANNOUNCE):
+                changeset.change_count < settings.CHANGESET_SIZE_ANNOUNCE):
             return
 
         author = str(changeset.author)
@@ -48,7 +49,7 @@ class ChangesetMiddleware(MiddlewareMixin):
             'author_email': changeset.author.email if changeset.author else '',
             'end_point': end_point,
             'url': request.build_absolute_uri(reverse('changeset/detail', kwargs={'id': changeset.id})),
-            'change_number': len(changeset.tmp_changes),
+            'change_number': changeset.change_count,
             'domain': request.build_absolute_uri('/')[:-1]
         }
         print params_dict
@@ -100,6 +101,7 @@ class ChangesetMiddleware(MiddlewareMixin):
                         transaction.set_rollback(True)
                     else:
                         request.changeset.commit()
+                        store_messages(request)
                         self._may_announce_big_change(request.changeset, request)
             except Exception:
                 # NOTE: catch all errors that were raised by view.
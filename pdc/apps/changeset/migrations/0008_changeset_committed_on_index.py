@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('changeset', '0007_auto_20160714_1244'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='changeset',
+            name='committed_on',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_last_modified(apps, schema_editor):
+    Change = apps.get_model('changeset', 'Change')
+    Changeset = apps.get_model('changeset', 'Changeset')
+    LastModified = apps.get_model('changeset', 'LastModified')
+    latest = dict(Change.objects.order_by().values_list('target_class')
+                  .annotate(models.Max('changeset')))
+    committed_on = dict(Changeset.objects.filter(pk__in=latest.values())
+                        .values_list('pk', 'committed_on'))
+    LastModified.objects.bulk_create([
+        LastModified(target_class=target_class, changeset_id=changeset_id,
+                     last_modified=committed_on[changeset_id])
+        for target_class, changeset_id in latest.iteritems()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('changeset', '0008_changeset_committed_on_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LastModified',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_class', models.CharField(max_length=200, unique=True)),
+                ('last_modified', models.DateTimeField()),
+                ('changeset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='changeset.Changeset')),
+            ],
+        ),
+        migrations.RunPython(fill_last_modified, migrations.RunPython.noop),
+    ]
@@ -3,8 +3,13 @@
 # Licensed under The MIT License (MIT)
 # http://opensource.org/licenses/MIT
 #
-from django.db import models
+import itertools
+import json
+import tempfile
+
+from django.db import IntegrityError, models, transaction
 from django.conf import settings
+from django.utils.encoding import force_text
 
 
 class Changeset(models.Model):
@@ -13,14 +18,21 @@ class Changeset(models.Model):
     not stored immediately. The actual saving is postponed until the `commit`
     method is called. That is done in the middleware, therefore there is no
     need to actually commit from any other method.
+
+    If `CHANGESET_SPOOL_THRESHOLD` is set, pending changes are moved from
+    memory to a temporary file once their values take more than that many
+    characters. Nothing is written to the database before commit either way.
     """
     author = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.CASCADE)
     requested_on = models.DateTimeField()
-    committed_on = models.DateTimeField(auto_now_add=True)
+    committed_on = models.DateTimeField(auto_now_add=True, db_index=True)
     comment = models.TextField(null=True, blank=True)
 
     def __init__(self, *args, **kwargs):
         self.tmp_changes = []
+        self._tmp_size = 0
+        self._spool = None
+        self._spooled_count = 0
         super(Changeset, self).__init__(*args, **kwargs)
 
     def __unicode__(self):
@@ -39,23 +51,73 @@ class Changeset(models.Model):
                                            target_id=target_id,
                                            old_value=old_value,
                                            new_value=new_value))
+            threshold = getattr(settings, 'CHANGESET_SPOOL_THRESHOLD', None)
+            if threshold:
+                self._tmp_size += len(old_value) + len(new_value)
+                if self._tmp_size >= threshold:
+                    self._spool_changes()
+
+    def _spool_changes(self):
+        if self._spool is None:
+            self._spool = tempfile.TemporaryFile()
+        for change in self.tmp_changes:
+            self._spool.write(json.dumps([change.target_class, change.target_id,
+                                          force_text(change.old_value), force_text(change.new_value)]))
+            self._spool.write('\n')
+        self._spooled_count += len(self.tmp_changes)
+        self.tmp_changes = []
+        self._tmp_size = 0
+
+    def _iter_changes(self):
+        """Yield all pending changes in the order they were added."""
+        if self._spool is not None:
+            self._spool.seek(0)
+            for line in self._spool:
+                target_class, target_id, old_value, new_value = json.loads(line)
+                yield Change(target_class=target_class, target_id=target_id,
+                             old_value=old_value, new_value=new_value)
+        for change in self.tmp_changes:
+            yield change
+
+    @property
+    def change_count(self):
+        """Number of changes that are not committed yet."""
+        return self._spooled_count + len(self.tmp_changes)
 
     def reset(self):
         """
         Remove all changes from this changeset.
         """
         self.tmp_changes = []
+        self._tmp_size = 0
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+        self._spooled_count = 0
 
     def commit(self):
         """
         Commit changeset into database. If there are no changes associated with
-        this changeset, nothing will be savd.
+        this changeset, nothing will be savd. Otherwise `LastModified` of all
+        changed models is updated as well.
+
+        Changes are inserted in batches of `CHANGESET_COMMIT_BATCH_SIZE`. Ids
+        of the inserted changes are not set on the objects.
         """
-        if self.tmp_changes:
+        if self.change_count:
             self.save()
-            for change in self.tmp_changes:
-                change.changeset = self
-                change.save()
+            batch_size = settings.CHANGESET_COMMIT_BATCH_SIZE
+            changes = self._iter_changes()
+            target_classes = set()
+            while True:
+                batch = list(itertools.islice(changes, batch_size))
+                if not batch:
+                    break
+                for change in batch:
+                    change.changeset = self
+                    target_classes.add(change.target_class)
+                Change.objects.bulk_create(batch, batch_size=batch_size)
+            LastModified.touch(target_classes, self)
 
     @property
     def duration(self):
@@ -83,3 +145,46 @@ class Change(models.Model):
     def is_update(self):
         """Check if a change is an update."""
         return self.old_value != 'null' and self.new_value != 'null'
+
+
+class LastModified(models.Model):
+    """
+    Latest committed changeset for each `target_class` of changes. This is
+    much cheaper to look up than the newest `Change` of a model.
+    """
+    target_class = models.CharField(max_length=200, unique=True)
+    changeset = models.ForeignKey(Changeset, on_delete=models.CASCADE)
+    last_modified = models.DateTimeField()
+
+    def __unicode__(self):
+        return u"%s: %s" % (self.target_class, self.last_modified)
+
+    @classmethod
+    def touch(cls, target_classes, changeset):
+        """Mark models with given target classes as changed by `changeset`."""
+        updated = cls.objects.filter(target_class__in=target_classes).update(
+            changeset=changeset, last_modified=changeset.committed_on)
+        if updated == len(target_classes):
+            return
+        existing = set(cls.objects.filter(target_class__in=target_classes)
+                       .values_list('target_class', flat=True))
+        missing = set(target_classes) - existing
+        try:
+            with transaction.atomic():
+                cls.objects.bulk_create([cls(target_class=target_class, changeset=changeset,
+                                             last_modified=changeset.committed_on)
+                                         for target_class in missing])
+        except IntegrityError:
+            # Another changeset of the same model was committed meanwhile.
+            for target_class in missing:
+                cls.objects.update_or_create(target_class=target_class,
+                                             defaults={'changeset': changeset,
+                                                       'last_modified': changeset.committed_on})
+
+    @classmethod
+    def latest(cls, target_classes):
+        """
+        Return the most recent `LastModified` of given target classes, or
+        `None` if none of them was ever changed.
+        """
+        return cls.objects.filter(target_class__in=target_classes).order_by('-changeset').first()
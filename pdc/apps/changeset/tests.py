@@ -5,13 +5,16 @@
 #
 from mock import Mock, call, patch
 
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
 from rest_framework import status
 from rest_framework.test import APITestCase
 
 from .middleware import ChangesetMiddleware
+from .models import Change, Changeset, LastModified
 from .middleware import logger as changeset_logger
 
 
@@ -49,6 +52,79 @@ class ChangesetMiddlewareTestCase(TestCase):
             self.assertTrue(changeset_logger.error.called)
 
 
+class ChangesetCommitTestCase(TestCase):
+    def _commit(self, count):
+        changeset = Changeset(author=get_user_model().objects.create(username='user%d' % count),
+                              requested_on=timezone.now())
+        for i in range(count):
+            changeset.add('Test', i, 'null', '{"id": %d}' % i)
+        changeset.commit()
+        return changeset
+
+    def test_commit_without_changes_does_not_save(self):
+        with self.assertNumQueries(1):
+            changeset = self._commit(0)
+        self.assertIsNone(changeset.pk)
+        self.assertEqual(Changeset.objects.count(), 0)
+
+    @override_settings(CHANGESET_COMMIT_BATCH_SIZE=50)
+    def test_commit_inserts_changes_in_batches(self):
+        # Add the model to LastModified first, so that it is only updated.
+        changeset = Changeset(requested_on=timezone.now())
+        changeset.add('Test', 0, 'null', '{}')
+        changeset.commit()
+        # Creating user, saving changeset, one insert per batch and update
+        # of LastModified
+        for count, queries in [(1, 4), (50, 4), (51, 5), (150, 6)]:
+            with self.assertNumQueries(queries):
+                changeset = self._commit(count)
+            self.assertEqual(Change.objects.filter(changeset=changeset).count(), count)
+
+    def test_committed_changes_keep_order_and_values(self):
+        changeset = self._commit(3)
+        changes = Change.objects.filter(changeset=changeset).order_by('id')
+        self.assertEqual([(c.target_class, c.target_id, c.old_value, c.new_value) for c in changes],
+                         [('test', i, 'null', '{"id": %d}' % i) for i in range(3)])
+
+    @override_settings(CHANGESET_SPOOL_THRESHOLD=100, CHANGESET_COMMIT_BATCH_SIZE=7)
+    def test_spooled_changes_are_committed_in_order(self):
+        changeset = Changeset(requested_on=timezone.now())
+        for i in range(30):
+            changeset.add('Test', i, 'null', u'{"name": "\u017eluva %d"}' % i)
+        self.assertIsNotNone(changeset._spool)
+        self.assertLess(len(changeset.tmp_changes), 30)
+        self.assertEqual(changeset.change_count, 30)
+        changeset.commit()
+        changes = Change.objects.filter(changeset=changeset).order_by('id')
+        self.assertEqual([(c.target_id, c.new_value) for c in changes],
+                         [(i, u'{"name": "\u017eluva %d"}' % i) for i in range(30)])
+
+    def test_commit_updates_last_modified(self):
+        first = Changeset(requested_on=timezone.now())
+        first.add('Foo', 1, 'null', '{}')
+        first.add('Bar', 1, 'null', '{}')
+        first.commit()
+        second = Changeset(requested_on=timezone.now())
+        second.add('Bar', 2, 'null', '{}')
+        second.commit()
+        self.assertEqual(dict(LastModified.objects.values_list('target_class', 'changeset')),
+                         {'foo': first.pk, 'bar': second.pk})
+        self.assertEqual(LastModified.latest(['foo']).last_modified, first.committed_on)
+        self.assertEqual(LastModified.latest(['foo', 'bar']).changeset, second)
+        self.assertIsNone(LastModified.latest(['baz']))
+
+    @override_settings(CHANGESET_SPOOL_THRESHOLD=10)
+    def test_reset_drops_spooled_changes(self):
+        changeset = Changeset(requested_on=timezone.now())
+        for i in range(5):
+            changeset.add('Test', i, 'null', '{"id": %d}' % i)
+        changeset.reset()
+        self.assertEqual(changeset.change_count, 0)
+        changeset.commit()
+        self.assertIsNone(changeset.pk)
+        self.assertEqual(Change.objects.count(), 0)
+
+
 class ChangesetRESTTestCase(APITestCase):
     fixtures = ['pdc/apps/changeset/fixtures/tests/changeset.json',
                 "pdc/apps/component/fixtures/tests/bugzilla_component.json"]
@@ -69,6 +145,19 @@ class ChangesetRESTTestCase(APITestCase):
         results = response.data.get('results')
         self.assertTrue(results[0].get('committed_on') > results[1].get('committed_on'))
 
+    def test_list_with_cursor(self):
+        url = reverse('changeset-list')
+        committed_on = []
+        params = {'cursor': '', 'page_size': 1}
+        while url:
+            response = self.client.get(url, params, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(response.data['results']), 1)
+            committed_on.append(response.data['results'][0]['committed_on'])
+            url, params = response.data['next'], {}
+        self.assertEqual(len(committed_on), 3)
+        self.assertEqual(committed_on, sorted(committed_on, reverse=True))
+
     def test_query(self):
         url = reverse('changeset-list')
         response = self.client.get(url + '?resource=contact', format='json')
@@ -11,7 +11,7 @@ from rest_framework import viewsets, status
 from rest_framework.response import Response
 
 from pdc.apps.auth.permissions import APIPermission
-from pdc.apps.common.viewsets import StrictQueryParamMixin
+from pdc.apps.common.viewsets import StrictQueryParamMixin, StreamingListModelMixin
 from . import models
 from .filters import ChangesetFilterSet
 from .serializers import ChangesetSerializer
@@ -32,6 +32,7 @@ class ChangesetDetailView(DetailView):
 
 
 class ChangesetViewSet(StrictQueryParamMixin,
+                       StreamingListModelMixin,
                        viewsets.ReadOnlyModelViewSet):
     """
     PDC tracks every modification that was made through any of the API
@@ -187,5 +188,6 @@ class ChangesetViewSet(StrictQueryParamMixin,
 
     serializer_class = ChangesetSerializer
     queryset = models.Changeset.objects.all().order_by('-committed_on')
+    cursor_ordering = '-committed_on'
     filter_class = ChangesetFilterSet
     permission_classes = (APIPermission,)
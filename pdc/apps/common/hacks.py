@@ -5,6 +5,7 @@
 # http://opensource.org/licenses/MIT
 #
 import re
+from contextlib import contextmanager
 
 from django.db import connection
 from django.conf import settings
@@ -45,6 +46,54 @@ def add_returning(sql):
     return sql + add_returning._returning
 
 
+@contextmanager
+def temporary_table(cursor, name, columns):
+    """
+    Create a temporary table for the duration of the block. The `columns`
+    argument should be a list of column definitions. The table is dropped
+    when the block finishes successfully. If it does not, the table is
+    removed at the latest when the same name is used again.
+    """
+    cursor.execute("DROP TABLE IF EXISTS %s" % name)
+    cursor.execute("CREATE TEMPORARY TABLE %s (%s)" % (name, ", ".join(columns)))
+    yield name
+    cursor.execute("DROP TABLE %s" % name)
+
+
+def chunks(items, size):
+    """Split a list into lists of at most `size` items."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+# Keep number of parameters in one statement below the default SQLite limit.
+MAX_QUERY_PARAMS = 999
+
+
+def insert_rows(cursor, table, columns, rows):
+    """
+    Insert rows into a table using multi-row INSERT statements. Each row
+    should be a sequence of values in the same order as `columns`.
+    """
+    rows = list(rows)
+    placeholder = "(%s)" % ", ".join(["%s"] * len(columns))
+    for chunk in chunks(rows, max(1, MAX_QUERY_PARAMS // len(columns))):
+        cursor.execute("INSERT INTO %s (%s) VALUES %s" % (table, ", ".join(columns),
+                                                          ", ".join([placeholder] * len(chunk))),
+                       [value for row in chunk for value in row])
+
+
+def add_ignore_conflicts(sql):
+    """
+    Make INSERT statement skip rows violating a unique constraint if the
+    backend supports it. Other backends rely on the statement itself not
+    producing duplicates.
+    """
+    if connection.vendor == 'postgresql':
+        return sql + " ON CONFLICT DO NOTHING"
+    return sql
+
+
 def bool_from_native(value):
     """Convert value to bool."""
     if value in ('false', 'f', 'False', '0'):
@@ -114,3 +163,44 @@ def parse_epoch_version(version):
     if re.match(r'^\d+:', version):
         version = re.sub(r'^(\d+):', r'\1!', version)
     return parse_version(version)
+
+
+def _encode_version_part(value):
+    # Each part starts with a type marker so that parts of different types
+    # compare the same way as in Python. Only digits and lowercase letters
+    # are used, which sort the same in any database collation.
+    if isinstance(value, tuple):
+        return '5' + ''.join(_encode_version_part(x) for x in value) + '0'
+    if isinstance(value, basestring):
+        return '4' + value.encode('utf-8').encode('hex') + '00'
+    if isinstance(value, (int, long)):
+        digits = str(abs(value))
+        if value < 0:
+            return '2%02d%s' % (99 - len(digits), ''.join(str(9 - int(d)) for d in digits))
+        return '3%02d%s' % (len(digits), digits)
+    if repr(value) == '-Infinity':
+        return '1'
+    if repr(value) == 'Infinity':
+        return '9'
+    raise ValueError('Can not encode version part %r' % (value, ))
+
+
+def version_sort_key(version):
+    """
+    Return a string whose ordering matches ordering of
+    `parse_epoch_version(version)`, so that versions can be compared in
+    database. Returns `None` for empty version.
+    """
+    if not version:
+        return None
+    return _encode_version_part(parse_epoch_version(version)._key)
+
+
+def evr_sort_key(epoch, version, release):
+    """
+    Return a string whose ordering matches ordering of RPMs by epoch,
+    version and release as done by `RPM.sort_key`.
+    """
+    return _encode_version_part((int(epoch or 0),
+                                 parse_epoch_version(version)._key,
+                                 parse_epoch_version(release)._key))
@@ -0,0 +1,183 @@
+#
+# Copyright (c) 2018 Red Hat
+# Licensed under The MIT License (MIT)
+# http://opensource.org/licenses/MIT
+#
+"""
+Caching of ids of lookup table rows.
+
+Imports resolve the same paths, signing keys, content categories etc. over
+and over. Models with such tables declare an `IdCache` as their `CACHE`
+attribute and resolve values with `pdc.apps.common.models.get_cached_id`.
+
+By default each process keeps at most `ID_CACHE_SIZE` least recently used
+entries per table. If `ID_CACHE_BACKEND` names one of configured `CACHES`,
+entries are stored there instead, so that all processes share them.
+
+Ids resolved inside a transaction are only visible to the thread running it
+until it is committed; then they are stored as above. Entries of a
+transaction (or savepoint) that is rolled back are dropped.
+
+Cached entries are dropped when the row is changed or deleted.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import signals
+
+
+class IdCache(object):
+    """
+    Bounded mapping from values of a unique `field` of a model to ids of
+    rows. Numbers of successful and failed lookups are counted in `hits` and
+    `misses`.
+    """
+    def __init__(self, field):
+        self.field = field
+        self.model = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def contribute_to_class(self, cls, name):
+        self.model = cls
+        setattr(cls, name, self)
+        signals.pre_save.connect(self._remember_old_value, sender=cls, weak=False)
+        signals.post_save.connect(self._invalidate_saved, sender=cls, weak=False)
+        signals.post_delete.connect(self._invalidate_deleted, sender=cls, weak=False)
+
+    def _backend(self):
+        alias = getattr(settings, 'ID_CACHE_BACKEND', None)
+        return caches[alias] if alias else None
+
+    def _key(self, value):
+        return 'id-cache:%s:%s' % (self.model._meta.label_lower,
+                                   hashlib.md5(unicode(value).encode('utf-8')).hexdigest())
+
+    def _max_size(self):
+        return getattr(settings, 'ID_CACHE_SIZE', 10000)
+
+    def _pending(self):
+        """
+        Return entries set by this thread in transactions that are not
+        committed yet, as a list of `(savepoint_ids, on_commit_callback,
+        entries)`. Groups whose callback was discarded by a rollback are
+        dropped first.
+        """
+        hooks = transaction.get_connection().run_on_commit
+        # Rollbacks replace the list of hooks, registering only appends to it.
+        if getattr(self._local, 'hooks', None) is not hooks:
+            registered = set(func for sids, func in hooks)
+            self._local.pending = [group for group in getattr(self._local, 'pending', [])
+                                   if group[1] in registered]
+            self._local.hooks = hooks
+        return self._local.pending
+
+    def get(self, value):
+        """Return cached id for `value` or `None`."""
+        result = None
+        if transaction.get_connection().in_atomic_block:
+            for sids, callback, entries in self._pending():
+                result = entries.get(value, result)
+        backend = self._backend()
+        if result is None and backend:
+            result = backend.get(self._key(value))
+        with self._lock:
+            if result is None and not backend:
+                result = self._entries.pop(value, None)
+                if result is not None:
+                    self._entries[value] = result
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return result
+
+    def set(self, value, id):
+        """
+        Cache `id` of `value`. Inside a transaction, the entry is kept aside
+        until the transaction is committed.
+        """
+        connection = transaction.get_connection()
+        if not connection.in_atomic_block:
+            self._store(value, id)
+            return
+        sids = set(connection.savepoint_ids)
+        pending = self._pending()
+        if pending and pending[-1][0] == sids:
+            entries = pending[-1][2]
+        else:
+            entries = OrderedDict()
+
+            def publish():
+                for committed_value, committed_id in entries.iteritems():
+                    self._store(committed_value, committed_id)
+
+            transaction.on_commit(publish)
+            pending.append((sids, publish, entries))
+        entries.pop(value, None)
+        entries[value] = id
+        while len(entries) > self._max_size():
+            entries.popitem(last=False)
+
+    def _store(self, value, id):
+        backend = self._backend()
+        if backend:
+            backend.set(self._key(value), id)
+            return
+        max_size = self._max_size()
+        with self._lock:
+            self._entries.pop(value, None)
+            self._entries[value] = id
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, value):
+        for sids, callback, entries in getattr(self._local, 'pending', []):
+            entries.pop(value, None)
+        backend = self._backend()
+        if backend:
+            backend.delete(self._key(value))
+        with self._lock:
+            self._entries.pop(value, None)
+
+    def clear(self):
+        """
+        Drop all entries kept by this process and uncommitted entries of
+        this thread, and reset counters. Entries in shared backend are not
+        affected.
+        """
+        self._local.pending = []
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        pending = self._pending() if transaction.get_connection().in_atomic_block else []
+        return len(self._entries) + sum(len(entries) for sids, callback, entries in pending)
+
+    def stats(self):
+        return {'size': len(self), 'hits': self.hits, 'misses': self.misses}
+
+    def _remember_old_value(self, sender, instance, raw=False, **kwargs):
+        if instance.pk is not None and not raw:
+            instance._id_cache_old_value = (sender.objects.filter(pk=instance.pk)
+                                            .values_list(self.field, flat=True).first())
+
+    def _invalidate_saved(self, sender, instance, created=False, **kwargs):
+        old_value = getattr(instance, '_id_cache_old_value', None)
+        if old_value is not None:
+            self.delete(old_value)
+            del instance._id_cache_old_value
+        if not created:
+            self.delete(getattr(instance, self.field))
+
+    def _invalidate_deleted(self, sender, instance, **kwargs):
+        self.delete(getattr(instance, self.field))
@@ -8,20 +8,21 @@
 
 from django.db import models
 
+from pdc.apps.common.idcache import IdCache
 from pdc.apps.common.validators import validate_sigkey
 
 
 def get_cached_id(cls, cache_field, value, create=False):
-    """cached `value` to database `id`"""
+    """cached `value` to database `id`, see `pdc.apps.common.idcache`"""
     if not value:
         return None
-    result = cls.CACHE.get(value, None)
+    result = cls.CACHE.get(value)
     if result is None:
         if create:
             obj, _ = cls.objects.get_or_create(**{cache_field: value})
         else:
             obj = cls.objects.get(**{cache_field: value})
-        cls.CACHE[value] = obj.id
+        cls.CACHE.set(value, obj.id)
         result = obj.id
     return result
 
@@ -48,7 +49,7 @@ class SigKey(models.Model):
     def __unicode__(self):
         return u"%s" % self.key_id
 
-    CACHE = {}
+    CACHE = IdCache("key_id")
 
     @classmethod
     def get_cached_id(cls, value, create=False):
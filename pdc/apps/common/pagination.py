@@ -10,7 +10,45 @@ from django.conf import settings
 from rest_framework import pagination
 
 
+class KeysetCursorPagination(pagination.CursorPagination):
+    """
+    Pagination using opaque cursors pointing after the last returned item.
+    Unlike page numbers, getting a page costs the same no matter how deep it
+    is, and items do not shift between pages when data is added.
+
+    Items are ordered by `cursor_ordering` attribute of the view, which
+    should be an indexed column. It defaults to `id`. Ordering requested by
+    the client is not used.
+    """
+    page_size = getattr(settings, 'REST_API_PAGE_SIZE', 20)
+    page_size_query_param = getattr(settings,
+                                    'REST_API_PAGE_SIZE_QUERY_PARAM',
+                                    'page_size')
+    max_page_size = getattr(settings,
+                            'REST_API_MAX_PAGE_SIZE',
+                            100)
+    ordering = 'id'
+
+    def get_page_size(self, request):
+        # Pagination can not be turned off with cursors.
+        try:
+            return pagination._positive_int(request.query_params[self.page_size_query_param],
+                                            strict=True,
+                                            cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'cursor_ordering', self.ordering)
+        return (ordering, ) if isinstance(ordering, basestring) else tuple(ordering)
+
+
 class AutoDetectedPageNumberPagination(pagination.PageNumberPagination):
+    """
+    Page number pagination, unless the `cursor` query parameter is present
+    (possibly empty to get the first page). In that case pagination is
+    handled by `KeysetCursorPagination`.
+    """
     template = os.path.join(os.path.dirname(__file__), 'templates/browsable_api/numbers.html')
     page_size = getattr(settings, 'REST_API_PAGE_SIZE', 20)
     page_size_query_param = getattr(settings,
@@ -19,6 +57,29 @@ class AutoDetectedPageNumberPagination(pagination.PageNumberPagination):
     max_page_size = getattr(settings,
                             'REST_API_MAX_PAGE_SIZE',
                             100)
+    cursor_query_param = 'cursor'
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param in request.query_params:
+            self.cursor_paginator = KeysetCursorPagination()
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        return super(AutoDetectedPageNumberPagination, self).paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super(AutoDetectedPageNumberPagination, self).get_paginated_response(data)
+
+    def to_html(self):
+        if self.cursor_paginator:
+            return self.cursor_paginator.to_html()
+        return super(AutoDetectedPageNumberPagination, self).to_html()
+
+    def pagination_disabled(self, request):
+        """Check if the client asked for all results without pagination."""
+        return (self.cursor_query_param not in request.query_params and
+                self.get_page_size(request) is None)
 
     def get_page_size(self, request):
         if self.page_size_query_param:
@@ -15,7 +15,7 @@ from django.utils.encoding import smart_text
 from contrib import drf_introspection
 
 from django.urls import NoReverseMatch
-from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
 from rest_framework.utils import formatting
 from rest_framework.reverse import reverse
 
@@ -196,6 +196,25 @@ DEFAULT_DESCRIPTION = {
 }
 
 
+class NDJSONRenderer(JSONRenderer):
+    """
+    Render lists as newline delimited JSON: each item on a separate line.
+    Other data is rendered as a single line.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return bytes()
+        if not isinstance(data, list):
+            data = [data]
+        return b''.join(self.render_item(item) for item in data)
+
+    def render_item(self, item):
+        return super(NDJSONRenderer, self).render(item) + b'\n'
+
+
 def cached_by_argument_class(method):
     """
     Decorator which caches result of method call by class of the first
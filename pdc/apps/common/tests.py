@@ -7,7 +7,9 @@ import mock
 import json
 from io import BytesIO
 
-from django.test import TestCase
+from django.core.cache import caches
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.core.exceptions import FieldError, ValidationError
 from django.utils.datastructures import MultiValueDict
 from django.urls import reverse
@@ -19,7 +21,7 @@ from rest_framework import serializers
 from rest_framework.viewsets import GenericViewSet
 
 from contrib.drf_introspection.serializers import DynamicFieldsSerializerMixin
-from .models import Label, SigKey
+from .models import Label, SigKey, get_cached_id
 from pdc.apps.common import validators
 from .test_utils import TestCaseWithChangeSetMixin
 from . import views, viewsets
@@ -224,6 +226,60 @@ class LabelRESTTestCase(TestCaseWithChangeSetMixin, APITestCase):
         self.assertNumChanges([2])
         self.assertEqual(Label.objects.count(), 0)
 
+    def test_bulk_create(self):
+        data = [{'name': 'label%d' % i, 'description': 'desc'} for i in range(3, 8)]
+        response = self.client.post(reverse('label-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([label['name'] for label in response.data], [d['name'] for d in data])
+        self.assertEqual(Label.objects.count(), 7)
+        self.assertNumChanges([5])
+
+    def test_bulk_create_reports_first_invalid_item(self):
+        data = [self.args_label3, {'name': 'label4'}, {'description': 'desc'}]
+        response = self.client.post(reverse('label-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'detail': {'description': ['This field is required.']},
+                                         'id_of_invalid_data': 1,
+                                         'invalid_data': {'name': 'label4'}})
+        self.assertEqual(Label.objects.count(), 2)
+        self.assertNumChanges([])
+
+    def test_bulk_create_duplicate_in_request(self):
+        response = self.client.post(reverse('label-list'), [self.args_label3, self.args_label3],
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data.get('id_of_invalid_data'), 1)
+        self.assertEqual(Label.objects.count(), 2)
+        self.assertNumChanges([])
+
+    def test_bulk_update(self):
+        data = {'1': {'name': 'new1', 'description': 'desc 1'},
+                '2': {'name': 'new2', 'description': 'desc 2'}}
+        response = self.client.put(reverse('label-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['1']['name'], 'new1')
+        self.assertEqual(response.data['2']['description'], 'desc 2')
+        self.assertEqual(sorted(Label.objects.values_list('name', flat=True)), ['new1', 'new2'])
+        self.assertNumChanges([2])
+
+    def test_bulk_update_missing_object(self):
+        data = {'1': {'description': 'desc 1'},
+                '9999': {'description': 'desc 2'}}
+        response = self.client.patch(reverse('label-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data, {'detail': 'Not found.',
+                                         'id_of_invalid_data': '9999',
+                                         'invalid_data': {'description': 'desc 2'}})
+        self.assertEqual(Label.objects.get(pk=1).description, self.args_label1['description'])
+        self.assertNumChanges([])
+
+    def test_bulk_delete_missing_object(self):
+        response = self.client.delete(reverse('label-list'), [1, 9999], format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data.get('id_of_invalid_data'), 9999)
+        self.assertEqual(Label.objects.count(), 2)
+        self.assertNumChanges([])
+
     def test_query_labels_with_none_existing_name(self):
         url = reverse('label-list') + '?name=other'
         response = self.client.get(url, format='json')
@@ -474,6 +530,97 @@ class SigKeyRESTTestCase(TestCaseWithChangeSetMixin, APITestCase):
         self.assertNumChanges([1])
 
 
+class IdCacheTestCase(TestCase):
+    def setUp(self):
+        SigKey.CACHE.clear()
+        self.addCleanup(SigKey.CACHE.clear)
+
+    def test_counts_hits_and_misses(self):
+        key = SigKey.objects.create(key_id='1234abcd')
+        self.assertEqual(SigKey.get_cached_id('1234abcd'), key.pk)
+        self.assertEqual(SigKey.get_cached_id('1234abcd'), key.pk)
+        self.assertEqual(SigKey.CACHE.stats(), {'size': 1, 'hits': 1, 'misses': 1})
+
+    @override_settings(ID_CACHE_SIZE=2)
+    def test_evicts_least_recently_used(self):
+        for key_id in ('aaaaaaaa', 'bbbbbbbb', 'cccccccc'):
+            SigKey.get_cached_id(key_id, create=True)
+        self.assertEqual(len(SigKey.CACHE), 2)
+        self.assertIsNone(SigKey.CACHE.get('aaaaaaaa'))
+        self.assertIsNotNone(SigKey.CACHE.get('cccccccc'))
+
+    def test_rename_invalidates_entry(self):
+        key = SigKey.objects.create(key_id='1234abcd')
+        SigKey.get_cached_id('1234abcd')
+        key.key_id = 'abcd1234'
+        key.save()
+        self.assertIsNone(SigKey.CACHE.get('1234abcd'))
+        with self.assertRaises(SigKey.DoesNotExist):
+            SigKey.get_cached_id('1234abcd')
+
+    def test_delete_invalidates_entry(self):
+        key = SigKey.objects.create(key_id='1234abcd')
+        SigKey.get_cached_id('1234abcd')
+        key.delete()
+        self.assertNotEqual(SigKey.get_cached_id('1234abcd', create=True), key.pk)
+
+    @override_settings(ID_CACHE_BACKEND='default')
+    def test_shared_backend(self):
+        key = SigKey.objects.create(key_id='1234abcd')
+        self.assertEqual(get_cached_id(SigKey, 'key_id', '1234abcd'), key.pk)
+        # Test transaction is never committed.
+        self.assertIsNone(caches['default'].get(SigKey.CACHE._key('1234abcd')))
+        with self.assertNumQueries(0):
+            self.assertEqual(SigKey.get_cached_id('1234abcd'), key.pk)
+        key.delete()
+        self.assertIsNone(SigKey.CACHE.get('1234abcd'))
+
+    def test_savepoint_rollback_drops_entries(self):
+        key = SigKey.objects.create(key_id='1234abcd')
+        SigKey.get_cached_id('1234abcd')
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                SigKey.get_cached_id('abcd1234', create=True)
+                self.assertEqual(len(SigKey.CACHE), 2)
+                raise ValueError
+        self.assertEqual(len(SigKey.CACHE), 1)
+        self.assertIsNone(SigKey.CACHE.get('abcd1234'))
+        self.assertEqual(SigKey.CACHE.get('1234abcd'), key.pk)
+
+
+class IdCacheTransactionTestCase(TransactionTestCase):
+    def setUp(self):
+        SigKey.CACHE.clear()
+        self.addCleanup(SigKey.CACHE.clear)
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+
+    @override_settings(ID_CACHE_BACKEND='default')
+    def test_shared_backend_is_set_on_commit(self):
+        key = SigKey.CACHE._key('1234abcd')
+        with transaction.atomic():
+            pk = SigKey.get_cached_id('1234abcd', create=True)
+            self.assertIsNone(caches['default'].get(key))
+            self.assertEqual(SigKey.CACHE.get('1234abcd'), pk)
+        self.assertEqual(caches['default'].get(key), pk)
+
+    @override_settings(ID_CACHE_BACKEND='default')
+    def test_rollback_drops_entries(self):
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                SigKey.get_cached_id('1234abcd', create=True)
+                raise ValueError
+        self.assertIsNone(caches['default'].get(SigKey.CACHE._key('1234abcd')))
+        self.assertIsNone(SigKey.CACHE.get('1234abcd'))
+        self.assertFalse(SigKey.objects.exists())
+
+    def test_local_entries_are_set_on_commit(self):
+        with transaction.atomic():
+            pk = SigKey.get_cached_id('1234abcd', create=True)
+        self.assertEqual(len(SigKey.CACHE), 1)
+        self.assertEqual(SigKey.CACHE.get('1234abcd'), pk)
+
+
 class CachedByArgumentClassTestCase(TestCase):
     @cached_by_argument_class
     def cached(self, arg, call_id):
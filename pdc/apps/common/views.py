@@ -27,7 +27,8 @@ from . import handlers
 django_version = LooseVersion(get_version())
 
 
-class LabelViewSet(pdc_viewsets.PDCModelViewSet):
+class LabelViewSet(pdc_viewsets.ChangeSetBulkMixin,
+                   pdc_viewsets.PDCModelViewSet):
     """
     ##Overview##
 
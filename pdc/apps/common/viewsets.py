@@ -4,27 +4,36 @@
 # http://opensource.org/licenses/MIT
 #
 import datetime
+import hashlib
+import itertools
 import re
 import json
+from collections import OrderedDict
 
 from django.shortcuts import get_object_or_404
 from django.core.exceptions import FieldError
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
 from django.conf import settings
+from django.core.cache import caches
 from django.views.decorators.http import condition
 from django.core import serializers
 from django.db import models
+from django.db.models import prefetch_related_objects
 
 from contrib import drf_introspection
+from contrib.bulk_operations.bulk_operations import SetBulkOperationsMixin
 
 from rest_framework import mixins, status, viewsets
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
+from rest_framework.utils.encoders import JSONEncoder
 
 from pdc.apps.auth.permissions import APIPermission
 from pdc.apps.utils.utils import generate_warning_header_dict, get_model_name_from_obj_or_cls
-from pdc.apps.changeset.models import Change
+from pdc.apps.changeset.models import LastModified
 from pdc.apps.utils.SortedRouter import router
+from pdc.apps.common.renderers import NDJSONRenderer
 
 
 class JSONModelEncoder(json.JSONEncoder):
@@ -214,11 +223,61 @@ class ChangeSetDestroyModelMixin(mixins.DestroyModelMixin):
                                    'null')
 
 
+class StreamingListModelMixin(mixins.ListModelMixin):
+    """
+    When pagination is turned off (`page_size=-1`) and the response is
+    requested as JSON or NDJSON (`Accept: application/x-ndjson`), it is
+    streamed. Objects are loaded and serialized in chunks of
+    `STREAMING_LIST_CHUNK_SIZE`, so that memory use does not depend on the
+    number of results.
+    """
+    def list(self, request, *args, **kwargs):
+        paginator = self.paginator
+        if (not hasattr(paginator, 'pagination_disabled') or
+                not paginator.pagination_disabled(request) or
+                request.accepted_renderer.format not in ('json', 'ndjson')):
+            return super(StreamingListModelMixin, self).list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        chunks = self._serialize_chunks(queryset)
+        # Get the first chunk now, so that errors in query are reported as
+        # usual and not in the middle of response.
+        first_chunk = next(chunks, [])
+        items = itertools.chain.from_iterable(itertools.chain([first_chunk], chunks))
+        if request.accepted_renderer.format == 'ndjson':
+            renderer = NDJSONRenderer()
+            return StreamingHttpResponse((renderer.render_item(item) for item in items),
+                                         content_type=renderer.media_type)
+        return StreamingHttpResponse(self._stream_json_array(items),
+                                     content_type=JSONRenderer.media_type)
+
+    def _serialize_chunks(self, queryset):
+        objects = queryset.iterator()
+        prefetch_lookups = queryset._prefetch_related_lookups
+        while True:
+            chunk = list(itertools.islice(objects, settings.STREAMING_LIST_CHUNK_SIZE))
+            if not chunk:
+                return
+            if prefetch_lookups:
+                prefetch_related_objects(chunk, *prefetch_lookups)
+            yield self.get_serializer(chunk, many=True).data
+
+    @staticmethod
+    def _stream_json_array(items):
+        renderer = JSONRenderer()
+        yield b'['
+        for i, item in enumerate(items):
+            if i:
+                yield b','
+            yield renderer.render(item)
+        yield b']'
+
+
 class ChangeSetModelMixin(ChangeSetCreateModelMixin,
                           ChangeSetUpdateModelMixin,
                           ChangeSetDestroyModelMixin,
                           mixins.RetrieveModelMixin,
-                          mixins.ListModelMixin):
+                          StreamingListModelMixin):
     """
     Model viewset that provides default `list()`, `retrieve()`,
     with logging the changes in `create`, `update()`, `partial_update()`
@@ -227,30 +286,105 @@ class ChangeSetModelMixin(ChangeSetCreateModelMixin,
     pass
 
 
-class ConditionalProcessingMixin(object):
-    @staticmethod
-    def latest_change(request, *args, **kwargs):
+def get_last_modified(request):
+    """
+    Return `LastModified` of the models that the view of `request` depends on,
+    or `None` if none of them was changed yet. These are the view's
+    `related_model_classes`, or the serializer model if not specified.
+    Besides model classes, the list can contain names of other kinds of
+    changes (e.g. 'notice').
+    """
+    # Views can need this multiple times, look it up only once.
+    if not hasattr(request, '_last_modified'):
         view_class = request.resolver_match.func.cls
         if hasattr(view_class, 'related_model_classes'):
-            related_model_list = [get_model_name_from_obj_or_cls(model_cls)
+            related_model_list = [model_cls if isinstance(model_cls, basestring)
+                                  else get_model_name_from_obj_or_cls(model_cls)
                                   for model_cls in view_class.related_model_classes]
         else:
             # use serializer' model class
             related_model_list = [get_model_name_from_obj_or_cls(view_class.serializer_class.Meta.model)]
+        request._last_modified = LastModified.latest(related_model_list)
+    return request._last_modified
 
-        result = datetime.datetime(1970, 1, 2)
-        if Change.objects.filter(target_class__in=related_model_list).exists():
-            result = Change.objects.filter(
-                target_class__in=related_model_list).order_by('-id')[0].changeset.committed_on
-        return result
+
+class ConditionalProcessingMixin(object):
+    """
+    Add `Last-Modified` header to responses and answer conditional requests.
+    The time of last modification is time of the most recent changeset
+    touching serializer model or any of `related_model_classes`.
+
+    Viewsets with `related_model_classes` also get a strong `ETag`, since
+    the list should cover all models that the response depends on.
+    """
+    @staticmethod
+    def latest_change(request, *args, **kwargs):
+        last_modified = get_last_modified(request)
+        if last_modified:
+            return last_modified.last_modified
+        return datetime.datetime(1970, 1, 2)
+
+    @staticmethod
+    def etag(request, *args, **kwargs):
+        last_modified = get_last_modified(request)
+        key = '%s:%s:%s:%s' % (last_modified.changeset_id if last_modified else 0,
+                               request.get_full_path(),
+                               request.META.get('HTTP_ACCEPT', ''),
+                               request.user.pk)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
 
     def dispatch(self, request, *args, **kwargs):
-        @condition(etag_func=None, last_modified_func=self.latest_change)
+        etag_func = self.etag if hasattr(self, 'related_model_classes') else None
+
+        @condition(etag_func=etag_func, last_modified_func=self.latest_change)
         def _dispatch(request, *args, **kwargs):
             return super(ConditionalProcessingMixin, self).dispatch(request, *args, **kwargs)
         return _dispatch(request, *args, **kwargs)
 
 
+class CachedListMixin(object):
+    """
+    Keep list responses in cache `API_RESPONSE_CACHE` for up to
+    `API_RESPONSE_CACHE_TIMEOUT` seconds. Responses are cached separately for
+    each path, query string and kind of user (anonymous, authenticated,
+    superuser).
+
+    The cache key also contains id of the latest changeset touching any of
+    the `related_model_classes` (or the serializer model), so a committed
+    change is visible immediately. The viewset should therefore list all
+    models whose data are included in the response.
+    """
+    def _response_cache_key(self, request):
+        last_modified = get_last_modified(request._request)
+        key = [request.get_host(),
+               request.path,
+               sorted(request.query_params.lists()),
+               bool(request.user.is_authenticated),
+               bool(request.user.is_superuser),
+               last_modified.changeset_id if last_modified else 0]
+        return 'api-response:%s' % hashlib.sha1(json.dumps(key)).hexdigest()
+
+    def list(self, request, *args, **kwargs):
+        alias = getattr(settings, 'API_RESPONSE_CACHE', None)
+        if not alias:
+            return super(CachedListMixin, self).list(request, *args, **kwargs)
+
+        cache = caches[alias]
+        key = self._response_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            cached = json.loads(cached, object_pairs_hook=OrderedDict)
+            return Response(cached['data'], headers=cached['headers'])
+
+        response = super(CachedListMixin, self).list(request, *args, **kwargs)
+        if isinstance(response, Response) and response.status_code == status.HTTP_200_OK:
+            headers = dict((header, value) for header, value in response.items()
+                           if header.lower() != 'content-type')
+            cached = {'data': response.data, 'headers': headers}
+            cache.set(key, json.dumps(cached, cls=JSONEncoder), settings.API_RESPONSE_CACHE_TIMEOUT)
+        return response
+
+
 class StrictQueryParamMixin(object):
     """
     This mixin will make a viewset strict in what query string parameters it
@@ -318,6 +452,52 @@ class PermissionMixin(object):
     permission_classes = (APIPermission,)
 
 
+class ChangeSetBulkMixin(SetBulkOperationsMixin):
+    """
+    Set based bulk operations (see `SetBulkOperationsMixin`) for viewsets
+    based on `PDCModelViewSet`. Changes are recorded and messages are sent as
+    if each object was processed by the single object view.
+    """
+    def perform_bulk_create(self, serializer):
+        super(ChangeSetBulkMixin, self).perform_bulk_create(serializer)
+        model_name = get_model_name_from_obj_or_cls(serializer.child.Meta.model)
+        for obj in serializer.instance:
+            self.request.changeset.add(model_name, obj.id, 'null', _dumps_json(obj.export()))
+        if isinstance(self, NotificationMixin):
+            for obj, data in zip(serializer.instance, serializer.data):
+                self._send_message('added', {'new_value': data}, obj=obj)
+
+    def perform_bulk_update(self, serializers):
+        old_values = [(serializer.instance.id, _dumps_json(serializer.instance.export()))
+                      for serializer in serializers]
+        if isinstance(self, NotificationMixin):
+            initial_statuses = self.get_serializer([serializer.instance for serializer in serializers],
+                                                   many=True).data
+        super(ChangeSetBulkMixin, self).perform_bulk_update(serializers)
+        for (obj_id, old_value), serializer in zip(old_values, serializers):
+            model_name = get_model_name_from_obj_or_cls(serializer.instance)
+            self.request.changeset.add(model_name, obj_id, old_value,
+                                       _dumps_json(serializer.instance.export()))
+        if isinstance(self, NotificationMixin):
+            for initial_status, serializer in zip(initial_statuses, serializers):
+                if initial_status != serializer.data:
+                    self._send_message('changed',
+                                       {'old_value': initial_status, 'new_value': serializer.data},
+                                       obj=serializer.instance)
+
+    def perform_bulk_destroy(self, objs):
+        old_values = [(get_model_name_from_obj_or_cls(obj), obj.id, _dumps_json(obj.export()))
+                      for obj in objs]
+        if isinstance(self, NotificationMixin):
+            initial_statuses = self.get_serializer(objs, many=True).data
+        super(ChangeSetBulkMixin, self).perform_bulk_destroy(objs)
+        for model_name, obj_id, old_value in old_values:
+            self.request.changeset.add(model_name, obj_id, old_value, 'null')
+        if isinstance(self, NotificationMixin):
+            for initial_status in initial_statuses:
+                self._send_message('removed', {'old_value': initial_status})
+
+
 class PDCModelViewSet(StrictQueryParamMixin,
                       NotificationMixin,
                       ChangeSetModelMixin,
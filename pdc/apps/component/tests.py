@@ -6,6 +6,8 @@
 import mock
 import unittest
 
+from django.core.cache import cache
+from django.test import override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
@@ -237,6 +239,85 @@ class GlobalComponentRESTTestCase(TestCaseWithChangeSetMixin, APITestCase):
         self.assertEqual(response.data['results'][0]['name'], 'java')
 
 
+@override_settings(API_RESPONSE_CACHE='default')
+class GlobalComponentCachedListTestCase(TestCaseWithChangeSetMixin, APITestCase):
+    fixtures = [
+        "pdc/apps/component/fixtures/tests/global_component.json",
+        "pdc/apps/component/fixtures/tests/upstream.json"
+    ]
+
+    def setUp(self):
+        super(GlobalComponentCachedListTestCase, self).setUp()
+        cache.clear()
+
+    def test_list_is_served_from_cache(self):
+        url = reverse('globalcomponent-list')
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.data['count'], 3)
+        # Changes not done via API are not visible.
+        models.GlobalComponent.objects.filter(name='python').update(name='python3')
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('python', [d['name'] for d in response.data['results']])
+        # Different query is cached separately.
+        response = self.client.get(url, {'name': 'python3'}, format='json')
+        self.assertEqual(response.data['count'], 1)
+
+    def test_change_via_api_invalidates_cache(self):
+        url = reverse('globalcomponent-list')
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.data['count'], 3)
+        response = self.client.post(url, {'name': 'new'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.data['count'], 4)
+
+    def test_change_of_related_model_invalidates_cache(self):
+        url = reverse('globalcomponent-list')
+        models.Label.objects.create(name='label1', description='desc')
+        self.client.get(url, format='json')
+        response = self.client.post(reverse('globalcomponentlabel-list', kwargs={'instance_pk': 1}),
+                                    {'name': 'label1', 'description': 'desc'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.data['results'][0]['labels'][0]['name'], 'label1')
+
+
+@override_settings(API_RESPONSE_CACHE='default')
+class ReleaseComponentCachedListTestCase(TestCaseWithChangeSetMixin, APITestCase):
+    fixtures = [
+        "pdc/apps/release/fixtures/tests/release.json",
+        "pdc/apps/release/fixtures/tests/product.json",
+        "pdc/apps/component/fixtures/tests/upstream.json",
+        "pdc/apps/component/fixtures/tests/global_component.json",
+        "pdc/apps/component/fixtures/tests/release_component.json",
+        "pdc/apps/bindings/fixtures/tests/releasedistgitmapping.json"
+    ]
+
+    def setUp(self):
+        super(ReleaseComponentCachedListTestCase, self).setUp()
+        cache.clear()
+
+    def test_change_of_srpm_name_invalidates_cache(self):
+        url = reverse('releasecomponent-list')
+        response = self.client.get(url, format='json')
+        self.assertIsNone(response.data['results'][0]['srpm'])
+        response = self.client.patch(reverse('releasecomponent-detail', kwargs={'pk': 1}),
+                                     {'srpm': {'name': 'srpm'}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.data['results'][0]['srpm'], {'name': 'srpm'})
+
+    def test_change_of_release_dist_git_branch_invalidates_cache(self):
+        url = reverse('releasecomponent-list')
+        self.client.get(url, format='json')
+        response = self.client.patch(reverse('release-detail', kwargs={'release_id': 'release-1.0'}),
+                                     {'dist_git': {'branch': 'new-branch'}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.data['results'][0]['dist_git_branch'], 'new-branch')
+
+
 class GlobalComponentLabelRESTTestCase(TestCaseWithChangeSetMixin, APITestCase):
     fixtures = [
         "pdc/apps/component/fixtures/tests/upstream.json",
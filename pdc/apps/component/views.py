@@ -24,6 +24,7 @@ from pdc.apps.common.serializers import LabelSerializer, StrictSerializerMixin
 from pdc.apps.utils.utils import generate_warning_header_dict
 from pdc.apps.common.filters import LabelFilter
 from pdc.apps.auth.permissions import APIPermission
+from pdc.apps.release.models import Release
 
 from .models import (GlobalComponent,
                      ReleaseComponent,
@@ -32,7 +33,8 @@ from .models import (GlobalComponent,
                      GroupType,
                      ReleaseComponentRelationship,
                      ReleaseComponentType,
-                     ReleaseComponentRelationshipType)
+                     ReleaseComponentRelationshipType,
+                     Upstream)
 from .serializers import (GlobalComponentSerializer,
                           ReleaseComponentSerializer,
                           BugzillaComponentSerializer,
@@ -51,11 +53,13 @@ from .filters import (ComponentFilter,
 from . import signals
 
 
-class GlobalComponentViewSet(viewsets.PDCModelViewSet):
+class GlobalComponentViewSet(viewsets.CachedListMixin,
+                             viewsets.PDCModelViewSet):
     model = GlobalComponent
     queryset = GlobalComponent.objects.all().order_by('id')
     serializer_class = GlobalComponentSerializer
     filter_class = ComponentFilter
+    related_model_classes = (GlobalComponent, Label, Upstream)
 
     doc_create = """
         __Example__:
@@ -261,7 +265,8 @@ class ReleaseComponentTypeViewSet(viewsets.StrictQueryParamMixin,
     """
 
 
-class ReleaseComponentViewSet(viewsets.PDCModelViewSet):
+class ReleaseComponentViewSet(viewsets.CachedListMixin,
+                              viewsets.PDCModelViewSet):
     """
     ##Overview##
 
@@ -279,6 +284,11 @@ class ReleaseComponentViewSet(viewsets.PDCModelViewSet):
     queryset = model.objects.all().order_by('id')
     serializer_class = ReleaseComponentSerializer
     filter_class = ReleaseComponentFilter
+    # SRPM name and inherited dist-git branch come from bindings, which are
+    # logged as their own changes.
+    related_model_classes = (ReleaseComponent, GlobalComponent, BugzillaComponent,
+                             ReleaseComponentType, Release,
+                             'releasecomponentsrpmnamemapping', 'releasedistgitmapping')
     extra_query_params = ('include_inactive_release', )
     docstring_macros = PUT_OPTIONAL_PARAM_WARNING
 
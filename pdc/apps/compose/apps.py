@@ -10,5 +10,11 @@ class ComposeConfig(AppConfig):
     name = 'pdc.apps.compose'
 
     def ready(self):
+        from django.core.signals import request_started
         from pdc.apps.utils.utils import connect_app_models_pre_save_signal
+        from . import jobs
         connect_app_models_pre_save_signal(self)
+        # Workers of background imports are started with the first request
+        # served by the process, so that jobs queued before a restart are
+        # not left waiting.
+        request_started.connect(jobs.start_workers, dispatch_uid='compose-import-workers')
@@ -0,0 +1,320 @@
+#
+# Copyright (c) 2018 Red Hat
+# Licensed under The MIT License (MIT)
+# http://opensource.org/licenses/MIT
+#
+"""
+Background compose imports.
+
+`ComposeImportJob` table is the queue: a job stores the request data and
+workers pick queued jobs from the database. Workers are a small pool of
+threads in each web server process (started with the first request), or
+separate processes running `run_compose_import_jobs` management command.
+Jobs queued before a restart are therefore picked up once any worker runs,
+and running jobs of a worker that died on the same host are queued again.
+
+The import itself runs in a single transaction together with its changeset,
+the same way as synchronous import does. Progress of a running job is kept
+in cache `COMPOSE_IMPORT_PROGRESS_CACHE`, which needs to be shared by all
+processes to be visible from any of them.
+"""
+import errno
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import urlparse
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.http import QueryDict
+from django.utils import timezone
+from rest_framework import exceptions
+
+from pdc.apps.changeset.middleware import ChangesetMiddleware
+from pdc.apps.changeset.models import Changeset
+from pdc.apps.messaging.middleware import send_messages, store_messages
+from . import lib, models
+
+logger = logging.getLogger(__name__)
+
+# Used to skip over values; objects are dropped as soon as they are read.
+_SKIPPING_DECODER = json.JSONDecoder(object_pairs_hook=lambda pairs: None)
+_WHITESPACE = re.compile(r'\s*')
+
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+
+
+class JobRequest(object):
+    """
+    Stand-in for the original request while the job is running. It provides
+    the parts of request used by import functions, changeset and messaging.
+    """
+    def __init__(self, user, data, meta, path, base_uri):
+        self.user = user
+        self.data = data
+        self.META = meta
+        self.path = path
+        self.base_uri = base_uri
+        self.query_params = QueryDict('')
+        self.changeset = None
+        self._messagings = []
+        # Import functions access messages via DRF request wrapper.
+        self._request = self
+
+    def build_absolute_uri(self, location):
+        return urlparse.urljoin(self.base_uri, location)
+
+
+def _worker_id():
+    return '%s:%d' % (socket.gethostname(), os.getpid())
+
+
+def _progress_cache():
+    return caches[getattr(settings, 'COMPOSE_IMPORT_PROGRESS_CACHE', 'default')]
+
+
+def _progress_key(job_id):
+    return 'compose-import-job-%s' % job_id
+
+
+def get_progress(job_id):
+    """Return progress counters of a job, or empty dict if unknown."""
+    return _progress_cache().get(_progress_key(job_id)) or {}
+
+
+class JobProgress(object):
+    """Callable collecting import progress of one job into cache."""
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.data = {}
+
+    def __call__(self, **kwargs):
+        self.data.update(kwargs)
+        _progress_cache().set(_progress_key(self.job_id), self.data, None)
+
+
+def _format_error(exc):
+    if isinstance(exc, exceptions.APIException):
+        return json.dumps(exc.detail)
+    return str(exc) or exc.__class__.__name__
+
+
+def dump_request_data(request):
+    """Return data of import `request` as JSON to be stored with the job."""
+    if request.content_type.startswith('application/json'):
+        return request.body.decode(request.encoding or settings.DEFAULT_CHARSET)
+    return json.dumps(request.data)
+
+
+def read_top_level(payload, names):
+    """
+    Return keys of JSON object in `payload` and a dict with values of keys in
+    `names`. Other values are only read through, so a big RPM manifest is not
+    built in the web request; the whole payload is parsed by the worker.
+    """
+    decoder = json.JSONDecoder()
+    keys, values = [], {}
+    try:
+        idx = _WHITESPACE.match(payload, 0).end()
+        if payload[idx:idx + 1] != '{':
+            raise ValueError('Expecting object')
+        idx = _WHITESPACE.match(payload, idx + 1).end()
+        if payload[idx:idx + 1] == '}':
+            return keys, values
+        while True:
+            key, idx = decoder.raw_decode(payload, idx)
+            idx = _WHITESPACE.match(payload, idx).end()
+            if not isinstance(key, basestring) or payload[idx:idx + 1] != ':':
+                raise ValueError('Expecting key at %d' % idx)
+            idx = _WHITESPACE.match(payload, idx + 1).end()
+            keys.append(key)
+            if key in names:
+                values[key], idx = decoder.raw_decode(payload, idx)
+            else:
+                idx = _SKIPPING_DECODER.raw_decode(payload, idx)[1]
+            idx = _WHITESPACE.match(payload, idx).end()
+            delimiter = payload[idx:idx + 1]
+            idx = _WHITESPACE.match(payload, idx + 1).end()
+            if delimiter == '}':
+                return keys, values
+            if delimiter != ',':
+                raise ValueError("Expecting ',' delimiter at %d" % idx)
+    except ValueError as exc:
+        raise exceptions.ParseError('JSON parse error - %s' % exc)
+
+
+def load_payload(payload):
+    """
+    Parse data stored with a job. With `COMPOSE_IMPORT_STREAMING` enabled,
+    the RPM manifest is not loaded into memory as a whole.
+    """
+    if getattr(settings, 'COMPOSE_IMPORT_STREAMING', False):
+        from . import streaming
+        return streaming.parse_import_request(BytesIO(payload.encode('utf-8')))
+    try:
+        return json.loads(payload)
+    except ValueError as exc:
+        raise exceptions.ParseError('JSON parse error - %s' % exc)
+
+
+def _job_request(job, data):
+    return JobRequest(job.author or AnonymousUser(), data, {'HTTP_PDC_CHANGE_COMMENT': job.comment},
+                      job.path, job.base_uri)
+
+
+def run(job_id):
+    """
+    Run a full import for job with given id. The job should already be
+    claimed by this worker.
+    """
+    job = models.ComposeImportJob.objects.select_related('author').get(pk=job_id)
+    try:
+        with transaction.atomic():
+            data = load_payload(job.payload)
+            request = _job_request(job, data)
+            request.changeset = Changeset(author=job.author, comment=job.comment)
+            request.changeset.requested_on = job.created_on
+            result = lib.compose__full_import(request,
+                                              data['release_id'],
+                                              data['composeinfo'],
+                                              data['rpm_manifest'],
+                                              data['image_manifest'],
+                                              data['location'],
+                                              data['url'],
+                                              data['scheme'],
+                                              progress=JobProgress(job_id))
+            request.changeset.commit()
+            store_messages(request)
+    except Exception as exc:
+        logger.exception('Compose import job %s failed', job_id)
+        job.status = models.ComposeImportJob.FAILED
+        job.error = _format_error(exc)
+        job.payload = ''
+        job.finished_on = timezone.now()
+        job.save()
+        return
+    finally:
+        _progress_cache().delete(_progress_key(job_id))
+
+    job.compose_id, job.imported_rpms, job.imported_images, job.set_locations = result
+    job.changeset = request.changeset if request.changeset.pk else None
+    job.status = models.ComposeImportJob.FINISHED
+    job.payload = ''
+    job.finished_on = timezone.now()
+    job.save()
+
+    ChangesetMiddleware()._may_announce_big_change(request.changeset, request)
+    send_messages(request, request._messagings)
+
+
+def claim():
+    """
+    Mark the oldest queued job as running by this worker and return its id,
+    or `None` if there is no queued job.
+    """
+    with transaction.atomic():
+        queued = models.ComposeImportJob.objects.filter(status=models.ComposeImportJob.QUEUED)
+        if connection.features.has_select_for_update_skip_locked:
+            queued = queued.select_for_update(skip_locked=True)
+        else:
+            queued = queued.select_for_update()
+        job_id = queued.order_by('id').values_list('pk', flat=True).first()
+        if job_id is None:
+            return None
+        models.ComposeImportJob.objects.filter(pk=job_id).update(status=models.ComposeImportJob.RUNNING,
+                                                                 started_on=timezone.now(),
+                                                                 worker=_worker_id())
+    return job_id
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as exc:
+        return exc.errno == errno.EPERM
+    return True
+
+
+def recover():
+    """
+    Queue again jobs left running by workers that no longer exist on this
+    host. Their import transaction was never committed.
+    """
+    host = socket.gethostname()
+    running = (models.ComposeImportJob.objects
+               .filter(status=models.ComposeImportJob.RUNNING, worker__startswith=host + ':')
+               .values_list('pk', 'worker'))
+    dead = [pk for pk, worker in running
+            if worker.rsplit(':', 1)[1].isdigit() and not _is_alive(int(worker.rsplit(':', 1)[1]))]
+    if dead:
+        logger.warning('Queueing interrupted compose import jobs again: %s', dead)
+        (models.ComposeImportJob.objects
+         .filter(pk__in=dead, status=models.ComposeImportJob.RUNNING)
+         .update(status=models.ComposeImportJob.QUEUED, started_on=None, worker=''))
+    return dead
+
+
+def run_pending():
+    """Run queued jobs until there are none. Returns number of run jobs."""
+    count = 0
+    while True:
+        job_id = claim()
+        if job_id is None:
+            return count
+        try:
+            run(job_id)
+        except Exception:
+            logger.exception('Compose import job %s could not be processed', job_id)
+        count += 1
+
+
+def _worker():
+    while True:
+        _wakeup.clear()
+        try:
+            run_pending()
+        except Exception:
+            logger.exception('Failed to process compose import jobs')
+        finally:
+            connection.close()
+        _wakeup.wait(settings.COMPOSE_IMPORT_POLL_INTERVAL)
+
+
+def start_workers(**kwargs):
+    """
+    Start worker threads of this process, unless they are already running.
+    Jobs interrupted by a previous process are queued again first.
+    """
+    with _workers_lock:
+        if len(_workers) >= settings.COMPOSE_IMPORT_WORKERS:
+            return
+        if not _workers:
+            try:
+                recover()
+            except Exception:
+                logger.exception('Failed to recover interrupted compose import jobs')
+        while len(_workers) < settings.COMPOSE_IMPORT_WORKERS:
+            worker = threading.Thread(target=_worker, name='compose-import-%d' % len(_workers))
+            worker.daemon = True
+            worker.start()
+            _workers.append(worker)
+
+
+def submit(job):
+    """
+    Let workers know about a new job once the current transaction is
+    committed.
+    """
+    def notify():
+        start_workers()
+        _wakeup.set()
+
+    transaction.on_commit(notify)
@@ -5,6 +5,7 @@
 # http://opensource.org/licenses/MIT
 #
 
+import itertools
 import os
 import json
 
@@ -14,6 +15,7 @@ from productmd.rpms import Rpms
 from django.db import transaction, connection
 from django.db.models import Q
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 
 from pdc.apps.package.models import RPM
 from pdc.apps.common import hacks as common_hacks
@@ -23,7 +25,7 @@ from pdc.apps.repository import models as repository_models
 from pdc.apps.release import models as release_models
 from pdc.apps.release import lib
 from pdc.apps.compose import models
-from pdc.apps.compose.serializers import ComposeTreeSerializer
+from pdc.apps.compose.serializers import ComposeTreeLocationSerializer
 from pdc.apps.release.models import Release
 from pdc.apps.component.models import ReleaseComponent
 from pdc.apps.repository.models import ContentCategory
@@ -39,26 +41,47 @@ def _maybe_raise_inconsistency_error(composeinfo, manifest, name):
             {'detail': ['Inconsistent data: different compose id in composeinfo and {0} file.'.format(name)]})
 
 
-def get_or_insert_rpm(rpms_in_db, cursor, rpm_nevra, srpm_nevra, filename):
-    rpm_id = rpms_in_db.get(rpm_nevra, None)
-    if not rpm_id:
-        rpm_id = package_models.RPM.bulk_insert(cursor, rpm_nevra, filename, srpm_nevra)
-        rpms_in_db[rpm_nevra] = rpm_id
-    return rpm_id
+# Number of manifest entries written to database at once.
+RPM_IMPORT_BATCH_SIZE = 10000
 
 
-def insert_compose_rpms_if_nonexist(compose_rpms_in_db, cursor,
-                                    variant_arch_id, rpm_id,
-                                    content_category_id, sigkey_id, path_id):
-    key = "%s/%s" % (variant_arch_id, rpm_id)
-    if key not in compose_rpms_in_db:
-        models.ComposeRPM.bulk_insert(cursor,
-                                      variant_arch_id,
-                                      rpm_id,
-                                      content_category_id,
-                                      sigkey_id,
-                                      path_id)
-        compose_rpms_in_db.add(key)
+def _iter_rpms(rm):
+    """
+    Iterate over all RPMs in a manifest as `(variant_uid, arch, srpm_nevra,
+    rpm_nevra, rpm_data)` tuples.
+    """
+    if hasattr(rm, 'iter_rpms'):
+        for item in rm.iter_rpms():
+            yield item
+        return
+    for variant_uid, arches in rm.rpms.iteritems():
+        for arch, srpms in arches.iteritems():
+            for srpm_nevra, rpms in srpms.iteritems():
+                for rpm_nevra, rpm_data in rpms.iteritems():
+                    yield variant_uid, arch, srpm_nevra, rpm_nevra, rpm_data
+
+
+def _link_compose_rpms(cursor, compose_rpms):
+    """
+    Insert missing RPMs and link all of them to their variant arches. Each
+    item should be a tuple `(variant_arch_id, rpm_nevra, srpm_nevra,
+    filename, content_category_id, sigkey_id, path_id)`.
+    """
+    rpm_ids = package_models.RPM.bulk_get_or_insert(
+        cursor, ((rpm_nevra, filename, srpm_nevra)
+                 for _, rpm_nevra, srpm_nevra, filename, _, _, _ in compose_rpms))
+    models.ComposeRPM.bulk_link(
+        cursor, ((variant_arch_id, rpm_ids[rpm_nevra], content_category_id, sigkey_id, path_id)
+                 for variant_arch_id, rpm_nevra, _, _, content_category_id, sigkey_id, path_id in compose_rpms))
+
+
+def _report_progress(progress, **kwargs):
+    """
+    Pass information about import progress to `progress` callable if it was
+    given. Keyword arguments are counters and current position of import.
+    """
+    if progress:
+        progress(**kwargs)
 
 
 def _link_compose_to_integrated_product(request, compose, variant):
@@ -106,32 +129,134 @@ def _add_import_msg(request, compose_obj, attribute, count):
     request._request._messagings.append(('.' + attribute, msg))
 
 
-def _store_relative_path_for_compose(compose_obj, variants_info, variant, variant_obj, add_to_changelog):
-    vp = productmd.composeinfo.VariantPaths(variant)
-    common_hacks.deserialize_wrapper(vp.deserialize, variants_info.get(variant.name, {}).get('paths', {}))
-    for path_type in vp._fields:
-        path_type_obj, created = models.PathType.objects.get_or_create(name=path_type)
-        if created:
-            add_to_changelog.append(path_type_obj)
-        for arch in variant.arches:
-            field_value = getattr(vp, path_type)
-            if field_value and field_value.get(arch, None):
-                arch_obj = common_models.Arch.objects.get(name=arch)
-                crp_obj, created = models.ComposeRelPath.objects.get_or_create(arch=arch_obj, variant=variant_obj,
-                                                                               compose=compose_obj, type=path_type_obj,
-                                                                               path=field_value[arch])
-                if created:
-                    add_to_changelog.append(crp_obj)
+def _get_by_names(model, names):
+    """
+    Return a dict mapping names to existing objects of `model`. Unknown names
+    raise `DoesNotExist` just like `model.objects.get` would.
+    """
+    objs = dict((obj.name, obj) for obj in model.objects.filter(name__in=names))
+    for name in names:
+        if name not in objs:
+            model.objects.get(name=name)
+    return objs
+
+
+class ComposeVariantResolver(object):
+    """
+    Variants, variant arches and relative paths of a compose described by
+    composeinfo. All of them are loaded and missing ones created with a few
+    bulk queries instead of a lookup per variant, arch and path type.
+
+    Newly created objects that should be recorded in changeset are appended
+    to `add_to_changelog`.
+    """
+    def __init__(self, compose_obj, ci, variants_info, add_to_changelog):
+        self.compose = compose_obj
+        self.variants = list(ci.get_variants(recursive=True))
+        self.arches = _get_by_names(common_models.Arch,
+                                    set(arch for variant in self.variants for arch in variant.arches))
+        self._resolve_variants(add_to_changelog)
+        self._resolve_variant_arches()
+        self._resolve_relative_paths(variants_info, add_to_changelog)
+
+    def _resolve_variants(self, add_to_changelog):
+        variant_types = _get_by_names(release_models.VariantType,
+                                      set(variant.type for variant in self.variants))
+        existing = dict(((obj.variant_id, obj.variant_uid, obj.variant_name, obj.variant_type_id), obj)
+                        for obj in models.Variant.objects.filter(compose=self.compose))
+        missing = []
+        for variant in self.variants:
+            key = (variant.id, variant.uid, variant.name, variant_types[variant.type].pk)
+            if key not in existing:
+                missing.append(models.Variant(compose=self.compose,
+                                              variant_id=variant.id,
+                                              variant_uid=variant.uid,
+                                              variant_name=variant.name,
+                                              variant_type_id=key[3]))
+        if missing:
+            models.Variant.objects.bulk_create(missing)
+        self.variant_objs = dict((obj.variant_uid, obj)
+                                 for obj in models.Variant.objects.filter(compose=self.compose))
+        created_uids = set(obj.variant_uid for obj in missing)
+        add_to_changelog.extend(self.variant_objs[variant.uid] for variant in self.variants
+                                if variant.uid in created_uids)
+
+    def _resolve_variant_arches(self):
+        queryset = models.VariantArch.objects.filter(variant__compose=self.compose)
+        existing = set(queryset.values_list('variant_id', 'arch_id'))
+        untested_id = models.ComposeAcceptanceTestingState.get_untested()
+        missing = []
+        for variant in self.variants:
+            variant_obj = self.variant_objs[variant.uid]
+            for arch in variant.arches:
+                if (variant_obj.pk, self.arches[arch].pk) not in existing:
+                    missing.append(models.VariantArch(variant=variant_obj,
+                                                      arch=self.arches[arch],
+                                                      rtt_testing_status_id=untested_id))
+        if missing:
+            models.VariantArch.objects.bulk_create(missing)
+        self.variant_arch_objs = dict(((obj.variant_id, obj.arch_id), obj) for obj in queryset)
+
+    def _resolve_relative_paths(self, variants_info, add_to_changelog):
+        wanted = []
+        path_type_names = []
+        for variant in self.variants:
+            vp = productmd.composeinfo.VariantPaths(variant)
+            common_hacks.deserialize_wrapper(vp.deserialize, variants_info.get(variant.name, {}).get('paths', {}))
+            for path_type in vp._fields:
+                if path_type not in path_type_names:
+                    path_type_names.append(path_type)
+                field_value = getattr(vp, path_type)
+                for arch in variant.arches:
+                    if field_value and field_value.get(arch, None):
+                        wanted.append((self.variant_objs[variant.uid].pk, self.arches[arch].pk,
+                                       path_type, field_value[arch]))
+
+        path_types = dict((obj.name, obj) for obj in models.PathType.objects.filter(name__in=path_type_names))
+        missing_types = [models.PathType(name=name) for name in path_type_names if name not in path_types]
+        if missing_types:
+            models.PathType.objects.bulk_create(missing_types)
+            created = list(models.PathType.objects.filter(name__in=[obj.name for obj in missing_types]))
+            path_types.update((obj.name, obj) for obj in created)
+            add_to_changelog.extend(created)
+
+        queryset = models.ComposeRelPath.objects.filter(compose=self.compose)
+        existing_ids = []
+        existing = set()
+        for row in queryset.values_list('id', 'variant_id', 'arch_id', 'type_id', 'path'):
+            existing_ids.append(row[0])
+            existing.add(row[1:])
+        missing = []
+        for variant_id, arch_id, path_type, path in wanted:
+            key = (variant_id, arch_id, path_types[path_type].pk, path)
+            if key not in existing:
+                existing.add(key)
+                missing.append(models.ComposeRelPath(compose=self.compose, variant_id=variant_id,
+                                                     arch_id=arch_id, type_id=key[2], path=path))
+        if missing:
+            models.ComposeRelPath.objects.bulk_create(missing)
+            created = queryset.filter(id__gt=max(existing_ids or [0]))
+            add_to_changelog.extend(created.select_related('compose', 'variant', 'arch', 'type').order_by('id'))
+
+    def get_variant(self, variant_uid):
+        return self.variant_objs[variant_uid]
+
+    def get_variant_arch(self, variant_uid, arch):
+        return self.variant_arch_objs[(self.variant_objs[variant_uid].pk, self.arches[arch].pk)]
 
 
 @transaction.atomic(savepoint=False)
-def compose__import_rpms(request, release_id, composeinfo, rpm_manifest):
+def compose__import_rpms(request, release_id, composeinfo, rpm_manifest, progress=None):
     release_obj = release_models.Release.objects.get(release_id=release_id)
 
     ci = productmd.composeinfo.ComposeInfo()
     common_hacks.deserialize_wrapper(ci.deserialize, composeinfo)
-    rm = Rpms()
-    common_hacks.deserialize_wrapper(rm.deserialize, rpm_manifest)
+    if isinstance(rpm_manifest, Rpms):
+        # Already loaded, e.g. streamed from request body.
+        rm = rpm_manifest
+    else:
+        rm = Rpms()
+        common_hacks.deserialize_wrapper(rm.deserialize, rpm_manifest)
 
     _maybe_raise_inconsistency_error(ci, rm, 'rpms')
 
@@ -152,58 +277,40 @@ def compose__import_rpms(request, release_id, composeinfo, rpm_manifest):
         # add message
         _add_compose_create_msg(request, compose_obj)
 
-    rpms_in_db = {}
-    qs = package_models.RPM.objects.all()
-    for rpm in qs.iterator():
-        key = "%s-%s:%s-%s.%s" % (rpm.name, rpm.epoch, rpm.version, rpm.release, rpm.arch)
-        rpms_in_db[key] = rpm.id
-
     cursor = connection.cursor()
     add_to_changelog = []
     imported_rpms = 0
     variants_info = composeinfo['payload']['variants']
+    variant_arch_ids = {}
 
-    for variant in ci.get_variants(recursive=True):
+    resolver = ComposeVariantResolver(compose_obj, ci, variants_info, add_to_changelog)
+    for variant in resolver.variants:
+        _report_progress(progress, current_variant=variant.uid)
         _link_compose_to_integrated_product(request, compose_obj, variant)
-        variant_type = release_models.VariantType.objects.get(name=variant.type)
-        variant_obj, created = models.Variant.objects.get_or_create(
-            compose=compose_obj,
-            variant_id=variant.id,
-            variant_uid=variant.uid,
-            variant_name=variant.name,
-            variant_type=variant_type
-        )
-        if created:
-            add_to_changelog.append(variant_obj)
-
-        _store_relative_path_for_compose(compose_obj, variants_info, variant, variant_obj, add_to_changelog)
-
         for arch in variant.arches:
-            arch_obj = common_models.Arch.objects.get(name=arch)
-            var_arch_obj, _ = models.VariantArch.objects.get_or_create(arch=arch_obj,
-                                                                       variant=variant_obj)
-
-            compose_rpms_in_db = set()
-            qs = models.ComposeRPM.objects.filter(variant_arch=var_arch_obj).values_list('variant_arch_id',
-                                                                                         'rpm_id')
-            for (variant_arch_id, rpm_id) in qs.iterator():
-                key = "%s/%s" % (variant_arch_id, rpm_id)
-                compose_rpms_in_db.add(key)
-
-            sources = set()
-            for srpm_nevra, rpms in rm.rpms.get(variant.uid, {}).get(arch, {}).iteritems():
-                sources.add(srpm_nevra)
-                for rpm_nevra, rpm_data in rpms.iteritems():
-                    imported_rpms += 1
-                    path, filename = os.path.split(rpm_data['path'])
-                    rpm_id = get_or_insert_rpm(rpms_in_db, cursor, rpm_nevra, srpm_nevra, filename)
-                    sigkey_id = common_models.SigKey.get_cached_id(rpm_data["sigkey"], create=True)
-                    path_id = models.Path.get_cached_id(path, create=True)
-                    content_category = rpm_data["category"]
-                    content_category_id = repository_models.ContentCategory.get_cached_id(content_category)
-                    insert_compose_rpms_if_nonexist(compose_rpms_in_db, cursor,
-                                                    var_arch_obj.id, rpm_id,
-                                                    content_category_id, sigkey_id, path_id)
+            variant_arch_ids[(variant.uid, arch)] = resolver.get_variant_arch(variant.uid, arch).pk
+
+    # Manifest entries are written in batches, so that neither the number of
+    # RPMs in the database nor the size of the manifest affects memory usage.
+    compose_rpms = []
+    for variant_uid, arch, srpm_nevra, rpm_nevra, rpm_data in _iter_rpms(rm):
+        variant_arch_id = variant_arch_ids.get((variant_uid, arch))
+        if variant_arch_id is None:
+            continue
+        imported_rpms += 1
+        path, filename = os.path.split(rpm_data['path'])
+        sigkey_id = common_models.SigKey.get_cached_id(rpm_data["sigkey"], create=True)
+        path_id = models.Path.get_cached_id(path, create=True)
+        content_category = rpm_data["category"]
+        content_category_id = repository_models.ContentCategory.get_cached_id(content_category)
+        compose_rpms.append((variant_arch_id, rpm_nevra, srpm_nevra, filename,
+                             content_category_id, sigkey_id, path_id))
+        if len(compose_rpms) >= RPM_IMPORT_BATCH_SIZE:
+            _link_compose_rpms(cursor, compose_rpms)
+            compose_rpms = []
+            _report_progress(progress, linked_rpms=imported_rpms, current_variant=variant_uid)
+    _link_compose_rpms(cursor, compose_rpms)
+    _report_progress(progress, linked_rpms=imported_rpms, current_variant=None)
 
     for obj in add_to_changelog:
         lib._maybe_log(request, True, obj)
@@ -214,6 +321,8 @@ def compose__import_rpms(request, release_id, composeinfo, rpm_manifest):
                               'num_linked_rpms': imported_rpms,
                           }))
 
+    models.ReleaseRPMMappingSnapshot.refresh_after_import(compose_obj)
+
     if hasattr(request._request, '_messagings'):
         _add_import_msg(request, compose_obj, 'rpms', imported_rpms)
 
@@ -221,7 +330,7 @@ def compose__import_rpms(request, release_id, composeinfo, rpm_manifest):
 
 
 @transaction.atomic(savepoint=False)
-def compose__import_images(request, release_id, composeinfo, image_manifest):
+def compose__import_images(request, release_id, composeinfo, image_manifest, progress=None):
     release_obj = release_models.Release.objects.get(release_id=release_id)
 
     ci = productmd.composeinfo.ComposeInfo()
@@ -251,53 +360,48 @@ def compose__import_images(request, release_id, composeinfo, image_manifest):
     imported_images = 0
 
     variants_info = composeinfo['payload']['variants']
-    for variant in ci.get_variants(recursive=True):
+    resolver = ComposeVariantResolver(compose_obj, ci, variants_info, add_to_changelog)
+    compose_images = []
+    for variant in resolver.variants:
+        _report_progress(progress, current_variant=variant.uid)
         _link_compose_to_integrated_product(request, compose_obj, variant)
-        variant_type = release_models.VariantType.objects.get(name=variant.type)
-        variant_obj, created = models.Variant.objects.get_or_create(
-            compose=compose_obj,
-            variant_id=variant.id,
-            variant_uid=variant.uid,
-            variant_name=variant.name,
-            variant_type=variant_type
-        )
-        if created:
-            add_to_changelog.append(variant_obj)
-
-        _store_relative_path_for_compose(compose_obj, variants_info, variant, variant_obj, add_to_changelog)
-
         for arch in variant.arches:
-            arch_obj = common_models.Arch.objects.get(name=arch)
-            var_arch_obj, created = models.VariantArch.objects.get_or_create(arch=arch_obj, variant=variant_obj)
+            var_arch_obj = resolver.get_variant_arch(variant.uid, arch)
 
             for i in im.images.get(variant.uid, {}).get(arch, []):
                 path, file_name = os.path.split(i.path)
-                path_id = models.Path.get_cached_id(path, create=True)
-
-                image, _ = package_models.Image.objects.get_or_create(
-                    file_name=file_name, sha256=i.checksums["sha256"],
-                    defaults={
-                        'image_format_id': package_models.ImageFormat.get_cached_id(i.format),
-                        'image_type_id': package_models.ImageType.get_cached_id(i.type),
-                        'disc_number': i.disc_number,
-                        'disc_count': i.disc_count,
-                        'arch': i.arch,
-                        'mtime': i.mtime,
-                        'size': i.size,
-                        'bootable': i.bootable,
-                        'implant_md5': i.implant_md5,
-                        'volume_id': i.volume_id,
-                        'md5': i.checksums.get("md5", None),
-                        'sha1': i.checksums.get("sha1", None),
-                        'subvariant': getattr(i, 'subvariant', None),
-                    }
-                )
-
-                mi, created = models.ComposeImage.objects.get_or_create(
-                    variant_arch=var_arch_obj,
-                    image=image,
-                    path_id=path_id)
+                compose_images.append((var_arch_obj.pk, models.Path.get_cached_id(path, create=True), {
+                    'file_name': file_name,
+                    'sha256': i.checksums["sha256"],
+                    'image_format_id': package_models.ImageFormat.get_cached_id(i.format),
+                    'image_type_id': package_models.ImageType.get_cached_id(i.type),
+                    'disc_number': i.disc_number,
+                    'disc_count': i.disc_count,
+                    'arch': i.arch,
+                    'mtime': i.mtime,
+                    'size': i.size,
+                    'bootable': i.bootable,
+                    'implant_md5': i.implant_md5,
+                    'volume_id': i.volume_id,
+                    'md5': i.checksums.get("md5", None),
+                    'sha1': i.checksums.get("sha1", None),
+                    'subvariant': getattr(i, 'subvariant', None),
+                }))
                 imported_images += 1
+            _report_progress(progress, imported_images=imported_images, current_variant=variant.uid)
+
+    image_ids = package_models.Image.bulk_get_or_create(image for _, _, image in compose_images)
+    linked = set(models.ComposeImage.objects.filter(variant_arch__variant__compose=compose_obj)
+                 .values_list('variant_arch_id', 'image_id'))
+    untested_id = models.ComposeAcceptanceTestingState.get_untested()
+    missing = []
+    for variant_arch_id, path_id, image in compose_images:
+        key = (variant_arch_id, image_ids[(image['file_name'], image['sha256'])])
+        if key not in linked:
+            linked.add(key)
+            missing.append(models.ComposeImage(variant_arch_id=key[0], image_id=key[1], path_id=path_id,
+                                               rtt_test_result_id=untested_id))
+    models.ComposeImage.objects.bulk_create(missing)
 
     for obj in add_to_changelog:
         lib._maybe_log(request, True, obj)
@@ -314,36 +418,72 @@ def compose__import_images(request, release_id, composeinfo, image_manifest):
     return compose_obj.compose_id, imported_images
 
 
-def _set_compose_tree_location(request, compose_id, composeinfo, location, url, scheme):
+def bulk_set_compose_tree_locations(compose_id, trees, location, url, scheme, synced_content):
+    """
+    Create or update compose trees for all `(variant_uid, arch)` pairs in
+    `trees` at given location. The input is validated as a whole before
+    anything is written; a missing variant or arch is reported with the
+    same key and message as by `ComposeTreeSerializer`. Return number of
+    set locations.
+    """
+    serializer = ComposeTreeLocationSerializer(data={'compose': compose_id,
+                                                     'location': location,
+                                                     'url': url,
+                                                     'scheme': scheme,
+                                                     'synced_content': synced_content})
+    serializer.is_valid(raise_exception=True)
+    data = serializer.validated_data
+    compose_obj = data['compose']
+
+    variant_arches = {}
+    for variant_arch in models.VariantArch.objects.filter(variant__compose=compose_obj).select_related('arch'):
+        variant_arches.setdefault(variant_arch.variant_id, {})[variant_arch.arch.name] = variant_arch.arch_id
+    variants = dict((obj.variant_uid, obj.pk) for obj in models.Variant.objects.filter(compose=compose_obj))
+
+    wanted = []
+    for variant_uid, arch_name in trees:
+        if variant_uid not in variants:
+            raise serializers.ValidationError(
+                {'variant': ['Variant %s does not exist in compose %s' % (variant_uid, compose_id)]})
+        arch_pk = variant_arches.get(variants[variant_uid], {}).get(arch_name)
+        if arch_pk is None:
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: ['Arch %s does not exist in given compose/variant branch' % arch_name]})
+        wanted.append((variants[variant_uid], arch_pk))
+
+    wanted_keys = set(wanted)
+    queryset = models.ComposeTree.objects.filter(compose=compose_obj, location=data['location'])
+    existing = dict(((variant_id, arch_id), pk)
+                    for pk, variant_id, arch_id in queryset.values_list('pk', 'variant_id', 'arch_id'))
+    update_ids = [existing[key] for key in wanted_keys if key in existing]
+    for ids in common_hacks.chunks(update_ids, common_hacks.MAX_QUERY_PARAMS):
+        queryset.filter(pk__in=ids).update(scheme=data['scheme'], url=data['url'])
+    missing = [models.ComposeTree(compose=compose_obj, variant_id=variant_id, arch_id=arch_id,
+                                  location=data['location'], scheme=data['scheme'], url=data['url'])
+               for variant_id, arch_id in wanted_keys if (variant_id, arch_id) not in existing]
+    if missing:
+        models.ComposeTree.objects.bulk_create(missing)
+        existing = dict(((variant_id, arch_id), pk)
+                        for pk, variant_id, arch_id in queryset.values_list('pk', 'variant_id', 'arch_id'))
+    tree_ids = [existing[key] for key in wanted_keys]
+
+    through = models.ComposeTree.synced_content.through
+    for ids in common_hacks.chunks(tree_ids, common_hacks.MAX_QUERY_PARAMS):
+        through.objects.filter(composetree_id__in=ids).delete()
+    through.objects.bulk_create(through(composetree_id=tree_id, contentcategory_id=category.pk)
+                                for tree_id in tree_ids for category in data['synced_content'])
+    return len(wanted)
+
+
+def _set_compose_tree_location(request, compose_id, composeinfo, location, url, scheme, progress=None):
     ci = productmd.composeinfo.ComposeInfo()
     common_hacks.deserialize_wrapper(ci.deserialize, composeinfo)
-    num_set_locations = 0
     synced_content = [item.name for item in ContentCategory.objects.all()]
+    trees = [(variant.uid, arch) for variant in ci.get_variants(recursive=True) for arch in variant.arches]
 
-    for variant in ci.get_variants(recursive=True):
-        variant_uid = variant.uid
-        variant_obj = models.Variant.objects.get(compose__compose_id=compose_id, variant_uid=variant_uid)
-        for arch_name in variant.arches:
-            data = {'compose': compose_id,
-                    'variant': variant_uid,
-                    'arch': arch_name,
-                    'location': location,
-                    'url': url,
-                    'scheme': scheme,
-                    'synced_content': synced_content}
-            request.data['compose'] = compose_id
-            try:
-                obj = models.ComposeTree.objects.get(compose__compose_id=compose_id, variant=variant_obj,
-                                                     arch__name=arch_name, location__short=location)
-                # update
-                serializer = ComposeTreeSerializer(obj, data=data, many=False, context={'request': request})
-            except models.ComposeTree.DoesNotExist:
-                # create
-                serializer = ComposeTreeSerializer(data=data, many=False, context={'request': request})
-
-            if serializer.is_valid(raise_exception=True):
-                serializer.save()
-                num_set_locations += 1
+    _report_progress(progress, set_locations=0, current_variant=None)
+    num_set_locations = bulk_set_compose_tree_locations(compose_id, trees, location, url, scheme, synced_content)
+    _report_progress(progress, set_locations=num_set_locations)
 
     request.changeset.add('notice', 0, 'null',
                           json.dumps({
@@ -354,14 +494,99 @@ def _set_compose_tree_location(request, compose_id, composeinfo, location, url,
 
 
 @transaction.atomic(savepoint=False)
-def compose__full_import(request, release_id, composeinfo, rpm_manifest, image_manifest, location, url, scheme):
-    compose_id, imported_rpms = compose__import_rpms(request, release_id, composeinfo, rpm_manifest)
+def compose__full_import(request, release_id, composeinfo, rpm_manifest, image_manifest, location, url, scheme,
+                         progress=None):
+    compose_id, imported_rpms = compose__import_rpms(request, release_id, composeinfo, rpm_manifest,
+                                                     progress=progress)
     # if compose__import_images return successfully, it should return same compose id
-    _, imported_images = compose__import_images(request, release_id, composeinfo, image_manifest)
-    set_locations = _set_compose_tree_location(request, compose_id, composeinfo, location, url, scheme)
+    _, imported_images = compose__import_images(request, release_id, composeinfo, image_manifest,
+                                                progress=progress)
+    set_locations = _set_compose_tree_location(request, compose_id, composeinfo, location, url, scheme,
+                                               progress=progress)
     return compose_id, imported_rpms, imported_images, set_locations
 
 
+def _compose_rpm_rows(compose):
+    return (models.ComposeRPM.objects
+            .filter(variant_arch__variant__compose=compose)
+            .order_by()
+            .values_list('variant_arch__variant__variant_uid', 'variant_arch__arch__name',
+                         'rpm__name', 'rpm__arch', 'rpm__epoch', 'rpm__version', 'rpm__release'))
+
+
+def _format_nevra(name, evr, arch):
+    return u'%s-%s:%s-%s.%s' % (name, evr[0], evr[1], evr[2], arch)
+
+
+def _evr_sort_key(evr):
+    epoch, version, release = evr
+    return (epoch, common_hacks.parse_epoch_version(version), common_hacks.parse_epoch_version(release))
+
+
+def _compose_rpm_row_groups(rows):
+    """
+    Yield rows of a difference query grouped by variant UID and arch,
+    followed by a `(None, ())` sentinel.
+    """
+    rows = rows.order_by('variant_arch__variant__variant_uid', 'variant_arch__arch__name')
+    for key, group in itertools.groupby(rows.iterator(), key=lambda row: row[:2]):
+        yield key, group
+    yield None, ()
+
+
+def compose__rpm_diff(old_compose, new_compose):
+    """
+    Compare RPMs in two composes. Yield a dict for each variant and arch
+    with some changes, sorted by variant UID and arch.
+
+    Only the rows that differ are loaded from database; they are computed
+    with two `EXCEPT` queries ordered by variant and arch, and each variant
+    and arch is yielded as soon as its rows are read. A package (identified
+    by name and arch) that has a different version in the new compose is
+    reported as upgraded or downgraded from the newest old version to the
+    newest new one; any other versions are listed as added or removed.
+    """
+    old_rows = _compose_rpm_rows(old_compose)
+    new_rows = _compose_rpm_rows(new_compose)
+    sides = [['removed', _compose_rpm_row_groups(old_rows.difference(new_rows))],
+             ['added', _compose_rpm_row_groups(new_rows.difference(old_rows))]]
+    for side in sides:
+        side.append(next(side[1]))
+    # Variant arches are listed in the same order as the differences, so the
+    # groups of both queries can be matched without comparing keys in Python.
+    variant_arches = (models.VariantArch.objects
+                      .filter(variant__compose__in=[old_compose, new_compose])
+                      .order_by('variant__variant_uid', 'arch__name')
+                      .values_list('variant__variant_uid', 'arch__name')
+                      .distinct())
+    for variant_uid, arch in variant_arches.iterator():
+        changes = {}
+        for side in sides:
+            name, groups, (key, rows) = side
+            if key != (variant_uid, arch):
+                continue
+            for row in rows:
+                package = changes.setdefault(row[2:4], {'removed': [], 'added': []})
+                package[name].append(row[4:])
+            side[2] = next(groups)
+        if not changes:
+            continue
+
+        result = {'variant': variant_uid, 'arch': arch,
+                  'added': [], 'removed': [], 'upgraded': [], 'downgraded': []}
+        for (name, rpm_arch), versions in sorted(changes.iteritems()):
+            removed = sorted(versions['removed'], key=_evr_sort_key)
+            added = sorted(versions['added'], key=_evr_sort_key)
+            if removed and added:
+                old, new = removed.pop(), added.pop()
+                change = 'upgraded' if _evr_sort_key(new) > _evr_sort_key(old) else 'downgraded'
+                result[change].append({'from': _format_nevra(name, old, rpm_arch),
+                                       'to': _format_nevra(name, new, rpm_arch)})
+            result['added'].extend(_format_nevra(name, evr, rpm_arch) for evr in added)
+            result['removed'].extend(_format_nevra(name, evr, rpm_arch) for evr in removed)
+        yield result
+
+
 def _find_composes_srpm_name_with_rpm_nvr(nvr):
     """
     Filter composes and SRPM's name with rpm nvr
@@ -0,0 +1,30 @@
+#
+# Copyright (c) 2018 Red Hat
+# Licensed under The MIT License (MIT)
+# http://opensource.org/licenses/MIT
+#
+from django.core.management.base import BaseCommand, CommandError
+
+from pdc.apps.compose.models import ComposeRPMMapping, OverrideRPM
+from pdc.apps.release.models import Release
+
+
+class Command(BaseCommand):
+    help = ('Delete RPM overrides that have no effect on RPM mapping of the latest compose '
+            'and are not marked as do_not_delete.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('release_id', nargs='*',
+                            help='Only check overrides of these releases (default: all releases).')
+        parser.add_argument('--batch-size', type=int, default=ComposeRPMMapping.BATCH_SIZE,
+                            help='Number of packages checked at once (default: %(default)s).')
+
+    def handle(self, *args, **options):
+        releases = None
+        if options['release_id']:
+            releases = list(Release.objects.filter(release_id__in=options['release_id']))
+            missing = set(options['release_id']) - set(release.release_id for release in releases)
+            if missing:
+                raise CommandError('Unknown releases: %s' % ', '.join(sorted(missing)))
+        deleted = OverrideRPM.delete_useless(releases, batch_size=options['batch_size'])
+        self.stdout.write('Deleted %d overrides' % deleted)
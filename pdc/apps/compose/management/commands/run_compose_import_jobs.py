@@ -0,0 +1,34 @@
+#
+# Copyright (c) 2018 Red Hat
+# Licensed under The MIT License (MIT)
+# http://opensource.org/licenses/MIT
+#
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from pdc.apps.compose import jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued background compose imports.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=settings.COMPOSE_IMPORT_POLL_INTERVAL,
+                            help='Seconds to wait when there is no queued job (default: %(default)s).')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when there are no queued jobs instead of waiting for new ones.')
+
+    def handle(self, *args, **options):
+        jobs.recover()
+        while True:
+            if not connection.in_atomic_block:
+                close_old_connections()
+            count = jobs.run_pending()
+            if count:
+                self.stdout.write('Finished %d compose import jobs' % count)
+            if options['once']:
+                return
+            time.sleep(options['poll_interval'])
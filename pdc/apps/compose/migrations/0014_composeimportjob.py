@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('changeset', '0007_auto_20160714_1244'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('compose', '0013_auto_20180131_1318'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComposeImportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('release_id', models.CharField(max_length=200)),
+                ('status', models.CharField(choices=[(b'queued', b'queued'), (b'running', b'running'), (b'finished', b'finished'), (b'failed', b'failed')], default=b'queued', max_length=20)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('started_on', models.DateTimeField(blank=True, null=True)),
+                ('finished_on', models.DateTimeField(blank=True, null=True)),
+                ('compose_id', models.CharField(blank=True, max_length=200, null=True)),
+                ('imported_rpms', models.PositiveIntegerField(blank=True, null=True)),
+                ('imported_images', models.PositiveIntegerField(blank=True, null=True)),
+                ('set_locations', models.PositiveIntegerField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('author', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('changeset', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='changeset.Changeset')),
+            ],
+            options={
+                'ordering': ('-id',),
+            },
+        ),
+    ]
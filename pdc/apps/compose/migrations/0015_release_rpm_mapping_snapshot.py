@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('release', '0017_auto_20180131_1318'),
+        ('compose', '0014_composeimportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReleaseRPMMapping',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('srpm_name', models.CharField(max_length=200)),
+                ('mapping', models.TextField()),
+                ('release', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='release.Release')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReleaseRPMMappingSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('refreshed_on', models.DateTimeField(auto_now=True)),
+                ('compose', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='compose.Compose')),
+                ('release', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rpm_mapping_snapshot', to='release.Release')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='releaserpmmapping',
+            unique_together=set([('release', 'srpm_name')]),
+        ),
+    ]
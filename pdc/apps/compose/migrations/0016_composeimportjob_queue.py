@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('compose', '0015_release_rpm_mapping_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='composeimportjob',
+            name='base_uri',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='composeimportjob',
+            name='comment',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='composeimportjob',
+            name='path',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='composeimportjob',
+            name='payload',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='composeimportjob',
+            name='worker',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+    ]
@@ -3,12 +3,22 @@
 # Licensed under The MIT License (MIT)
 # http://opensource.org/licenses/MIT
 #
+import itertools
+import json
+from collections import OrderedDict
+
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models, connection, transaction
+from django.db.models import Case, Value, When
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.db.utils import IntegrityError
+from django.dispatch import receiver
 
 from pdc.apps.common import models as common_models
-from pdc.apps.common.hacks import add_returning
+from pdc.apps.common.idcache import IdCache
+from pdc.apps.common.hacks import (add_returning, add_ignore_conflicts, insert_rows, temporary_table,
+                                   chunks, MAX_QUERY_PARAMS)
 
 from productmd import composeinfo
 
@@ -72,6 +82,31 @@ class Compose(models.Model):
             return cmp(self._get_compose_info(), another._get_compose_info())
         return cmp(self.release.version_sort_key(), another.release.version_sort_key())
 
+    @staticmethod
+    def order_by_version(queryset, reverse=False):
+        """
+        Order composes in `queryset` the same way as comparing them does: by
+        version of their release, then by date, type and respin. The ordering
+        is done by database, so `order_by_version(qs, reverse=True).first()`
+        fetches only the latest compose.
+        """
+        from pdc.apps.release.models import Release
+        releases = sorted(Release.objects.filter(pk__in=queryset.values('release')),
+                          key=lambda release: release.version_sort_key())
+        release_rank = [When(release=release.pk, then=Value(rank))
+                        for rank, (_, group) in enumerate(itertools.groupby(
+                            releases, key=lambda release: release.version_sort_key()))
+                        for release in group]
+        type_rank = [When(compose_type=pk, then=Value(composeinfo.COMPOSE_TYPES.index(name)))
+                     for pk, name in ComposeType.objects.values_list('pk', 'name')
+                     if name in composeinfo.COMPOSE_TYPES]
+        prefix = '-' if reverse else ''
+        return (queryset
+                .annotate(release_rank=Case(*release_rank, default=Value(0), output_field=models.IntegerField()),
+                          type_rank=Case(*type_rank, default=Value(-1), output_field=models.IntegerField()))
+                .order_by(*[prefix + field for field in ('release_rank', 'compose_date', 'type_rank',
+                                                         'compose_respin', 'id')]))
+
     def _get_compose_info(self):
         if not hasattr(self, '_compose_info'):
             self._compose_info = composeinfo.Compose(None)
@@ -125,8 +160,10 @@ class Compose(models.Model):
 
         The second element of the tuple is a list of overrides that exclude
         non-existent package or include already existing package. All the
-        overrides in this list have do_not_delete set. All overrides that could
-        be in this list but can be deleted actually are deleted.
+        overrides in this list have do_not_delete set. Overrides that could be
+        in this list but can be deleted are available in
+        `deletable_overrides` attribute of the mapping; they are not deleted
+        here, see `OverrideRPM.delete_useless`.
 
         If `release` argument is not specified, the release for which the
         compose was built will be used. The overrides will be taken from this
@@ -149,6 +186,7 @@ class Compose(models.Model):
         from pdc.apps.package.models import RPM
         return (RPM.objects.filter(name=rpm_name)
                 .filter(composerpm__variant_arch__variant__compose=self)
+                .order_by('evr_sort_key', 'arch')
                 .distinct())
 
     def get_arch_testing_status(self):
@@ -163,12 +201,6 @@ class Compose(models.Model):
         return result
 
 
-def find_by(list, key, val):
-    """Find a dict with given key=val pair in a list."""
-    matches = [i for i in list if i[key] == val]
-    return matches[0] if len(matches) == 1 else None
-
-
 # This is duplicate by design
 # these variants are a snapshot of real compose content
 # -> no direct relation to release variants
@@ -245,7 +277,7 @@ class Path(models.Model):
             "path": self.path
         }
 
-    CACHE = {}
+    CACHE = IdCache('path')
 
     @classmethod
     def get_cached_id(cls, value, create=False):
@@ -295,18 +327,61 @@ class ComposeRPM(models.Model):
         transaction.savepoint_commit(sid)
         return insert_id
 
+    @staticmethod
+    def bulk_link(cursor, rows):
+        """
+        Create ComposeRPM rows that do not exist yet. Each row should be a
+        tuple `(variant_arch_id, rpm_id, content_category_id, sigkey_id,
+        path_id)`. If a (variant_arch_id, rpm_id) pair is already linked, the
+        existing row is kept as is. Returns number of newly created rows.
+        """
+        staged = {}
+        for row in rows:
+            staged.setdefault(row[:2], row)
+        if not staged:
+            return 0
+
+        columns = ["variant_arch_id", "rpm_id", "content_category_id", "sigkey_id", "path_id"]
+        with temporary_table(cursor, "tmp_composerpm_import",
+                             ["%s integer" % column for column in columns]) as tmp:
+            insert_rows(cursor, tmp, columns, staged.values())
+            cursor.execute(add_ignore_conflicts(
+                """INSERT INTO %s (%s) SELECT %s FROM %s t LEFT JOIN %s c
+                   ON c.variant_arch_id = t.variant_arch_id AND c.rpm_id = t.rpm_id
+                   WHERE c.id IS NULL"""
+                % (ComposeRPM._meta.db_table, ", ".join(columns), ", ".join("t." + c for c in columns),
+                   tmp, ComposeRPM._meta.db_table)))
+            created = cursor.rowcount
+        return created
+
 
 class ComposeRPMMapping(object):
+    """
+    RPM mapping of a package. Mappings loaded from database are stored as
+    nested dicts `{variant: {arch: {rpm_name: {rpm_arch: rpm_data}}}}`, where
+    `rpm_data` is a dict with `rpm_arch`, `included` and `override` keys.
+    Mappings created from request data have lists of RPM arches instead of
+    the innermost dicts.
+
+    Computing the mapping never changes the database. Overrides that have no
+    effect are collected in `useless_overrides` (those with `do_not_delete`
+    set) and `deletable_overrides`, the latter are removed by
+    `OverrideRPM.delete_useless`.
+    """
+    # Number of packages loaded at once by `load_many`.
+    BATCH_SIZE = 500
+
     def __init__(self, data=None):
         self.data = data or {}
         self.compose = None
         self.package = None
+        self.useless_overrides = []
+        self.deletable_overrides = []
 
-    def add_rpm(self, variant, arch, rpm_name, rpm_arch):
+    def add_rpm(self, variant, arch, rpm_name, rpm_data):
         self.data.setdefault(variant, {}) \
                  .setdefault(arch, {}) \
-                 .setdefault(rpm_name, []) \
-                 .append(rpm_arch)
+                 .setdefault(rpm_name, {})[rpm_data['rpm_arch']] = rpm_data
 
     def load_from_compose(self, compose, package, release):
         self.compose = compose
@@ -327,14 +402,62 @@ class ComposeRPMMapping(object):
                          crpm.rpm.name,
                          {'rpm_arch': crpm.rpm.arch, 'included': True, 'override': 'orig'})
 
+    @classmethod
+    def load_many(cls, release, compose=None, packages=None, disable_overrides=False, batch_size=BATCH_SIZE):
+        """
+        Generate `(package, mapping)` pairs with mappings of multiple
+        packages, sorted by package name. This gives the same mappings as
+        calling `Compose.get_rpm_mapping` (or
+        `get_rpm_mapping_only_with_overrides` when there is no compose) for
+        each package, but RPMs and overrides are loaded for `batch_size`
+        packages at once.
+
+        If `packages` is not given, all packages with RPMs in the compose or
+        with overrides in the release are used.
+        """
+        release_variants = {}
+        for variant_uid, arch in release.variant_set.values_list('variant_uid', 'variantarch__arch__name'):
+            release_variants.setdefault(variant_uid, set()).add(arch)
+
+        overrides = OverrideRPM.objects.filter(release=release)
+        compose_rpms = ComposeRPM.objects.filter(variant_arch__variant__compose=compose)
+        if packages is None:
+            packages = set(overrides.values_list('srpm_name', flat=True).distinct())
+            if compose:
+                packages.update(compose_rpms.values_list('rpm__srpm_name', flat=True).distinct())
+        packages = sorted(set(packages))
+
+        for start in range(0, len(packages), batch_size):
+            batch = packages[start:start + batch_size]
+            mappings = OrderedDict((package, cls()) for package in batch)
+            if compose:
+                rows = (compose_rpms.filter(rpm__srpm_name__in=batch)
+                        .values_list('rpm__srpm_name', 'variant_arch__variant__variant_uid',
+                                     'variant_arch__arch__name', 'rpm__name', 'rpm__arch'))
+                for package, variant, arch, rpm_name, rpm_arch in rows:
+                    if arch not in release_variants.get(variant, set()):
+                        continue
+                    mappings[package].add_rpm(variant, arch, rpm_name,
+                                              {'rpm_arch': rpm_arch, 'included': True, 'override': 'orig'})
+            if not disable_overrides:
+                package_overrides = {}
+                for override in overrides.filter(srpm_name__in=batch).order_by('id'):
+                    package_overrides.setdefault(override.srpm_name, []).append(override)
+                for package, mapping in mappings.iteritems():
+                    mapping.apply_overrides(package_overrides.get(package, []))
+            for package, mapping in mappings.iteritems():
+                mapping.compose = compose
+                mapping.package = package
+                yield package, mapping
+
     def get_rpm_dict(self, variant, arch):
         return self.data.setdefault(variant, {}).setdefault(arch, {})
 
-    def _process_unused(self, override, useless_overrides, to_be_deleted):
+    def _process_unused(self, override):
         if override.do_not_delete:
-            useless_overrides.append(override)
+            self.useless_overrides.append(override)
         else:
-            to_be_deleted.append(override)
+            self.deletable_overrides.append(override)
 
     def get_rpm_mapping_only_with_overrides(self, package, disable_overrides, release):
         useless_overrides = []
@@ -343,42 +466,29 @@ class ComposeRPMMapping(object):
             useless_overrides = self.apply_overrides(overrides)
         return self, useless_overrides
 
-    def apply_overrides(self, overrides, do_delete=True):
-        tbd = []
-        useless_overrides = []
+    def apply_overrides(self, overrides):
+        """
+        Apply overrides to the mapping and return a list of the overrides
+        that have no effect and have `do_not_delete` set.
+        """
         for override in overrides:
             rpm_dict = self.get_rpm_dict(override.variant, override.arch)
-            if override.rpm_name in rpm_dict:
-                # existing rpm name
-                rpm = find_by(rpm_dict[override.rpm_name], 'rpm_arch', override.rpm_arch)
-                if rpm:
-                    if not override.include:
-                        # existing arch
-                        rpm['included'] = False
-                        rpm['override'] = 'delete'
-                    else:
-                        self._process_unused(override, useless_overrides, tbd)
+            rpm = rpm_dict.get(override.rpm_name, {}).get(override.rpm_arch)
+            if rpm:
+                if not override.include:
+                    # existing arch
+                    rpm['included'] = False
+                    rpm['override'] = 'delete'
                 else:
-                    # not existing arch
-                    if override.include:
-                        rpm = {'rpm_arch': override.rpm_arch, 'included': override.include, 'override': 'create'}
-                        rpm_dict[override.rpm_name].append(rpm)
-                    else:
-                        self._process_unused(override, useless_overrides, tbd)
+                    self._process_unused(override)
+            elif override.include:
+                # new rpm name or not existing arch
+                rpm_dict.setdefault(override.rpm_name, {})[override.rpm_arch] = {
+                    'rpm_arch': override.rpm_arch, 'included': override.include, 'override': 'create'
+                }
             else:
-                # new rpm name
-                if override.include:
-                    rpm = {'rpm_arch': override.rpm_arch, 'included': override.include, 'override': 'create'}
-                    rpm_dict[override.rpm_name] = [rpm]
-                else:
-                    self._process_unused(override, useless_overrides, tbd)
-
-        if do_delete:
-            for override in tbd:
-                print ' *** NOTICE: deleted override %s' % override
-                override.delete()
-
-        return useless_overrides
+                self._process_unused(override)
+        return self.useless_overrides
 
     def get_pure_dict(self):
         result = {}
@@ -395,9 +505,13 @@ class ComposeRPMMapping(object):
         for variant in sorted(self.data):
             for arch in sorted(self.data[variant]):
                 for rpm_name in sorted(self.data[variant][arch]):
-                    for rpm_data in sorted(self.data[variant][arch][rpm_name],
-                                           key=lambda x: x['rpm_arch'] if isinstance(x, dict) else x):
-                        yield (variant, arch, rpm_name, rpm_data)
+                    rpms = self.data[variant][arch][rpm_name]
+                    if isinstance(rpms, dict):
+                        for rpm_arch in sorted(rpms):
+                            yield (variant, arch, rpm_name, rpms[rpm_arch])
+                    else:
+                        for rpm_arch in sorted(rpms):
+                            yield (variant, arch, rpm_name, rpm_arch)
 
     def compute_changes(self, new_mapping):
         """
@@ -425,8 +539,8 @@ class ComposeRPMMapping(object):
             try:
                 old_archs = self.data[variant][arch][rpm_name]
             except KeyError:
-                old_archs = []
-            tmp_arch = find_by(old_archs, 'rpm_arch', rpm_arch)
+                old_archs = {}
+            tmp_arch = old_archs.get(rpm_arch)
             if not tmp_arch:    # Completely new mapping
                 stage('create',
                       {'variant': variant, 'arch': arch, 'rpm_name': rpm_name, 'rpm_arch': rpm_arch}, True)
@@ -524,8 +638,260 @@ class OverrideRPM(models.Model):
                 new_val = orpm.export()
         else:
             raise ValueError("action should only be 'create' or 'delete'")
+        ReleaseRPMMappingSnapshot.refresh(release, packages=[data['srpm_name']])
         return pk, old_val, new_val
 
+    # Fields that are copied by `clone`; the rest get default values.
+    CLONED_FIELDS = ('variant', 'arch', 'srpm_name', 'rpm_name', 'rpm_arch', 'comment')
+    EXPORTED_FIELDS = ('variant', 'arch', 'srpm_name', 'rpm_name', 'rpm_arch',
+                       'include', 'comment', 'do_not_delete')
+
+    @classmethod
+    def export_rows(klass, queryset, release):
+        """
+        Return a list of `(pk, data)` pairs for overrides of `release` in
+        `queryset`, where `data` has the same format as `export()`. Only the
+        values are loaded, no model instances are created.
+        """
+        result = []
+        for row in queryset.order_by('id').values('id', *klass.EXPORTED_FIELDS).iterator():
+            pk = row.pop('id')
+            row['release_id'] = release.release_id
+            result.append((pk, row))
+        return result
+
+    @classmethod
+    @transaction.atomic
+    def clone(klass, source, target, **filters):
+        """
+        Copy overrides of `source` release matching `filters` (a subset of
+        `CLONED_FIELDS`) to `target` release with a single INSERT ... SELECT
+        statement. Overrides already present in `target` are skipped. Returns
+        result of `export_rows` for the created overrides.
+        """
+        table = klass._meta.db_table
+        columns = ', '.join(klass.CLONED_FIELDS)
+        conditions = ['src.release_id = %s']
+        params = [target.pk, True, False, source.pk]
+        for field in sorted(filters):
+            if field not in klass.CLONED_FIELDS:
+                raise ValueError('Can not filter overrides by %s' % field)
+            conditions.append('src.%s = %%s' % field)
+            params.append(filters[field])
+        params.append(target.pk)
+        sql = """INSERT INTO {table} (release_id, include, do_not_delete, {columns})
+                 SELECT %s, %s, %s, {src_columns}
+                 FROM {table} src
+                 WHERE {conditions}
+                   AND NOT EXISTS (SELECT 1 FROM {table} dst
+                                   WHERE dst.release_id = %s
+                                     AND dst.variant = src.variant AND dst.arch = src.arch
+                                     AND dst.rpm_name = src.rpm_name AND dst.rpm_arch = src.rpm_arch)
+              """.format(table=table, columns=columns,
+                         src_columns=', '.join('src.' + field for field in klass.CLONED_FIELDS),
+                         conditions=' AND '.join(conditions))
+        cursor = connection.cursor()
+        if connection.features.can_return_ids_from_bulk_insert:
+            cursor.execute(add_returning(add_ignore_conflicts(sql)), params)
+            ids = [row[0] for row in cursor.fetchall()]
+            result = []
+            for chunk in chunks(ids, MAX_QUERY_PARAMS - 1):
+                result.extend(klass.export_rows(klass.objects.filter(release=target, pk__in=chunk), target))
+            return result
+        # Without RETURNING, new rows are the ones with higher ids.
+        last_id = klass.objects.aggregate(last_id=models.Max('id'))['last_id'] or 0
+        cursor.execute(sql, params)
+        return klass.export_rows(klass.objects.filter(release=target, pk__gt=last_id), target)
+
+    @classmethod
+    @transaction.atomic
+    def clear(klass, release, force=False):
+        """
+        Delete overrides of `release` with one query. Overrides with
+        `do_not_delete` set are kept unless `force` is true. Returns result of
+        `export_rows` for the deleted overrides.
+        """
+        queryset = klass.objects.filter(release=release)
+        if not force:
+            queryset = queryset.filter(do_not_delete=False)
+        result = klass.export_rows(queryset.select_for_update(), release)
+        queryset.delete()
+        return result
+
+    @classmethod
+    def delete_useless(klass, releases=None, batch_size=ComposeRPMMapping.BATCH_SIZE):
+        """
+        Delete overrides that have no effect on RPM mapping of the latest
+        compose of their release and do not have `do_not_delete` set. All
+        releases with overrides are checked unless `releases` are given.
+        Returns number of deleted overrides.
+        """
+        if releases is None:
+            release_model = klass._meta.get_field('release').related_model
+            releases = release_model.objects.filter(pk__in=klass.objects.values('release'))
+        deleted = 0
+        for release in releases:
+            packages = (klass.objects.filter(release=release, do_not_delete=False)
+                        .values_list('srpm_name', flat=True).distinct())
+            ids = []
+            for _, mapping in ComposeRPMMapping.load_many(release, compose=release.get_latest_compose(),
+                                                          packages=packages, batch_size=batch_size):
+                ids.extend(override.pk for override in mapping.deletable_overrides)
+            for start in range(0, len(ids), batch_size):
+                count, _ = klass.objects.filter(pk__in=ids[start:start + batch_size],
+                                                do_not_delete=False).delete()
+                deleted += count
+        return deleted
+
+
+class ReleaseRPMMappingSnapshot(models.Model):
+    """
+    Materialized RPM mappings of a release. Once built (by importing RPMs or
+    by `refresh`), mappings of the latest compose with applied overrides are
+    read from `ReleaseRPMMapping` instead of being computed for each request.
+    """
+    release             = models.OneToOneField("release.Release", related_name='rpm_mapping_snapshot',
+                                               on_delete=models.CASCADE)
+    # Latest compose of the release when the snapshot was built. Deleting the
+    # compose drops the snapshot as well.
+    compose             = models.ForeignKey(Compose, null=True, blank=True, on_delete=models.CASCADE)
+    refreshed_on        = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return u"%s (%s)" % (self.release, self.compose)
+
+    @classmethod
+    def refresh(cls, release, packages=None):
+        """
+        Rebuild mappings of the release. When `packages` are given, only
+        their mappings are recomputed and only if the release already has a
+        snapshot. The compose of the snapshot is kept in that case.
+
+        Only mappings that changed are written.
+        """
+        snapshot = cls.objects.filter(release=release).select_related('compose').first()
+        if packages is None:
+            compose = release.get_latest_compose()
+        elif snapshot and packages:
+            compose = snapshot.compose
+        else:
+            return snapshot
+
+        new = {}
+        for package, mapping in ComposeRPMMapping.load_many(release, compose=compose, packages=packages):
+            data = mapping.get_pure_dict()
+            if data:
+                new[package] = json.dumps(data, sort_keys=True)
+
+        existing = ReleaseRPMMapping.objects.filter(release=release)
+        if packages is None:
+            old = dict(existing.values_list('srpm_name', 'mapping'))
+        else:
+            old = {}
+            for chunk in chunks(sorted(set(packages)), ComposeRPMMapping.BATCH_SIZE):
+                old.update(existing.filter(srpm_name__in=chunk).values_list('srpm_name', 'mapping'))
+        outdated = [package for package, mapping in old.iteritems() if new.get(package) != mapping]
+        for start in range(0, len(outdated), ComposeRPMMapping.BATCH_SIZE):
+            ReleaseRPMMapping.objects.filter(
+                release=release, srpm_name__in=outdated[start:start + ComposeRPMMapping.BATCH_SIZE]
+            ).delete()
+        ReleaseRPMMapping.objects.bulk_create(
+            [ReleaseRPMMapping(release=release, srpm_name=package, mapping=mapping)
+             for package, mapping in new.iteritems() if old.get(package) != mapping],
+            batch_size=ComposeRPMMapping.BATCH_SIZE
+        )
+
+        if snapshot:
+            snapshot.compose = compose
+            snapshot.save()
+        else:
+            snapshot = cls.objects.create(release=release, compose=compose)
+        return snapshot
+
+    @classmethod
+    def refresh_after_import(cls, compose):
+        """
+        Update snapshot of the release of newly imported `compose`. Nothing
+        needs to be done when the snapshot is built from a newer compose.
+        """
+        release = compose.release
+        cls.refresh_stale(compose.linked_releases.all())
+        snapshot = cls.objects.filter(release=release).first()
+        latest = release.get_latest_compose()
+        if snapshot and latest and latest != compose and snapshot.compose_id == latest.pk:
+            return snapshot
+        return cls.refresh(release)
+
+    @classmethod
+    def refresh_stale(cls, releases):
+        """
+        Rebuild existing snapshots of given releases whose latest compose is
+        no longer the one the snapshot was built from. Releases without a
+        snapshot are skipped.
+        """
+        for snapshot in cls.objects.filter(release__in=releases).select_related('release'):
+            latest = snapshot.release.get_latest_compose()
+            if snapshot.compose_id != (latest.pk if latest else None):
+                cls.refresh(snapshot.release)
+
+
+class ReleaseRPMMapping(models.Model):
+    """RPM mapping of a single package, see `ReleaseRPMMappingSnapshot`."""
+    release             = models.ForeignKey("release.Release", on_delete=models.CASCADE)
+    srpm_name           = models.CharField(max_length=200)
+    # JSON with the same structure as ComposeRPMMapping.get_pure_dict()
+    mapping             = models.TextField()
+
+    class Meta:
+        unique_together = (
+            ("release", "srpm_name"),
+        )
+
+    def __unicode__(self):
+        return u"%s/%s" % (self.release, self.srpm_name)
+
+    def get_mapping(self):
+        return json.loads(self.mapping)
+
+
+@receiver(m2m_changed, sender=Compose.linked_releases.through)
+def refresh_snapshots_of_linked_releases(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Linking a compose to a release or unlinking it can change the latest
+    compose of the release. Snapshots are rebuilt once the transaction is
+    committed, so that RPMs of a compose being imported are already there.
+    """
+    if action == 'pre_clear' and not reverse:
+        instance._cleared_linked_releases = list(instance.linked_releases.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        release_ids = [instance.pk]
+    elif action == 'post_clear':
+        release_ids = instance.__dict__.pop('_cleared_linked_releases', [])
+    else:
+        release_ids = list(pk_set)
+    if release_ids:
+        transaction.on_commit(lambda: ReleaseRPMMappingSnapshot.refresh_stale(release_ids))
+
+
+@receiver(post_save, sender='release.Variant')
+@receiver(post_delete, sender='release.Variant')
+def drop_snapshot_of_variant_release(sender, instance, **kwargs):
+    """
+    Mappings only include variants and arches of the release, so changing
+    them makes the snapshot useless. Mappings are computed from the latest
+    compose until the snapshot is built again.
+    """
+    ReleaseRPMMappingSnapshot.objects.filter(release_id=instance.release_id).delete()
+
+
+@receiver(post_save, sender='release.VariantArch')
+@receiver(post_delete, sender='release.VariantArch')
+def drop_snapshot_of_variant_arch_release(sender, instance, **kwargs):
+    ReleaseRPMMappingSnapshot.objects.filter(release__variant=instance.variant_id).delete()
+
 
 class ComposeImage(models.Model):
     variant_arch        = models.ForeignKey(VariantArch, db_index=True, on_delete=models.CASCADE)
@@ -638,3 +1004,47 @@ class ComposeRelPath(models.Model):
             "type": self.type.name,
             "path": self.path
         }
+
+
+class ComposeImportJob(models.Model):
+    """
+    Full compose import running in background. The table is the queue of
+    jobs: workers pick queued jobs and run them with the stored request
+    data, see `pdc.apps.compose.jobs`.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FINISHED = 'finished'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'queued'),
+        (RUNNING, 'running'),
+        (FINISHED, 'finished'),
+        (FAILED, 'failed'),
+    )
+
+    author              = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.CASCADE)
+    release_id          = models.CharField(max_length=200)
+    status              = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    created_on          = models.DateTimeField(auto_now_add=True)
+    started_on          = models.DateTimeField(null=True, blank=True)
+    finished_on         = models.DateTimeField(null=True, blank=True)
+    compose_id          = models.CharField(max_length=200, null=True, blank=True)
+    imported_rpms       = models.PositiveIntegerField(null=True, blank=True)
+    imported_images     = models.PositiveIntegerField(null=True, blank=True)
+    set_locations       = models.PositiveIntegerField(null=True, blank=True)
+    changeset           = models.ForeignKey("changeset.Changeset", null=True, blank=True, on_delete=models.SET_NULL)
+    error               = models.TextField(blank=True)
+    # JSON body of the request, dropped once the job is done.
+    payload             = models.TextField(blank=True)
+    comment             = models.TextField(null=True, blank=True)
+    path                = models.CharField(max_length=200, blank=True)
+    base_uri            = models.CharField(max_length=200, blank=True)
+    # Host and process id of the worker running the job.
+    worker              = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        ordering = ("-id", )
+
+    def __unicode__(self):
+        return u"compose-import-job-%s" % self.id
@@ -29,12 +29,18 @@ router.register('rpc/find-compose-by-release-rpm/(?P<release_id>[^/]+)/(?P<rpm_n
 router.register('rpc/find-older-compose-by-compose-rpm/(?P<compose_id>[^/]+)/(?P<rpm_name>[^/]+)',
                 views.FindOlderComposeByComposeRPMViewSet,
                 base_name='findoldercomposebycr')
+router.register('rpc/compose-rpm-diff/(?P<old_compose_id>[^/]+)/(?P<new_compose_id>[^/]+)',
+                views.ComposeRPMDiffViewSet,
+                base_name='composerpmdiff')
 router.register('rpc/find-composes-by-product-version-rpm/(?P<product_version>[^/]+)/(?P<rpm_name>[^/]+)',
                 views.FindComposeByProductVersionRPMViewSet,
                 base_name='findcomposesbypvr')
 router.register('rpc/compose-full-import',
                 views.ComposeFullImportViewSet,
                 base_name='composefullimport')
+router.register(r'compose-import-jobs',
+                views.ComposeImportJobViewSet,
+                base_name='composeimportjob')
 router.register(r'compose-tree-locations', views.ComposeTreeViewSet,
                 base_name='composetreelocations')
 router.register(r'compose-tree-rtt-tests', views.ComposeTreeRTTTestViewSet,
@@ -11,7 +11,7 @@ from pdc.apps.common.serializers import StrictSerializerMixin
 from pdc.apps.common.fields import ChoiceSlugField
 from .models import (Compose, OverrideRPM, ComposeAcceptanceTestingState,
                      ComposeTree, Variant, Location, Scheme, ComposeImage,
-                     VariantArch)
+                     VariantArch, ComposeImportJob)
 from pdc.apps.release.models import Release
 from pdc.apps.utils.utils import urldecode
 from pdc.apps.repository.models import ContentCategory
@@ -153,6 +153,18 @@ class ComposeTreeSerializer(StrictSerializerMixin,
                                               (compose, variant, arch))
 
 
+class ComposeTreeLocationSerializer(serializers.Serializer):
+    """
+    Validates values shared by all trees of a compose when their location is
+    set in bulk. Variants and arches are checked separately as a set.
+    """
+    compose                 = serializers.SlugRelatedField(slug_field='compose_id', queryset=Compose.objects.all())
+    location                = ChoiceSlugField(slug_field='short', queryset=Location.objects.all())
+    scheme                  = ChoiceSlugField(slug_field='name', queryset=Scheme.objects.all())
+    url                     = serializers.CharField(max_length=255)
+    synced_content          = ChoiceSlugField(slug_field='name', many=True, queryset=ContentCategory.objects.all())
+
+
 class ComposeTreeRTTTestSerializer(StrictSerializerMixin,
                                    serializers.ModelSerializer):
     compose                 = serializers.CharField(source='variant.compose.compose_id', read_only=True)
@@ -178,3 +190,24 @@ class ComposeImageRTTTestSerializer(StrictSerializerMixin,
     class Meta:
         model = ComposeImage
         fields = ('compose', 'variant', 'arch', 'file_name', 'test_result')
+
+
+class ComposeImportJobSerializer(StrictSerializerMixin,
+                                 serializers.ModelSerializer):
+    author                  = serializers.CharField(source='author.username', read_only=True)
+    compose                 = serializers.CharField(source='compose_id', read_only=True)
+    changeset               = serializers.PrimaryKeyRelatedField(read_only=True)
+    progress                = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ComposeImportJob
+        fields = ('id', 'author', 'release_id', 'status', 'created_on', 'started_on',
+                  'finished_on', 'progress', 'compose', 'imported_rpms', 'imported_images',
+                  'set_locations', 'changeset', 'error')
+        read_only_fields = fields
+
+    def get_progress(self, obj):
+        from . import jobs
+        if obj.status in (ComposeImportJob.QUEUED, ComposeImportJob.RUNNING):
+            return jobs.get_progress(obj.pk)
+        return None
@@ -0,0 +1,151 @@
+#
+# Copyright (c) 2018 Red Hat
+# Licensed under The MIT License (MIT)
+# http://opensource.org/licenses/MIT
+#
+"""
+Incremental parsing of compose import requests.
+
+The RPM manifest of a big compose can have hundreds of megabytes. Instead of
+loading the whole request body, this module walks it with `ijson` and spools
+the RPMs into a temporary file. Everything else in the request (release id,
+composeinfo, image manifest, ...) is small and is built as usual.
+"""
+import json
+import tempfile
+
+import ijson
+from ijson.common import JSONError, ObjectBuilder
+from productmd.rpms import Rpms
+from rest_framework import exceptions
+
+from pdc.apps.common import hacks as common_hacks
+
+
+def _next_event(events):
+    try:
+        return next(events)
+    except StopIteration:
+        raise exceptions.ParseError('JSON parse error - unexpected end of data')
+
+
+def _expect(events, expected):
+    _, event, _ = _next_event(events)
+    if event != expected:
+        raise exceptions.ParseError('JSON parse error - expected %s, got %s' % (expected, event))
+
+
+def _iter_keys(events):
+    """
+    Yield keys of the object that is just being parsed. The caller must
+    consume the value after each key.
+    """
+    while True:
+        _, event, value = _next_event(events)
+        if event == 'end_map':
+            return
+        yield value
+
+
+def _build_value(events):
+    """Build the next complete JSON value from the event stream."""
+    builder = ObjectBuilder()
+    depth = 0
+    while True:
+        _, event, value = _next_event(events)
+        builder.event(event, value)
+        if event in ('start_map', 'start_array'):
+            depth += 1
+        elif event in ('end_map', 'end_array'):
+            depth -= 1
+        if depth == 0:
+            return builder.value
+
+
+class StreamedRpms(Rpms):
+    """
+    RPM manifest whose RPMs are not kept in memory. The header and compose
+    are deserialized as usual, RPMs are available via `iter_rpms`.
+
+    Only manifests in format 1.0 and newer can be streamed; older manifests
+    are loaded completely.
+    """
+    def __init__(self):
+        super(StreamedRpms, self).__init__()
+        self.spool = tempfile.TemporaryFile()
+        self.legacy = None
+
+    def load_events(self, events):
+        data = {'payload': {'rpms': {}}}
+        _expect(events, 'start_map')
+        for key in _iter_keys(events):
+            if key != 'payload':
+                data[key] = _build_value(events)
+                continue
+            _expect(events, 'start_map')
+            for payload_key in _iter_keys(events):
+                if payload_key == 'rpms':
+                    self._spool_rpms(events)
+                else:
+                    data['payload'][payload_key] = _build_value(events)
+
+        if 'manifest' in data['payload']:
+            # Format 0.3 needs to be converted by productmd.
+            self.legacy = Rpms()
+            common_hacks.deserialize_wrapper(self.legacy.deserialize, data)
+            self.header = self.legacy.header
+            self.compose = self.legacy.compose
+        else:
+            common_hacks.deserialize_wrapper(self.deserialize, data)
+
+    def _spool_rpms(self, events):
+        _expect(events, 'start_map')
+        for variant in _iter_keys(events):
+            _expect(events, 'start_map')
+            for arch in _iter_keys(events):
+                _expect(events, 'start_map')
+                for srpm_nevra in _iter_keys(events):
+                    _expect(events, 'start_map')
+                    for rpm_nevra in _iter_keys(events):
+                        rpm_data = _build_value(events)
+                        self.spool.write(json.dumps([variant, arch, srpm_nevra, rpm_nevra, rpm_data]))
+                        self.spool.write('\n')
+
+    def iter_rpms(self):
+        """
+        Iterate over all RPMs in the manifest as `(variant_uid, arch,
+        srpm_nevra, rpm_nevra, rpm_data)` tuples.
+        """
+        if self.legacy:
+            for variant, arches in self.legacy.rpms.iteritems():
+                for arch, srpms in arches.iteritems():
+                    for srpm_nevra, rpms in srpms.iteritems():
+                        for rpm_nevra, rpm_data in rpms.iteritems():
+                            yield variant, arch, srpm_nevra, rpm_nevra, rpm_data
+            return
+        self.spool.seek(0)
+        for line in self.spool:
+            yield tuple(json.loads(line))
+
+
+def parse_import_request(stream):
+    """
+    Parse body of a compose import request. The `rpm_manifest` value is
+    returned as `StreamedRpms` instance, all other values are returned as
+    they are.
+    """
+    data = {}
+    if stream is None:
+        return data
+    events = iter(ijson.parse(stream))
+    try:
+        _expect(events, 'start_map')
+        for key in _iter_keys(events):
+            if key == 'rpm_manifest':
+                data[key] = StreamedRpms()
+                data[key].load_events(events)
+            else:
+                data[key] = _build_value(events)
+    except JSONError as e:
+        raise exceptions.ParseError('JSON parse error - %s' % e)
+    return data
@@ -9,21 +9,28 @@ import mock
 from StringIO import StringIO
 
 from django.urls import reverse
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.test.client import Client
 from rest_framework.test import APITestCase
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from django.apps import apps
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.core.management import call_command
 
 from pdc.apps.bindings import models as binding_models
+from pdc.apps.changeset.models import Changeset
 from pdc.apps.common.test_utils import create_user, TestCaseWithChangeSetMixin
 from pdc.apps.common.constants import PDC_WARNING_HEADER_NAME
 from pdc.apps.release.models import Release, ProductVersion
+from pdc.apps.repository.models import ContentCategory
 from pdc.apps.component.models import (ReleaseComponent,
                                        BugzillaComponent)
 import pdc.apps.release.models as release_models
 import pdc.apps.common.models as common_models
-from . import models
+import pdc.apps.package.models as package_models
+from . import lib, models
 
 
 def _delete_compose(compose_id):
@@ -82,6 +89,20 @@ class FindComposeByReleaseRPMTestCase(APITestCase):
                           {'compose': 'compose-2', 'packages': ['bash-0:1.2.3-4.b1.x86_64.rpm']},
                           {'compose': 'compose-3', 'packages': ['bash-0:5.6.7-8.x86_64.rpm']}])
 
+    def test_order_by_version_matches_comparing_composes(self):
+        composes = models.Compose.objects.all()
+        self.assertEqual(list(models.Compose.order_by_version(composes)), sorted(composes))
+        self.assertEqual(list(models.Compose.order_by_version(composes, reverse=True)),
+                         sorted(composes, reverse=True))
+
+    def test_latest_compose_is_selected_by_database(self):
+        url = reverse('findcomposebyrr-list', kwargs={'rpm_name': 'bash', 'release_id': 'release-1.0'})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, {'latest': 'True'})
+        compose_queries = [q['sql'] for q in queries if q['sql'].startswith('SELECT "compose_compose"')]
+        self.assertEqual(len(compose_queries), 1)
+        self.assertIn('LIMIT 1', compose_queries[0])
+
     def test_get_for_release_exclude_deleted(self):
         _delete_compose('compose-1')
         url = reverse('findcomposebyrr-list', kwargs={'rpm_name': 'bash', 'release_id': 'release-1.0'})
@@ -903,6 +924,22 @@ class OverridesRPMAPITestCase(TestCaseWithChangeSetMixin, APITestCase):
         self.assertEqual(models.OverrideRPM.objects.count(), 0)
         self.assertItemsEqual(response.data, [self.override_rpm, self.do_not_delete_orpm])
 
+    def test_clear_count_only(self):
+        for rpm_arch in ('src', 'ppc64', 's390x'):
+            models.OverrideRPM.objects.create(release=self.release, variant="Server", arch="x86_64",
+                                              rpm_name="bash-doc", rpm_arch=rpm_arch, include=True,
+                                              srpm_name="bash")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(reverse('overridesrpm-list') + '?count_only=1',
+                                          {'release': 'release-1.0'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'count': 4})
+        self.assertEqual(models.OverrideRPM.objects.count(), 0)
+        self.assertNumChanges([4])
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('DELETE FROM "compose_overriderpm"')]), 1)
+        change = Changeset.objects.get().change_set.get(target_id=1)
+        self.assertEqual(json.loads(change.old_value), self.override_rpm)
+
     def test_delete_two_by_id(self):
         override = models.OverrideRPM.objects.create(release=self.release, variant="Server",
                                                      arch="x86_64", rpm_name="bash-doc",
@@ -950,6 +987,42 @@ class OverridesRPMCloneAPITestCase(TestCaseWithChangeSetMixin, APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertNumChanges([1, 1])
 
+    def test_clone_overridesRPM_count_only(self):
+        target = release_models.Release.objects.get(release_id='release-3.0')
+        for rpm_arch in ('src', 'ppc64', 's390x'):
+            models.OverrideRPM.objects.create(release=self.release, variant='Server', arch='x86_64',
+                                              srpm_name='bash', rpm_name='bash-doc', rpm_arch=rpm_arch,
+                                              include=False, do_not_delete=True, comment='keep')
+        # Present in target with a different comment, is not copied.
+        models.OverrideRPM.objects.create(release=target, variant='Server', arch='x86_64',
+                                          srpm_name='bash', rpm_name='bash-doc', rpm_arch='src',
+                                          include=False, comment='other')
+        response = self.client.post(reverse('overridesrpmclone-list') + '?count_only=1',
+                                    {'source_release_id': 'release-1.0',
+                                     'target_release_id': 'release-3.0'},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.content)
+        self.assertEqual(response.data, {'count': 3})
+        self.assertNumChanges([3])
+        cloned = models.OverrideRPM.objects.filter(release=target, comment='keep')
+        self.assertEqual(sorted(cloned.values_list('rpm_arch', flat=True)), ['ppc64', 's390x'])
+        self.assertEqual(set(cloned.values_list('include', 'do_not_delete')), {(True, False)})
+        self.assertEqual(models.OverrideRPM.objects.get(release=target, rpm_arch='src').comment, 'other')
+
+    def test_clone_overridesRPM_with_filter_returns_created(self):
+        models.OverrideRPM.objects.create(release=self.release, variant='Server', arch='x86_64',
+                                          srpm_name='bash', rpm_name='bash-debuginfo', rpm_arch='x86_64')
+        response = self.client.post(reverse('overridesrpmclone-list'),
+                                    {'source_release_id': 'release-1.0',
+                                     'target_release_id': 'release-3.0',
+                                     'rpm_name': 'bash-debuginfo'},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.content)
+        self.assertEqual(response.data, [{'release_id': 'release-3.0', 'variant': 'Server', 'arch': 'x86_64',
+                                          'srpm_name': 'bash', 'rpm_name': 'bash-debuginfo',
+                                          'rpm_arch': 'x86_64', 'include': True, 'comment': '',
+                                          'do_not_delete': False}])
+
     def test_clone_overridesRPM_with_orpm_existed_in_target_release(self):
         args = {"name": "Supplementary", "short": "supp", "version": "1.1",
                 "release_type": "ga"}
@@ -1073,8 +1146,8 @@ class ComposeRPMViewAPITestCase(TestCaseWithChangeSetMixin, APITestCase):
         self.client.post(reverse('releaseimportcomposeinfo-list'),
                          self.compose_info, format='json')
         # Caching ids makes it faster, but the cache needs to be cleared for each test.
-        models.Path.CACHE = {}
-        common_models.SigKey.CACHE = {}
+        models.Path.CACHE.clear()
+        common_models.SigKey.CACHE.clear()
 
     def test_import_inconsistent_data(self):
         self.manifest10['payload']['compose']['id'] = 'TP-1.0-20150315.0'
@@ -1085,6 +1158,29 @@ class ComposeRPMViewAPITestCase(TestCaseWithChangeSetMixin, APITestCase):
                                     format='json')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_import_builds_rpm_mapping_snapshot(self):
+        response = self.client.post(reverse('composerpm-list'),
+                                    {'rpm_manifest': self.manifest10,
+                                     'release_id': 'tp-1.0',
+                                     'composeinfo': self.compose_info},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.content)
+        snapshot = models.ReleaseRPMMappingSnapshot.objects.get(release__release_id='tp-1.0')
+        self.assertEqual(snapshot.compose.compose_id, 'TP-1.0-20150310.0')
+        mapping, _ = snapshot.compose.get_rpm_mapping('dummypython')
+        stored = models.ReleaseRPMMapping.objects.get(release__release_id='tp-1.0', srpm_name='dummypython')
+        self.assertEqual(stored.get_mapping(), mapping.get_pure_dict())
+
+        response = self.client.post(reverse('overridesrpm-list'),
+                                    {'release': 'tp-1.0', 'variant': 'Server', 'arch': 'x86_64',
+                                     'srpm_name': 'dummypython', 'rpm_name': 'dummypython-doc',
+                                     'rpm_arch': 'noarch', 'include': True},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.get(reverse('releaserpmmapping-detail', args=['tp-1.0', 'dummypython']))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['mapping']['Server']['x86_64']['dummypython-doc'], ['noarch'])
+
     def test_import_and_retrieve_manifest_1_0(self):
         self.assertEqual(models.ComposeRelPath.objects.count(), 0)
         response = self.client.post(reverse('composerpm-list'),
@@ -1139,6 +1235,35 @@ class ComposeRPMViewAPITestCase(TestCaseWithChangeSetMixin, APITestCase):
         self.assertEqual(response.data.get('compose'), 'TP-1.0-20150310.0')
         self.assertEqual(response.data.get('imported rpms'), 6)
 
+    def test_import_reuses_existing_rpms(self):
+        rpm = package_models.RPM.objects.create(name='dummypython', epoch=0, version='1.2', release='3.el6',
+                                                arch='src', srpm_name='dummypython',
+                                                filename='dummypython-1.2-3.el6.src.rpm')
+        response = self.client.post(reverse('composerpm-list'),
+                                    {'rpm_manifest': self.manifest12,
+                                     'release_id': 'tp-1.0',
+                                     'composeinfo': self.compose_info},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(package_models.RPM.objects.filter(name='dummypython', arch='src').count(), 1)
+        self.assertTrue(models.ComposeRPM.objects.filter(rpm=rpm).exists())
+        self.assertEqual(models.ComposeRPM.objects.count(), 6)
+
+    def test_reimport_reuses_variants_and_paths(self):
+        data = {'rpm_manifest': self.manifest12, 'release_id': 'tp-1.0', 'composeinfo': self.compose_info}
+        response = self.client.post(reverse('composerpm-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        counts = [model.objects.count() for model in (models.Variant, models.VariantArch,
+                                                      models.PathType, models.ComposeRelPath)]
+        self.assertEqual(models.VariantArch.objects.filter(rtt_testing_status__name='untested').count(),
+                         counts[1])
+        response = self.client.post(reverse('composerpm-list'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(counts, [model.objects.count() for model in (models.Variant, models.VariantArch,
+                                                                      models.PathType, models.ComposeRelPath)])
+        last_changeset = Changeset.objects.latest('id')
+        self.assertEqual(set(last_changeset.change_set.values_list('target_class', flat=True)), set(['notice']))
+
     def test_import_manifest_with_extra_param(self):
         response = self.client.post(reverse('composerpm-list'),
                                     {'rpm_manifest': self.manifest10,
@@ -1148,6 +1273,38 @@ class ComposeRPMViewAPITestCase(TestCaseWithChangeSetMixin, APITestCase):
                                     format='json')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_bulk_import(self):
+        response = self.client.post(reverse('composerpm-list'),
+                                    [{'rpm_manifest': self.manifest10,
+                                      'release_id': 'tp-1.0',
+                                      'composeinfo': self.compose_info}],
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, [{'compose': 'TP-1.0-20150310.0', 'imported rpms': 6}])
+        self.assertEqual(models.ComposeRPM.objects.count(), 6)
+
+
+@override_settings(COMPOSE_IMPORT_STREAMING=True)
+class ComposeRPMViewStreamingAPITestCase(ComposeRPMViewAPITestCase):
+    """Repeat the import tests with RPM manifest parsed incrementally."""
+
+    def test_bulk_import(self):
+        # Streamed bodies must contain a single import.
+        response = self.client.post(reverse('composerpm-list'),
+                                    [{'rpm_manifest': self.manifest10,
+                                      'release_id': 'tp-1.0',
+                                      'composeinfo': self.compose_info}],
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(models.ComposeRPM.objects.count(), 0)
+
+    def test_import_malformed_json(self):
+        response = self.client.post(reverse('composerpm-list'),
+                                    '{"release_id": "tp-1.0", "rpm_manifest": {',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(models.ComposeRPM.objects.count(), 0)
+
 
 class ComposeImageAPITestCase(TestCaseWithChangeSetMixin, APITestCase):
     def setUp(self):
@@ -1160,7 +1317,7 @@ class ComposeImageAPITestCase(TestCaseWithChangeSetMixin, APITestCase):
         self.client.post(reverse('releaseimportcomposeinfo-list'),
                          self.compose_info, format='json')
         # Caching ids makes it faster, but the cache needs to be cleared for each test.
-        models.Path.CACHE = {}
+        models.Path.CACHE.clear()
 
     def test_import_images_1_0(self):
         self.assertEqual(models.ComposeRelPath.objects.count(), 0)
@@ -1188,6 +1345,22 @@ class ComposeImageAPITestCase(TestCaseWithChangeSetMixin, APITestCase):
         self.assertEqual(response.data.get('compose'), 'TP-1.0-20150310.0')
         self.assertEqual(response.data.get('imported images'), 4)
 
+    def test_import_reuses_existing_images(self):
+        image = package_models.Image.objects.create(
+            file_name='TP-1.0-20150310.0-Server-ppc64-boot.iso', sha256='5' * 64,
+            image_format=package_models.ImageFormat.objects.get(name='iso'),
+            image_type=package_models.ImageType.objects.get(name='boot'),
+            disc_number=1, disc_count=1, arch='ppc64', mtime=0, size=0)
+        response = self.client.post(reverse('composeimage-list'),
+                                    {'image_manifest': self.manifest10,
+                                     'release_id': 'tp-1.0',
+                                     'composeinfo': self.compose_info},
+                                    format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.content)
+        self.assertEqual(package_models.Image.objects.count(), 4)
+        self.assertEqual(models.ComposeImage.objects.count(), 4)
+        self.assertEqual(models.ComposeImage.objects.get(image=image).variant_arch.arch.name, 'ppc64')
+
     def test_import_images_with_extra_param(self):
         response = self.client.post(reverse('composeimage-list'),
                                     {'image_manifest': self.manifest10,
@@ -1253,8 +1426,8 @@ class ComposeFullImportViewAPITestCase(TestCaseWithChangeSetMixin, APITestCase):
         self.client.post(reverse('releaseimportcomposeinfo-list'),
                          self.compose_info, format='json')
         # Caching ids makes it faster, but the cache needs to be cleared for each test.
-        models.Path.CACHE = {}
-        common_models.SigKey.CACHE = {}
+        models.Path.CACHE.clear()
+        common_models.SigKey.CACHE.clear()
 
     def test_import_and_retrieve_manifest_1_0(self):
         response = self.client.post(reverse('composefullimport-list'),
@@ -1355,6 +1528,48 @@ class ComposeFullImportViewAPITestCase(TestCaseWithChangeSetMixin, APITestCase):
         response = self.client.get(reverse('composetreelocations-list'), {})
         self.assertEqual(response.data['count'], 5)
 
+    def _full_import(self, **kwargs):
+        data = {'rpm_manifest': self.rpms12,
+                'image_manifest': self.images12,
+                'release_id': 'tp-1.0',
+                'composeinfo': self.compose_info,
+                'location': 'NAY',
+                'scheme': 'http',
+                'url': 'abc.com'}
+        data.update(kwargs)
+        return self.client.post(reverse('composefullimport-list'), data, format='json')
+
+    def test_reimport_updates_tree_locations(self):
+        response = self._full_import()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.content)
+        response = self._full_import(scheme='nfs', url='nfs.example.com')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.content)
+        self.assertEqual(response.data.get('set_locations'), 5)
+        trees = models.ComposeTree.objects.all()
+        self.assertEqual(len(trees), 5)
+        for tree in trees:
+            self.assertEqual(tree.scheme.name, 'nfs')
+            self.assertEqual(tree.url, 'nfs.example.com')
+            self.assertEqual(set(tree.synced_content.values_list('name', flat=True)),
+                             set(ContentCategory.objects.values_list('name', flat=True)))
+
+    def test_import_with_unknown_location_writes_nothing(self):
+        response = self._full_import(location='XYZ')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('location', response.data)
+        self.assertEqual(models.ComposeTree.objects.count(), 0)
+        self.assertEqual(models.ComposeRPM.objects.count(), 0)
+
+    def test_set_locations_of_unknown_arch(self):
+        response = self._full_import()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.content)
+        variant = models.Variant.objects.filter(compose__compose_id='TP-1.0-20150310.0').first()
+        with self.assertRaises(ValidationError) as ctx:
+            lib.bulk_set_compose_tree_locations('TP-1.0-20150310.0', [(variant.variant_uid, 'ppc64')],
+                                                'NAY', 'abc.com', 'http', [])
+        self.assertEqual(ctx.exception.detail,
+                         {'detail': ['Arch ppc64 does not exist in given compose/variant branch']})
+
     def test_import_manifest_with_extra_param(self):
         response = self.client.post(reverse('composefullimport-list'),
                                     {'rpm_manifest': self.rpms12,
@@ -1443,6 +1658,231 @@ class ComposeFullImportViewAPITestCase(TestCaseWithChangeSetMixin, APITestCase):
         self.assertEqual(response.data['count'], 0)
 
 
+@override_settings(COMPOSE_IMPORT_STREAMING=True)
+class ComposeFullImportViewStreamingAPITestCase(ComposeFullImportViewAPITestCase):
+    """Repeat the full import tests with RPM manifest parsed incrementally."""
+
+
+class ComposeImportJobAPITestCase(TestCaseWithChangeSetMixin, APITestCase):
+    fixtures = [
+        "pdc/apps/compose/fixtures/tests/location.json",
+        "pdc/apps/compose/fixtures/tests/scheme.json",
+    ]
+
+    def setUp(self):
+        with open('pdc/apps/release/fixtures/tests/composeinfo-0.3.json', 'r') as f:
+            self.compose_info = json.loads(f.read())
+        with open('pdc/apps/compose/fixtures/tests/rpms-1.0.json', 'r') as f:
+            self.rpm_manifest = json.loads(f.read())
+        with open('pdc/apps/compose/fixtures/tests/images-1.0.json', 'r') as f:
+            self.image_manifest = json.loads(f.read())
+        self.client.post(reverse('releaseimportcomposeinfo-list'),
+                         self.compose_info, format='json')
+        models.Path.CACHE.clear()
+        common_models.SigKey.CACHE.clear()
+        self.data = {'rpm_manifest': self.rpm_manifest,
+                     'image_manifest': self.image_manifest,
+                     'release_id': 'tp-1.0',
+                     'composeinfo': self.compose_info,
+                     'location': 'NAY',
+                     'scheme': 'http',
+                     'url': 'abc.com'}
+
+    def _run_jobs(self):
+        from . import jobs
+        jobs.run_pending()
+
+    def test_import_in_background(self):
+        response = self.client.post(reverse('composeimportjob-list'), self.data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'queued')
+        self.assertEqual(response.data['release_id'], 'tp-1.0')
+        self.assertEqual(response['Location'],
+                         'http://testserver' + reverse('composeimportjob-detail', args=[response.data['id']]))
+        self.assertEqual(models.ComposeRPM.objects.count(), 0)
+
+        messenger = apps.get_app_config('messaging').messenger
+        with messenger.listen() as messages:
+            self._run_jobs()
+        self.assertEqual([topic for topic, _ in messages], ['.compose', '.rpms', '.images'])
+        self.assertEqual(messages[0][1]['compose_id'], 'TP-1.0-20150310.0')
+
+        response = self.client.get(reverse('composeimportjob-detail', args=[response.data['id']]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'finished', response.data['error'])
+        self.assertEqual(response.data['compose'], 'TP-1.0-20150310.0')
+        self.assertEqual(response.data['imported_rpms'], 6)
+        self.assertEqual(response.data['imported_images'], 4)
+        self.assertEqual(response.data['set_locations'], 5)
+        self.assertIsNone(response.data['progress'])
+        self.assertNumChanges([11, 72])
+        self.assertEqual(response.data['changeset'], models.ComposeImportJob.objects.get().changeset_id)
+        self.assertEqual(models.ComposeRPM.objects.count(), 6)
+        self.assertEqual(models.ComposeImage.objects.count(), 4)
+
+    def test_job_data_are_stored(self):
+        response = self.client.post(reverse('composeimportjob-list'), self.data, format='json',
+                                    HTTP_PDC_CHANGE_COMMENT='Big compose')
+        job = models.ComposeImportJob.objects.get(pk=response.data['id'])
+        self.assertEqual(json.loads(job.payload), self.data)
+        self.assertEqual(job.comment, 'Big compose')
+        self._run_jobs()
+        job = models.ComposeImportJob.objects.get(pk=response.data['id'])
+        self.assertEqual(job.status, 'finished')
+        self.assertEqual(job.payload, '')
+        self.assertEqual(job.changeset.comment, 'Big compose')
+
+    def test_job_of_dead_worker_is_queued_again(self):
+        from . import jobs
+        response = self.client.post(reverse('composeimportjob-list'), self.data, format='json')
+        self.assertEqual(jobs.claim(), response.data['id'])
+        models.ComposeImportJob.objects.update(worker='%s:%d' % (jobs.socket.gethostname(), 2 ** 22 + 1))
+        self.assertEqual(jobs.recover(), [response.data['id']])
+        self.assertEqual(models.ComposeImportJob.objects.get().status, 'queued')
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(models.ComposeImportJob.objects.get().status, 'finished')
+
+    def test_running_job_of_live_worker_is_kept(self):
+        from . import jobs
+        self.client.post(reverse('composeimportjob-list'), self.data, format='json')
+        jobs.claim()
+        self.assertEqual(jobs.recover(), [])
+        self.assertEqual(models.ComposeImportJob.objects.get().status, 'running')
+        self.assertIsNone(jobs.claim())
+
+    def test_run_jobs_command(self):
+        self.client.post(reverse('composeimportjob-list'), self.data, format='json')
+        call_command('run_compose_import_jobs', once=True, stdout=StringIO())
+        self.assertEqual(models.ComposeImportJob.objects.get().status, 'finished')
+        self.assertEqual(models.ComposeRPM.objects.count(), 6)
+
+    def test_failed_import_is_rolled_back(self):
+        self.data['scheme'] = 'nonexisting'
+        response = self.client.post(reverse('composeimportjob-list'), self.data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self._run_jobs()
+        response = self.client.get(reverse('composeimportjob-detail', args=[response.data['id']]))
+        self.assertEqual(response.data['status'], 'failed')
+        self.assertIn('nonexisting', response.data['error'])
+        self.assertIsNone(response.data['changeset'])
+        self.assertNumChanges([11])
+        self.assertEqual(models.ComposeRPM.objects.count(), 0)
+
+    def test_missing_parameters(self):
+        del self.data['rpm_manifest']
+        response = self.client.post(reverse('composeimportjob-list'), self.data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(models.ComposeImportJob.objects.count(), 0)
+
+    def test_unknown_release(self):
+        self.data['release_id'] = 'nonexisting-1.0'
+        response = self.client.post(reverse('composeimportjob-list'), self.data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(models.ComposeImportJob.objects.count(), 0)
+
+    def test_manifest_is_parsed_only_by_worker(self):
+        from . import jobs
+        with mock.patch.object(jobs, 'load_payload', wraps=jobs.load_payload) as load_payload:
+            response = self.client.post(reverse('composeimportjob-list'), self.data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            self.assertFalse(load_payload.called)
+            self._run_jobs()
+            self.assertEqual(load_payload.call_count, 1)
+        self.assertEqual(models.ComposeImportJob.objects.get().status, 'finished')
+
+    def test_malformed_data(self):
+        for body in ('[]', '{"release_id": "tp-1.0", "rpm_manifest": {}', '{"release_id" "tp-1.0"}'):
+            response = self.client.post(reverse('composeimportjob-list'), body,
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, body)
+        self.assertEqual(models.ComposeImportJob.objects.count(), 0)
+
+    def test_filter_by_status(self):
+        self.client.post(reverse('composeimportjob-list'), self.data, format='json')
+        response = self.client.get(reverse('composeimportjob-list'), {'status': 'queued'})
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['results'][0]['progress'], {})
+        response = self.client.get(reverse('composeimportjob-list'), {'status': 'finished'})
+        self.assertEqual(response.data['count'], 0)
+
+
+@override_settings(COMPOSE_IMPORT_STREAMING=True)
+class ComposeImportJobStreamingAPITestCase(ComposeImportJobAPITestCase):
+    """Repeat the import job tests with RPM manifest parsed incrementally."""
+
+
+class ComposeRPMDiffAPITestCase(APITestCase):
+    fixtures = [
+        "pdc/apps/common/fixtures/test/sigkey.json",
+        "pdc/apps/package/fixtures/test/rpm.json",
+        "pdc/apps/release/fixtures/tests/release.json",
+        "pdc/apps/compose/fixtures/tests/variant.json",
+        "pdc/apps/compose/fixtures/tests/variant_arch.json",
+        "pdc/apps/compose/fixtures/tests/compose.json",
+        "pdc/apps/compose/fixtures/tests/compose_composerpm.json",
+    ]
+
+    def setUp(self):
+        compose = models.Compose.objects.get(compose_id='compose-1')
+        new_compose = models.Compose.objects.create(release=compose.release,
+                                                    compose_id='compose-2',
+                                                    compose_date=compose.compose_date,
+                                                    compose_type=compose.compose_type,
+                                                    compose_respin=2)
+        variant = models.Variant.objects.create(compose=new_compose, variant_id='Server', variant_uid='Server',
+                                                variant_name='Server', variant_type_id=1)
+        variant_arch = models.VariantArch.objects.create(variant=variant, arch_id=47)
+        for name, version in (('bash', '1.2.4'), ('zsh', '5.0')):
+            rpm = package_models.RPM.objects.create(name=name, epoch=0, version=version, release='1',
+                                                    arch='x86_64', srpm_name=name,
+                                                    srpm_nevra='%s-0:%s-1.src' % (name, version),
+                                                    filename='%s-%s-1.x86_64.rpm' % (name, version))
+            models.ComposeRPM.objects.create(variant_arch=variant_arch, rpm=rpm, sigkey_id=1,
+                                             content_category_id=1, path_id=1)
+
+    def _get_diff(self, old, new, **kwargs):
+        response = self.client.get(reverse('composerpmdiff-list', args=[old, new]), **kwargs)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return json.loads(''.join(response.streaming_content))
+
+    def test_diff(self):
+        self.assertEqual(self._get_diff('compose-1', 'compose-2'), [
+            {'variant': 'Server', 'arch': 'x86_64',
+             'added': ['zsh-0:5.0-1.x86_64'],
+             'removed': ['bash-doc-0:1.2.3-4.b2.x86_64'],
+             'upgraded': [{'from': 'bash-0:1.2.3-4.b1.x86_64', 'to': 'bash-0:1.2.4-1.x86_64'}],
+             'downgraded': []},
+            {'variant': 'Server2', 'arch': 'x86_64',
+             'added': [],
+             'removed': ['bash-doc-0:1.2.3-4.b2.x86_64'],
+             'upgraded': [],
+             'downgraded': []},
+        ])
+
+    def test_reverse_diff(self):
+        diff = self._get_diff('compose-2', 'compose-1')
+        self.assertEqual(diff[0]['downgraded'],
+                         [{'from': 'bash-0:1.2.4-1.x86_64', 'to': 'bash-0:1.2.3-4.b1.x86_64'}])
+        self.assertEqual(diff[0]['removed'], ['zsh-0:5.0-1.x86_64'])
+        self.assertEqual(diff[1]['added'], ['bash-doc-0:1.2.3-4.b2.x86_64'])
+
+    def test_diff_with_itself_is_empty(self):
+        self.assertEqual(self._get_diff('compose-1', 'compose-1'), [])
+
+    def test_diff_is_yielded_per_variant_arch(self):
+        diff = lib.compose__rpm_diff(models.Compose.objects.get(compose_id='compose-1'),
+                                     models.Compose.objects.get(compose_id='compose-2'))
+        with self.assertNumQueries(3):
+            self.assertEqual(next(diff)['variant'], 'Server')
+        with self.assertNumQueries(0):
+            self.assertEqual(next(diff)['variant'], 'Server2')
+            self.assertRaises(StopIteration, next, diff)
+
+    def test_unknown_compose(self):
+        response = self.client.get(reverse('composerpmdiff-list', args=['compose-1', 'compose-3']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
 class RPMMappingAPITestCase(APITestCase):
     fixtures = [
         "pdc/apps/common/fixtures/test/sigkey.json",
@@ -1791,6 +2231,35 @@ class RPMMappingTestCase(TestCase):
                                       'include': False, 'release_id': 'release-1.0', 'rpm_name': 'bash',
                                       'srpm_name': 'bash', 'rpm_arch': 'x86_64'})
 
+    def _create_useless_overrides(self):
+        release = self.compose.release
+        self.deletable = models.OverrideRPM.objects.create(release=release, variant='Server', arch='x86_64',
+                                                           srpm_name='bash', rpm_name='bash', rpm_arch='x86_64',
+                                                           include=True)
+        self.kept = models.OverrideRPM.objects.create(release=release, variant='Server', arch='x86_64',
+                                                      srpm_name='bash', rpm_name='bash', rpm_arch='ppc64',
+                                                      include=False, do_not_delete=True)
+
+    def test_get_mapping_does_not_delete_useless_overrides(self):
+        self._create_useless_overrides()
+        with self.assertNumQueries(5):
+            mapping, useless = self.compose.get_rpm_mapping('bash')
+        self.assertEqual(useless, [self.kept])
+        self.assertEqual(mapping.deletable_overrides, [self.deletable])
+        self.assertEqual(models.OverrideRPM.objects.count(), 3)
+
+    def test_delete_useless_overrides(self):
+        self._create_useless_overrides()
+        self.assertEqual(models.OverrideRPM.delete_useless(), 1)
+        self.assertEqual(set(models.OverrideRPM.objects.values_list('pk', flat=True)), {1, self.kept.pk})
+
+    def test_delete_useless_overrides_command(self):
+        self._create_useless_overrides()
+        out = StringIO()
+        call_command('delete_useless_overrides', 'release-1.0', stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Deleted 1 overrides')
+        self.assertFalse(models.OverrideRPM.objects.filter(pk=self.deletable.pk).exists())
+
 
 class OverrideManagementTestCase(TestCase):
     fixtures = [
@@ -2445,6 +2914,16 @@ class UselessOverrideTestCase(TestCase):
     def setUp(self):
         self.release = release_models.Release.objects.latest('id')
 
+    def _assert_unused_override_is_deletable(self, orpm):
+        client = Client()
+        with mock.patch('sys.stdout', new_callable=StringIO) as out:
+            response = client.get('/override/manage/release-1.0/', {'package': 'bash'})
+        self.assertEqual(out.getvalue(), '')
+        self.assertEqual(response.context['useless_overrides'], [])
+        self.assertEqual(models.OverrideRPM.objects.count(), 2)
+        mapping, _ = self.release.get_latest_compose().get_rpm_mapping('bash')
+        self.assertEqual(mapping.deletable_overrides, [orpm])
+
     def test_delete_unused_include_override(self):
         orpm = models.OverrideRPM.objects.create(release=self.release,
                                                  variant='Server',
@@ -2453,13 +2932,9 @@ class UselessOverrideTestCase(TestCase):
                                                  rpm_name='bash',
                                                  rpm_arch='x86_64',
                                                  include=True)
-        client = Client()
-        with mock.patch('sys.stdout', new_callable=StringIO) as out:
-            response = client.get('/override/manage/release-1.0/', {'package': 'bash'})
-            self.assertEqual(response.context['useless_overrides'], [])
-            self.assertIn('NOTICE', out.getvalue())
-            self.assertIn(str(orpm), out.getvalue())
-        self.assertEqual(models.OverrideRPM.objects.count(), 1)
+        self._assert_unused_override_is_deletable(orpm)
+        self.assertEqual(models.OverrideRPM.delete_useless(), 1)
+        self.assertFalse(models.OverrideRPM.objects.filter(pk=orpm.pk).exists())
 
     def test_delete_unused_exclude_override(self):
         orpm = models.OverrideRPM.objects.create(release=self.release,
@@ -2469,13 +2944,9 @@ class UselessOverrideTestCase(TestCase):
                                                  rpm_name='bash-missing',
                                                  rpm_arch='x86_64',
                                                  include=False)
-        client = Client()
-        with mock.patch('sys.stdout', new_callable=StringIO) as out:
-            response = client.get('/override/manage/release-1.0/', {'package': 'bash'})
-            self.assertEqual(response.context['useless_overrides'], [])
-            self.assertIn('NOTICE', out.getvalue())
-            self.assertIn(str(orpm), out.getvalue())
-        self.assertEqual(models.OverrideRPM.objects.count(), 1)
+        self._assert_unused_override_is_deletable(orpm)
+        self.assertEqual(models.OverrideRPM.delete_useless([self.release]), 1)
+        self.assertFalse(models.OverrideRPM.objects.filter(pk=orpm.pk).exists())
 
     def test_delete_unused_exclude_override_on_new_variant_arch(self):
         orpm = models.OverrideRPM.objects.create(release=self.release,
@@ -2485,13 +2956,11 @@ class UselessOverrideTestCase(TestCase):
                                                  rpm_name='bash',
                                                  rpm_arch='rpm_arch',
                                                  include=False)
-        client = Client()
-        with mock.patch('sys.stdout', new_callable=StringIO) as out:
-            response = client.get('/override/manage/release-1.0/', {'package': 'bash'})
-            self.assertEqual(response.context['useless_overrides'], [])
-            self.assertIn('NOTICE', out.getvalue())
-            self.assertIn(str(orpm), out.getvalue())
-        self.assertEqual(models.OverrideRPM.objects.count(), 1)
+        self._assert_unused_override_is_deletable(orpm)
+        out = StringIO()
+        call_command('delete_useless_overrides', self.release.release_id, stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Deleted 1 overrides')
+        self.assertFalse(models.OverrideRPM.objects.filter(pk=orpm.pk).exists())
 
     def test_do_not_delete_unused_include_override(self):
         orpm = models.OverrideRPM.objects.create(release=self.release,
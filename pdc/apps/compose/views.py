@@ -14,17 +14,20 @@ from django.conf import settings
 from kobo.django.views.generic import DetailView, SearchView
 from django.views.generic import View
 from django.forms.formsets import formset_factory
+from django.views.decorators.cache import never_cache
 from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import redirect, get_object_or_404
 from django.contrib import messages
 from django.shortcuts import render
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework import viewsets, mixins, status, serializers
 from django.db.models import Q
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
 
 from contrib.bulk_operations import bulk_operations
 
+from pdc.apps.package.models import RPM
 from pdc.apps.package.serializers import RPMSerializer
 from pdc.apps.common.models import Arch, SigKey
 from pdc.apps.common.hacks import bool_from_native, convert_str_to_bool, as_dict
@@ -42,14 +45,15 @@ from pdc.apps.utils.utils import generate_warning_header_dict
 from pdc.apps.auth.permissions import APIPermission
 from .models import (Compose, VariantArch, Variant, ComposeRPM, OverrideRPM,
                      ComposeImage, ComposeRPMMapping, ComposeAcceptanceTestingState,
-                     ComposeTree)
+                     ComposeTree, ComposeImportJob, ReleaseRPMMappingSnapshot)
 from .forms import (ComposeSearchForm, ComposeRPMSearchForm, ComposeImageSearchForm,
                     ComposeRPMDisableForm, OverrideRPMForm, VariantArchForm, OverrideRPMActionForm)
 from .serializers import (ComposeSerializer, OverrideRPMSerializer, ComposeTreeSerializer,
-                          ComposeImageRTTTestSerializer, ComposeTreeRTTTestSerializer)
+                          ComposeImageRTTTestSerializer, ComposeTreeRTTTestSerializer,
+                          ComposeImportJobSerializer)
 from .filters import (ComposeFilter, OverrideRPMFilter, ComposeTreeFilter, ComposeImageRTTTestFilter,
-                      ComposeTreeRTTTestFilter)
-from . import lib
+                      ComposeTreeRTTTestFilter, ComposeImportJobFilter)
+from . import jobs, lib
 
 
 class ComposeListView(SearchView):
@@ -739,7 +743,32 @@ class CheckParametersMixin(object):
             error_dict[key] = ["This field is required"]
 
 
-class ComposeRPMView(StrictQueryParamMixin, CheckParametersMixin, viewsets.GenericViewSet):
+class ImportDataMixin(object):
+
+    def _use_streaming(self, request):
+        use_streaming = getattr(settings, 'COMPOSE_IMPORT_STREAMING', False)
+        return use_streaming and request.content_type.startswith('application/json')
+
+    def bulk_create_allowed(self, request):
+        # Bulk create would parse the whole request body before the import
+        # can stream it.
+        return not self._use_streaming(request)
+
+    def _get_import_data(self, request):
+        """
+        Return data of an import request. With `COMPOSE_IMPORT_STREAMING`
+        enabled, JSON bodies are parsed incrementally and the RPM manifest
+        is never loaded into memory as a whole.
+        """
+        if self._use_streaming(request):
+            from . import streaming
+            # Later code may still use request.data, but the body stream
+            # can not be read again.
+            request._full_data = streaming.parse_import_request(request.stream)
+        return request.data
+
+
+class ComposeRPMView(StrictQueryParamMixin, CheckParametersMixin, ImportDataMixin, viewsets.GenericViewSet):
     permission_classes = (APIPermission,)
     lookup_field = 'compose_id'
     lookup_value_regex = '[^/]+'
@@ -793,8 +822,12 @@ class ComposeRPMView(StrictQueryParamMixin, CheckParametersMixin, viewsets.Gener
 
         You could skip the file and send the data directly to `curl`. In such a
         case use `-d @-`.
+
+        If the server has `COMPOSE_IMPORT_STREAMING` enabled, the RPM manifest
+        is processed incrementally and its size is not limited by server
+        memory.
         """
-        data = request.data
+        data = self._get_import_data(request)
         errors = {}
         fields = ['release_id', 'composeinfo', 'rpm_manifest']
         self._check_parameters(fields, data.keys(), errors)
@@ -846,7 +879,8 @@ class ComposeRPMView(StrictQueryParamMixin, CheckParametersMixin, viewsets.Gener
         return Response(manifest.serialize({}))
 
 
-class ComposeFullImportViewSet(StrictQueryParamMixin, CheckParametersMixin, viewsets.GenericViewSet):
+class ComposeFullImportViewSet(StrictQueryParamMixin, CheckParametersMixin, ImportDataMixin,
+                               viewsets.GenericViewSet):
     permission_classes = (APIPermission,)
     queryset = Compose.objects.none()    # Required for permissions.
 
@@ -905,8 +939,12 @@ class ComposeFullImportViewSet(StrictQueryParamMixin, CheckParametersMixin, view
 
         You could skip the file and send the data directly to `curl`. In such a
         case use `-d @-`.
+
+        If the server has `COMPOSE_IMPORT_STREAMING` enabled, the RPM manifest
+        is processed incrementally and its size is not limited by server
+        memory.
         """
-        data = request.data
+        data = self._get_import_data(request)
         errors = {}
         fields = ['release_id', 'composeinfo', 'rpm_manifest', 'image_manifest', 'location', 'url', 'scheme']
         self._check_parameters(fields, data.keys(), errors)
@@ -925,6 +963,116 @@ class ComposeFullImportViewSet(StrictQueryParamMixin, CheckParametersMixin, view
                         status=status.HTTP_201_CREATED)
 
 
+class ComposeImportJobViewSet(StrictQueryParamMixin, CheckParametersMixin,
+                              mixins.ListModelMixin,
+                              mixins.RetrieveModelMixin,
+                              viewsets.GenericViewSet):
+    """
+    Full compose import running in background. This is useful for big
+    composes, where the import does not finish before the request times out.
+    The import is started by creating a job and its status can be polled
+    afterwards.
+
+    The import itself works exactly like $LINK:composefullimport-list$. All
+    changes are recorded in a single changeset, which is linked from the job
+    once the import finishes. While the job is queued or running, `progress`
+    shows how far the import got.
+    """
+    permission_classes = (APIPermission,)
+    queryset = ComposeImportJob.objects.all().select_related('author').defer('payload')
+    # The request body is stored with the job as it is.
+    bulk_create = None
+    serializer_class = ComposeImportJobSerializer
+    filter_class = ComposeImportJobFilter
+
+    doc_list = """
+        __Method__: GET
+
+        __URL__: $LINK:composeimportjob-list$
+
+        __Query params__:
+
+        %(FILTERS)s
+
+        __Response__: a paged list of following objects
+
+        %(SERIALIZER)s
+    """
+
+    doc_retrieve = """
+        __Method__: GET
+
+        __URL__: $LINK:composeimportjob-detail:id$
+
+        __Response__:
+
+        %(SERIALIZER)s
+
+        The `status` is one of `queued`, `running`, `finished` and `failed`.
+        For failed jobs, `error` contains the reason of failure.
+    """
+
+    # Status of jobs changes quickly, clients polling it need fresh data.
+    @never_cache
+    def list(self, *args, **kwargs):
+        return super(ComposeImportJobViewSet, self).list(*args, **kwargs)
+
+    @never_cache
+    def retrieve(self, *args, **kwargs):
+        return super(ComposeImportJobViewSet, self).retrieve(*args, **kwargs)
+
+    def create(self, request):
+        """
+        Start full import of RPMs, images and compose tree location in
+        background.
+
+        __Method__: POST
+
+        __URL__: $LINK:composeimportjob-list$
+
+        __Data__:
+
+            {
+                "release_id": string,
+                "composeinfo": composeinfo,
+                "rpm_manifest": rpm_manifest,
+                "image_manifest": image_manifest,
+                "location": string,
+                "url": string,
+                "scheme": string
+            }
+
+        The data are the same as for $LINK:composefullimport-list$.
+
+        __Response__:
+
+        %(SERIALIZER)s
+
+        The response has status `202 Accepted`. The job detail is available
+        at URL in `Location` header.
+        """
+        payload = jobs.dump_request_data(request)
+        # The payload is only parsed as a whole by the worker.
+        keys, data = jobs.read_top_level(payload, ['release_id'])
+        errors = {}
+        fields = ['release_id', 'composeinfo', 'rpm_manifest', 'image_manifest', 'location', 'url', 'scheme']
+        self._check_parameters(fields, keys, errors)
+        if errors:
+            return Response(status=status.HTTP_400_BAD_REQUEST, data=errors)
+        get_object_or_404(Release, release_id=data['release_id'])
+        job = ComposeImportJob.objects.create(
+            author=request.user if request.user.is_authenticated else None,
+            release_id=data['release_id'],
+            payload=payload,
+            comment=request.META.get('HTTP_PDC_CHANGE_COMMENT'),
+            path=request.path,
+            base_uri=request.build_absolute_uri('/'))
+        jobs.submit(job)
+        serializer = self.get_serializer(job)
+        location = reverse('composeimportjob-detail', args=[job.pk], request=request)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED, headers={'Location': location})
+
+
 class ComposeRPMMappingView(StrictQueryParamMixin,
                             viewsets.GenericViewSet):
     """
@@ -1081,7 +1229,7 @@ class ComposeRPMMappingView(StrictQueryParamMixin,
         return bulk_operations.bulk_update_impl(self, *args, **kwargs)
 
 
-class ComposeImageView(StrictQueryParamMixin, CheckParametersMixin,
+class ComposeImageView(StrictQueryParamMixin, CheckParametersMixin, ImportDataMixin,
                        viewsets.GenericViewSet):
     permission_classes = (APIPermission,)
     queryset = ComposeImage.objects.none()  # Required for permissions
@@ -1125,7 +1273,7 @@ class ComposeImageView(StrictQueryParamMixin, CheckParametersMixin,
                      \\"release_id\\": \\"release-1.0\\" }" \\
                 $URL:composeimage-list$
         """
-        data = request.data
+        data = self._get_import_data(request)
         errors = {}
         fields = ['release_id', 'composeinfo', 'image_manifest']
         self._check_parameters(fields, data.keys(), errors)
@@ -1191,6 +1339,7 @@ class ReleaseOverridesRPMViewSet(StrictQueryParamMixin,
     queryset = OverrideRPM.objects.all().order_by('id')
     filter_class = OverrideRPMFilter
     permission_classes = (APIPermission,)
+    extra_query_params = ('count_only', )
 
     doc_create = """
         __Method__: POST
@@ -1268,6 +1417,14 @@ class ReleaseOverridesRPMViewSet(StrictQueryParamMixin,
         __URL__: $LINK:overridesrpm-detail:id$
     """
 
+    def perform_create(self, serializer):
+        super(ReleaseOverridesRPMViewSet, self).perform_create(serializer)
+        ReleaseRPMMappingSnapshot.refresh(serializer.instance.release, packages=[serializer.instance.srpm_name])
+
+    def perform_destroy(self, obj):
+        super(ReleaseOverridesRPMViewSet, self).perform_destroy(obj)
+        ReleaseRPMMappingSnapshot.refresh(obj.release, packages=[obj.srpm_name])
+
     def bulk_destroy(self, *args, **kwargs):
         """
         There are two ways to invoke this call. Both require a request body. In
@@ -1294,6 +1451,10 @@ class ReleaseOverridesRPMViewSet(StrictQueryParamMixin,
         For deleting a list of specific objects there is no output.
 
         When clearing all overrides, a list of deleted objects is returned.
+        With `?count_only=1` query parameter, only the number of deleted
+        overrides is returned as `{"count": int}`.
+
+        All overrides of the release are deleted with a single query.
 
         __Example__:
 
@@ -1328,10 +1489,11 @@ class ReleaseOverridesRPMViewSet(StrictQueryParamMixin,
                                 data=["Allowed keys are release and force (optional, default false)."])
             release_obj = get_object_or_404(Release, release_id=data["release"])
             data = self._clear(release_obj, data)
-            if data:
-                return Response(status=status.HTTP_200_OK, data=data)
-            else:
+            if not data:
                 return Response(status=status.HTTP_404_NOT_FOUND, data={'detail': 'Not found.'})
+            if bool_from_native(self.request.query_params.get('count_only', False)):
+                return Response(status=status.HTTP_200_OK, data={'count': len(data)})
+            return Response(status=status.HTTP_200_OK, data=data)
 
         if isinstance(data, list):
             return bulk_operations.bulk_destroy_impl(self, *args, **kwargs)
@@ -1340,24 +1502,20 @@ class ReleaseOverridesRPMViewSet(StrictQueryParamMixin,
                         data=['Bulk delete expects either a list or object.'])
 
     def _clear(self, release_obj, args):
-        query = Q(release=release_obj)
-
-        if not bool_from_native(args.get("force", "False")):
-            query &= Q(do_not_delete=False)
-
-        queryset = OverrideRPM.objects.filter(query)
+        deleted = OverrideRPM.clear(release_obj, force=bool_from_native(args.get("force", "False")))
         result = []
-        for override in queryset:
-            serializer = self.serializer_class(override)
-            self.request.changeset.add('OverrideRPM', override.pk, serializer.data, 'null')
-            result.append(serializer.data)
-        queryset.delete()
+        for pk, data in deleted:
+            data = dict(data, id=pk, release=data.pop('release_id'))
+            self.request.changeset.add('OverrideRPM', pk, json.dumps(data), 'null')
+            result.append(data)
+        ReleaseRPMMappingSnapshot.refresh(release_obj, packages=set(item['srpm_name'] for item in result))
         return result
 
 
 class OverridesRPMCloneViewSet(StrictQueryParamMixin, viewsets.GenericViewSet):
     permission_classes = (APIPermission,)
     queryset = OverrideRPM.objects.none()
+    extra_query_params = ('count_only', )
 
     def create(self, request):
         """
@@ -1367,6 +1525,10 @@ class OverridesRPMCloneViewSet(StrictQueryParamMixin, viewsets.GenericViewSet):
 
         And if overrides-rpm have exited in target-release, they don't get copied.
 
+        All matching overrides are copied with a single query. With
+        `?count_only=1` query parameter, only the number of copied overrides
+        is returned as `{"count": int}`.
+
         __Method__: POST
 
         __URL__: $LINK:overridesrpmclone-list$
@@ -1425,24 +1587,19 @@ class OverridesRPMCloneViewSet(StrictQueryParamMixin, viewsets.GenericViewSet):
             if arg_data:
                 kwargs[arg] = arg_data
 
-        overrides_rpm = OverrideRPM.objects.filter(**kwargs)
-        if not overrides_rpm:
+        if not OverrideRPM.objects.filter(**kwargs).exists():
             return Response({'detail': 'there is no overrides-rpm in source release'},
                             status=status.HTTP_400_BAD_REQUEST)
+        del kwargs['release__release_id']
+        created = OverrideRPM.clone(tmp_release['source_release_id'], tmp_release['target_release_id'], **kwargs)
         results = []
-        for rpm in overrides_rpm:
-            orpm, created = OverrideRPM.objects.get_or_create(release=tmp_release['target_release_id'],
-                                                              rpm_name=rpm.rpm_name,
-                                                              rpm_arch=rpm.rpm_arch,
-                                                              variant=rpm.variant,
-                                                              arch=rpm.arch,
-                                                              srpm_name=rpm.srpm_name,
-                                                              comment=rpm.comment
-                                                              )
-            if created:
-                results.append(orpm.export())
-                request.changeset.add('OverridesRPM', orpm.pk,
-                                      'null', json.dumps(orpm.export()))
+        for pk, data in created:
+            results.append(data)
+            request.changeset.add('OverridesRPM', pk, 'null', json.dumps(data))
+        ReleaseRPMMappingSnapshot.refresh(tmp_release['target_release_id'],
+                                          packages=set(item['srpm_name'] for item in results))
+        if results and bool_from_native(request.query_params.get('count_only', False)):
+            return Response(status=status.HTTP_201_CREATED, data={'count': len(results)})
         if results:
             return Response(status=status.HTTP_201_CREATED, data=results)
         else:
@@ -1526,22 +1683,19 @@ class FindComposeMixin(object):
 
     def _get_composes_for_product_version(self):
         result = []
-        all_composes = []
-        releases = Release.objects.filter(product_version__product_version_id=self.product_version)
-        for release in releases:
-            composes = Compose.objects.filter(release=release, deleted=False)
-            composes = self._filter_by_compose_type(composes)
-            all_composes.extend(composes)
-        result = self._get_result(all_composes, result)
+        composes = Compose.objects.filter(release__product_version__product_version_id=self.product_version,
+                                          deleted=False)
+        composes = self._filter_by_compose_type(composes)
+        result = self._get_result(composes, result)
         return result
 
     def _get_result(self, composes, result):
         if self.latest:
-            compose = max(composes) if composes else None
+            compose = Compose.order_by_version(composes, reverse=True).first()
             if compose:
                 self._construct_result(compose, result)
         else:
-            for compose in sorted(composes):
+            for compose in Compose.order_by_version(composes):
                 self._construct_result(compose, result)
         return result
 
@@ -1570,7 +1724,9 @@ class FindComposeMixin(object):
 
     def _get_older_compose(self):
         compose = get_object_or_404(Compose, compose_id=self.compose_id)
-        current_rpms = set(r.sort_key for r in compose.get_rpms(self.rpm_name))
+        current_rpms = compose.get_rpms(self.rpm_name).values('evr_sort_key')
+        # RPMs with versions not in current compose
+        other_rpms = RPM.objects.filter(name=self.rpm_name).exclude(evr_sort_key__in=current_rpms)
         # Find older composes for same release (not including this one)
         composes = (Compose.objects
                     .exclude(deleted=True)
@@ -1578,8 +1734,9 @@ class FindComposeMixin(object):
                     .exclude(compose_date__gt=compose.compose_date)
                     # Only composes in the same product
                     .filter(release__short=compose.release.short)
-                    # Which have the requested rpm in some version
-                    .filter(variant__variantarch__composerpm__rpm__name=self.rpm_name)
+                    # Which have the requested rpm in a version not in
+                    # current compose
+                    .filter(variant__variantarch__composerpm__rpm__in=other_rpms)
                     # Keep only composes from the release that requested
                     # compose belongs to, or GA releases. This way, after R-1.1
                     # it goes to R-1.0, but not R-1.0-updates.
@@ -1587,18 +1744,12 @@ class FindComposeMixin(object):
                     .exclude(id=compose.id)
                     .distinct())
         composes = self._filter_by_compose_type(composes)
-        latest = None
-        for compose in sorted(composes, reverse=True):
-            rpms = compose.get_rpms(self.rpm_name)
-            # Does compose have a version not in current compose?
-            if set(r.sort_key for r in rpms) - current_rpms:
-                latest = compose
-                break
+        latest = Compose.order_by_version(composes, reverse=True).first()
         if not latest:
             raise Http404('No older compose with earlier version of RPM')
         return {
             'compose': latest.compose_id,
-            'packages': self._packages_output(rpms)
+            'packages': self._packages_output(latest.get_rpms(self.rpm_name))
         }
 
 
@@ -1711,6 +1862,65 @@ class FindOlderComposeByComposeRPMViewSet(StrictQueryParamMixin, FindComposeMixi
         return Response(self._get_older_compose())
 
 
+def _stream_json_list(items):
+    yield '['
+    for i, item in enumerate(items):
+        if i:
+            yield ','
+        yield json.dumps(item)
+    yield ']'
+
+
+class ComposeRPMDiffViewSet(StrictQueryParamMixin, viewsets.GenericViewSet):
+    """
+    This API endpoint allows comparing RPMs in two composes.
+    """
+    queryset = ComposeRPM.objects.none()    # Required for permissions
+    permission_classes = (APIPermission,)
+
+    def list(self, request, **kwargs):
+        """
+        List RPMs that differ between two composes, grouped by variant and
+        arch. Packages are matched by variant UID, arch, name and RPM arch.
+
+        A package that has a different version in the new compose is listed
+        in `upgraded` or `downgraded`. Packages present in only one of the
+        composes are listed in `added` or `removed`. Variants and arches
+        without any change are omitted.
+
+        The difference is computed by the database and the response is
+        streamed, so it is fast even for big composes.
+
+        __Method__: GET
+
+        __URL__: $LINK:composerpmdiff-list:old_compose_id:new_compose_id$
+
+        __Response__:
+
+            [
+                {
+                    "variant": string,
+                    "arch": string,
+                    "added": [nevra],
+                    "removed": [nevra],
+                    "upgraded": [{"from": nevra, "to": nevra}],
+                    "downgraded": [{"from": nevra, "to": nevra}]
+                },
+                ...
+            ]
+
+        __Example__:
+
+            $ curl -H 'Accept: application/json' $URL:composerpmdiff-list:RHEL-7.0-20140101.0:RHEL-7.0-20140102.0$
+        """
+        old_compose = get_object_or_404(Compose, compose_id=kwargs['old_compose_id'])
+        new_compose = get_object_or_404(Compose, compose_id=kwargs['new_compose_id'])
+        diff = lib.compose__rpm_diff(old_compose, new_compose)
+        if request.accepted_renderer.format != 'json':
+            return Response(list(diff))
+        return StreamingHttpResponse(_stream_json_list(diff), content_type='application/json')
+
+
 class FindComposeByProductVersionRPMViewSet(StrictQueryParamMixin, FindComposeMixin, viewsets.GenericViewSet):
     """
     This API endpoint allows finding all composes that contain the package
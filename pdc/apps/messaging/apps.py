@@ -26,3 +26,7 @@ class MessagingConfig(AppConfig):
 
         cls = import_string(backend)
         self.messenger = cls()
+
+        if 'ASYNC' in settings.MESSAGE_BUS:
+            from .publisher import AsyncPublisher
+            self.messenger = AsyncPublisher(self.messenger, settings.MESSAGE_BUS['ASYNC'])
@@ -0,0 +1,47 @@
+#
+# Copyright (c) 2018 Red Hat
+# Licensed under The MIT License (MIT)
+# http://opensource.org/licenses/MIT
+#
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from pdc.apps.messaging import outbox
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Send messages stored in outbox to the configured message bus.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Maximum number of messages sent at once (default: %(default)s).')
+        parser.add_argument('--poll-interval', type=float, default=5,
+                            help='Seconds to wait when outbox is empty or sending '
+                                 'fails (default: %(default)s).')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when outbox is empty instead of waiting for new messages.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        while True:
+            if not connection.in_atomic_block:
+                # Long running process would otherwise keep a broken or
+                # expired connection forever.
+                close_old_connections()
+            try:
+                sent = outbox.relay(batch_size)
+            except Exception:
+                logger.exception('Failed to relay messages')
+                if options['once']:
+                    raise
+                sent = 0
+            if sent == batch_size:
+                continue
+            if options['once']:
+                return
+            time.sleep(options['poll_interval'])
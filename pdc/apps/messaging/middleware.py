@@ -6,12 +6,53 @@
 from django.utils.deprecation import MiddlewareMixin
 from django.apps import apps
 
+from . import outbox
+
+
+def _add_extra_fields(request, messages):
+    extra_fields = {
+        'author': request.user.username,
+        'comment': request.META.get("HTTP_PDC_CHANGE_COMMENT", None),
+    }
+    if hasattr(request, 'changeset') and request.changeset.pk:
+        extra_fields.update({
+            'changeset_id': request.changeset.pk,
+            'committed_on': str(request.changeset.committed_on),
+        })
+    for topic, msg in messages:
+        msg.update(extra_fields)
+
+
+def send_messages(request, messages):
+    """
+    Add information about author and changeset of the request to all
+    messages and send them via configured messenger.
+    """
+    _add_extra_fields(request, messages)
+    config = apps.get_app_config('messaging')
+    config.messenger.send_messages(messages)
+
+
+def store_messages(request):
+    """
+    If outbox is enabled, add information about author and changeset of the
+    request to all its messages and store them in outbox. The messages will
+    not be sent after the response. This must run in the transaction of the
+    changeset.
+    """
+    if not outbox.is_enabled() or not getattr(request, '_messagings', None):
+        return
+    _add_extra_fields(request, request._messagings)
+    outbox.store(request._messagings)
+    request._messagings = []
+
 
 class MessagingMiddleware(MiddlewareMixin):
     """
     Create a messaging list for each request. It is accessible via
     `request._messagings`. If the request ends sucessfully, the messager
-    could send all the messages in it.
+    could send all the messages in it. Messages already stored in outbox by
+    `store_messages` are not sent here.
     """
 
     def process_request(self, request):
@@ -20,19 +61,6 @@ class MessagingMiddleware(MiddlewareMixin):
     def process_response(self, request, response):
         if not getattr(response, 'exception', 0) and response.status_code < 400:
             if hasattr(request, '_messagings'):
-                extra_fields = {
-                    'author': request.user.username,
-                    'comment': request.META.get("HTTP_PDC_CHANGE_COMMENT", None),
-                }
-                if hasattr(request, 'changeset') and request.changeset.pk:
-                    extra_fields.update({
-                        'changeset_id': request.changeset.pk,
-                        'committed_on': str(request.changeset.committed_on),
-                    })
-                for topic, msg in request._messagings:
-                    msg.update(extra_fields)
-
-                config = apps.get_app_config('messaging')
-                config.messenger.send_messages(request._messagings)
+                send_messages(request, request._messagings)
         request._messagings = None
         return response
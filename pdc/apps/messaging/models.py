@@ -0,0 +1,28 @@
+#
+# Copyright (c) 2018 Red Hat
+# Licensed under The MIT License (MIT)
+# http://opensource.org/licenses/MIT
+#
+import json
+
+from django.db import models
+
+
+class OutboxMessage(models.Model):
+    """
+    Message waiting to be sent by `relay_messages` command. It is written in
+    the same transaction as the changes it describes.
+    """
+    topic       = models.CharField(max_length=200)
+    body        = models.TextField()
+    created_on  = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ('id', )
+
+    def __unicode__(self):
+        return u'%s #%s' % (self.topic, self.pk)
+
+    @property
+    def message(self):
+        return json.loads(self.body)
@@ -0,0 +1,61 @@
+#
+# Copyright (c) 2018 Red Hat
+# Licensed under The MIT License (MIT)
+# http://opensource.org/licenses/MIT
+#
+"""
+Transactional outbox for messages.
+
+With `MESSAGE_BUS['OUTBOX']` enabled, messages of a write request are stored
+as `OutboxMessage` rows in the same transaction as its changeset instead of
+being sent when the response is returned. They are sent to the configured
+messenger by the `relay_messages` management command, so a message is never
+lost when the transaction is committed and never sent when it is rolled back.
+"""
+import json
+import logging
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import OutboxMessage
+from .publisher import AsyncPublisher
+
+logger = logging.getLogger(__name__)
+
+
+def is_enabled():
+    return bool(settings.MESSAGE_BUS.get('OUTBOX'))
+
+
+def store(messages):
+    """Write messages to outbox. Must be called in a transaction."""
+    OutboxMessage.objects.bulk_create(
+        [OutboxMessage(topic=topic, body=json.dumps(msg)) for topic, msg in messages]
+    )
+
+
+def relay(batch_size):
+    """
+    Send up to `batch_size` oldest messages from outbox and delete them.
+    Return number of sent messages. If sending fails, the messages stay in
+    outbox and the exception is propagated.
+    """
+    messenger = apps.get_app_config('messaging').messenger
+    if isinstance(messenger, AsyncPublisher):
+        # Messages must be sent before they are deleted.
+        messenger = messenger.backend
+
+    with transaction.atomic():
+        queryset = OutboxMessage.objects.all()
+        if connection.features.has_select_for_update_skip_locked:
+            # Let multiple relays run in parallel.
+            queryset = queryset.select_for_update(skip_locked=True)
+        batch = list(queryset[:batch_size])
+        if not batch:
+            return 0
+        messenger.send_messages([(message.topic, message.message) for message in batch])
+        OutboxMessage.objects.filter(pk__in=[message.pk for message in batch]).delete()
+    logger.debug('Relayed %d messages', len(batch))
+    return len(batch)
@@ -0,0 +1,271 @@
+#
+# Copyright (c) 2018 Red Hat
+# Licensed under The MIT License (MIT)
+# http://opensource.org/licenses/MIT
+#
+"""
+Asynchronous delivery of messages.
+
+When `MESSAGE_BUS` contains an `ASYNC` dict, the configured messenger is
+wrapped in `AsyncPublisher`. Messages are then only put into a bounded queue
+when the request finishes and a background thread hands them to the messenger
+in batches. Failed batches are retried with exponential backoff; messages that
+still can not be sent, or that do not fit into the full queue, are appended to
+a spool file and sent again later. Counters returned by `stats()` are logged
+periodically by the worker.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import Queue
+
+from .backends import BaseMessenger
+
+logger = logging.getLogger(__name__)
+
+# Queued by `AsyncPublisher.stop()` to let the worker finish.
+_STOP = object()
+
+
+class AsyncPublisher(BaseMessenger):
+    """
+    Messenger sending messages via `backend` in a background thread.
+
+    Available options (all optional):
+
+    * `QUEUE_SIZE`: maximum number of queued messages (default 10000)
+    * `ENQUEUE_TIMEOUT`: seconds to wait for space in full queue before the
+      message is spooled (default 5)
+    * `BATCH_SIZE`: maximum number of messages sent at once (default 100)
+    * `RETRIES`: how many times a failed batch is retried (default 5)
+    * `RETRY_DELAY`: seconds to wait before first retry, doubled for each
+      following one (default 1)
+    * `SPOOL_FILE`: path to file for messages that could not be sent; they
+      are lost if not set
+    * `STATS_INTERVAL`: seconds between log lines with `stats()` of the
+      publisher, `0` disables them (default 300)
+    """
+    def __init__(self, backend, options=None):
+        options = options or {}
+        self.backend = backend
+        self.enqueue_timeout = options.get('ENQUEUE_TIMEOUT', 5)
+        self.batch_size = options.get('BATCH_SIZE', 100)
+        self.retries = options.get('RETRIES', 5)
+        self.retry_delay = options.get('RETRY_DELAY', 1)
+        self.spool_file = options.get('SPOOL_FILE')
+        self.stats_interval = options.get('STATS_INTERVAL', 300)
+        self.queue = Queue.Queue(maxsize=options.get('QUEUE_SIZE', 10000))
+        self.worker = None
+        self._worker_lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._has_spooled = bool(self.spool_file and os.path.exists(self.spool_file))
+        self.published = 0
+        self.failed = 0
+        self.spooled = 0
+        self.retried = 0
+        self.last_latency = None
+        self.max_latency = 0
+        self._total_latency = 0
+        self._stats_logged_on = time.time()
+        atexit.register(self.close)
+
+    def __getattr__(self, name):
+        # Make backend specific methods (e.g. `listen` of TestMessenger)
+        # available on the publisher.
+        if name == 'backend':
+            raise AttributeError(name)
+        return getattr(self.backend, name)
+
+    def send_messages(self, msgs):
+        """
+        Queue messages for sending. If the queue is full, wait up to
+        `ENQUEUE_TIMEOUT` seconds for the worker to catch up, then spool the
+        rest.
+        """
+        msgs = list(msgs)
+        self._ensure_worker()
+        now = time.time()
+        for index, (topic, msg) in enumerate(msgs):
+            try:
+                self.queue.put((now, topic, msg), timeout=self.enqueue_timeout)
+            except Queue.Full:
+                logger.warning('Message queue is full, spooling %d messages', len(msgs) - index)
+                self._spool([(now, topic, msg) for topic, msg in msgs[index:]])
+                return
+
+    def send_message(self, topic, msg):
+        self.send_messages([(topic, msg)])
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if not self.worker or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._work, name='message-publisher')
+                self.worker.daemon = True
+                self.worker.start()
+
+    def _work(self):
+        self._replay_spool()
+        while True:
+            self._log_stats_if_due()
+            try:
+                item = self.queue.get(timeout=self._stats_timeout())
+            except Queue.Empty:
+                continue
+            if item is _STOP:
+                self.queue.task_done()
+                return
+            batch = [item]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except Queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                if self._publish(batch) and self._has_spooled:
+                    self._replay_spool()
+            except Exception:
+                logger.exception('Message publisher failed')
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            if stop:
+                self.queue.task_done()
+                return
+
+    def _stats_timeout(self):
+        """Return seconds the worker may wait for messages, `None` for ever."""
+        if not self.stats_interval:
+            return None
+        return max(self._stats_logged_on + self.stats_interval - time.time(), 0)
+
+    def _log_stats_if_due(self):
+        if self.stats_interval and time.time() >= self._stats_logged_on + self.stats_interval:
+            logger.info('Message publisher stats: %s', json.dumps(self.stats(), sort_keys=True))
+            self._stats_logged_on = time.time()
+
+    def _publish(self, batch):
+        """
+        Send a batch via backend, retrying on failure. Return `True` when the
+        batch was sent, otherwise spool it and return `False`.
+        """
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            if attempt:
+                with self._stats_lock:
+                    self.retried += 1
+                time.sleep(delay)
+                delay *= 2
+            try:
+                self.backend.send_messages([(topic, msg) for _, topic, msg in batch])
+            except Exception:
+                logger.warning('Failed to send %d messages (attempt %d)', len(batch), attempt + 1,
+                               exc_info=True)
+                continue
+            self._record_published(batch)
+            return True
+
+        with self._stats_lock:
+            self.failed += len(batch)
+        self._spool(batch)
+        return False
+
+    def _record_published(self, batch):
+        now = time.time()
+        with self._stats_lock:
+            for queued_on, _, _ in batch:
+                latency = now - queued_on
+                self._total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
+            self.last_latency = now - batch[-1][0]
+            self.published += len(batch)
+
+    def _spool(self, batch):
+        if not batch:
+            return
+        if not self.spool_file:
+            logger.error('Dropping %d messages that could not be sent', len(batch))
+            return
+        with self._spool_lock:
+            with open(self.spool_file, 'a') as f:
+                for _, topic, msg in batch:
+                    f.write(json.dumps([topic, msg]))
+                    f.write('\n')
+            self._has_spooled = True
+        with self._stats_lock:
+            self.spooled += len(batch)
+
+    def _replay_spool(self):
+        """Send messages from spool file. Those that fail are spooled again."""
+        if not self.spool_file:
+            return
+        with self._spool_lock:
+            if not os.path.exists(self.spool_file):
+                return
+            with open(self.spool_file) as f:
+                lines = f.readlines()
+            os.remove(self.spool_file)
+            self._has_spooled = False
+        if not lines:
+            return
+        logger.info('Resending %d spooled messages', len(lines))
+        now = time.time()
+        batch = [(now, ) + tuple(json.loads(line)) for line in lines]
+        for start in range(0, len(batch), self.batch_size):
+            if not self._publish(batch[start:start + self.batch_size]):
+                # The backend is still failing, keep the rest for later.
+                self._spool(batch[start + self.batch_size:])
+                break
+
+    def join(self):
+        """Wait until all queued messages are processed."""
+        self.queue.join()
+
+    def stop(self, timeout=None):
+        """
+        Let the worker send messages queued so far and wait up to `timeout`
+        seconds for it to finish. Sending more messages starts a new worker.
+        """
+        with self._worker_lock:
+            worker, self.worker = self.worker, None
+        if worker and worker.is_alive():
+            self.queue.put(_STOP)
+            worker.join(timeout)
+
+    def close(self):
+        """Spool messages that are still waiting in the queue."""
+        batch = []
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except Queue.Empty:
+                break
+            self.queue.task_done()
+            if item is not _STOP:
+                batch.append(item)
+        if batch:
+            self._spool(batch)
+
+    def stats(self):
+        """Return counters describing state of the publisher."""
+        with self._stats_lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'published': self.published,
+                'failed': self.failed,
+                'spooled': self.spooled,
+                'retried': self.retried,
+                'latency': {
+                    'last': self.last_latency,
+                    'max': self.max_latency,
+                    'average': self._total_latency / self.published if self.published else None,
+                },
+            }
@@ -4,8 +4,23 @@
 # Licensed under The MIT License (MIT)
 # http://opensource.org/licenses/MIT
 #
+import json
+import os
+import shutil
+import tempfile
+
 import mock
+from django.apps import apps
+from django.core.management import call_command
 from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from pdc.apps.changeset.models import Changeset
+from .backends.capture import TestMessenger
+from .models import OutboxMessage
+from .publisher import AsyncPublisher
 
 
 @override_settings(MESSAGE_BUS={
@@ -96,3 +111,128 @@ class ComposeModelTestCase(TestCase):
                                    '{"a": "b", "new_value": {"c": "d"}}')])
              ]
         )
+
+
+class AsyncPublisherTestCase(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.spool_file = os.path.join(self.tmpdir, 'spool')
+        self.backend = TestMessenger()
+        self.publisher = AsyncPublisher(self.backend, {
+            'BATCH_SIZE': 2,
+            'RETRIES': 2,
+            'RETRY_DELAY': 0,
+            'SPOOL_FILE': self.spool_file,
+        })
+
+    def tearDown(self):
+        self.publisher.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def test_send_in_batches(self):
+        with mock.patch.object(self.backend, 'send_messages', wraps=self.backend.send_messages) as send:
+            with self.publisher.listen() as messages:
+                self.publisher.send_messages([('.t1', {'a': 1}), ('.t1', {'a': 2}), ('.t2', {'a': 3})])
+                self.publisher.join()
+        self.assertEqual(messages, [('.t1', {'a': 1}), ('.t1', {'a': 2}), ('.t2', {'a': 3})])
+        self.assertTrue(all(len(c[0][0]) <= 2 for c in send.call_args_list))
+        stats = self.publisher.stats()
+        self.assertEqual(stats['published'], 3)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertIsNotNone(stats['latency']['last'])
+
+    def test_retry_failed_batch(self):
+        with mock.patch.object(self.backend, 'send_messages',
+                               side_effect=[Exception('Boom'), None]) as send:
+            self.publisher.send_messages([('.t1', {'a': 1})])
+            self.publisher.join()
+        self.assertEqual(send.call_count, 2)
+        stats = self.publisher.stats()
+        self.assertEqual((stats['published'], stats['retried'], stats['spooled']), (1, 1, 0))
+
+    def test_spool_and_resend(self):
+        with mock.patch.object(self.backend, 'send_messages', side_effect=Exception('Boom')):
+            self.publisher.send_messages([('.t1', {'a': 1})])
+            self.publisher.join()
+        self.assertEqual(self.publisher.stats()['failed'], 1)
+        with open(self.spool_file) as f:
+            self.assertEqual(f.read(), '[".t1", {"a": 1}]\n')
+
+        with self.publisher.listen() as messages:
+            self.publisher.send_messages([('.t2', {'b': 2})])
+            self.publisher.join()
+        self.assertEqual(messages, [('.t2', {'b': 2}), ('.t1', {'a': 1})])
+        self.assertFalse(os.path.exists(self.spool_file))
+
+    def test_spool_when_queue_is_full(self):
+        publisher = AsyncPublisher(self.backend, {
+            'QUEUE_SIZE': 1,
+            'ENQUEUE_TIMEOUT': 0.01,
+            'SPOOL_FILE': self.spool_file,
+        })
+        with mock.patch.object(publisher, '_ensure_worker'):
+            publisher.send_messages([('.t1', {'a': 1}), ('.t1', {'a': 2})])
+        self.assertEqual(publisher.stats()['queue_depth'], 1)
+        publisher.close()
+        with open(self.spool_file) as f:
+            self.assertEqual(f.read(), '[".t1", {"a": 2}]\n[".t1", {"a": 1}]\n')
+
+    def test_stop_sends_queued_messages(self):
+        with self.publisher.listen() as messages:
+            self.publisher.send_messages([('.t1', {'a': 1}), ('.t1', {'a': 2}), ('.t2', {'a': 3})])
+            worker = self.publisher.worker
+            self.publisher.stop()
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(len(messages), 3)
+        self.assertEqual(self.publisher.stats()['queue_depth'], 0)
+
+    def test_stats_are_logged_periodically(self):
+        self.publisher.stats_interval = 60
+        with mock.patch('pdc.apps.messaging.publisher.logger') as logger:
+            self.publisher._log_stats_if_due()
+            self.assertFalse(logger.info.called)
+            self.publisher._stats_logged_on -= 60
+            self.publisher._log_stats_if_due()
+        logger.info.assert_called_once_with('Message publisher stats: %s',
+                                            json.dumps(self.publisher.stats(), sort_keys=True))
+        self.assertAlmostEqual(self.publisher._stats_timeout(), 60, delta=1)
+
+
+@override_settings(MESSAGE_BUS={
+    'BACKEND': 'pdc.apps.messaging.backends.capture.TestMessenger',
+    'OUTBOX': True,
+})
+class OutboxTestCase(APITestCase):
+
+    def setUp(self):
+        self.messenger = apps.get_app_config('messaging').messenger
+
+    def test_messages_are_stored_with_changeset(self):
+        with self.messenger.listen() as messages:
+            response = self.client.post(reverse('product-list'), {'name': 'Fedora', 'short': 'f'})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(messages, [])
+        outbox = OutboxMessage.objects.get()
+        self.assertEqual(outbox.topic, '.products.added')
+        self.assertEqual(outbox.message['changeset_id'], Changeset.objects.get().pk)
+
+    def test_nothing_is_stored_for_failed_request(self):
+        response = self.client.post(reverse('product-list'), {'name': 'Fedora', 'short': 'F'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(OutboxMessage.objects.count(), 0)
+
+    def test_relay_sends_and_deletes_messages(self):
+        for short in ('a', 'b', 'c'):
+            OutboxMessage.objects.create(topic='.t', body='{"short": "%s"}' % short)
+        with self.messenger.listen() as messages:
+            call_command('relay_messages', once=True, batch_size=2)
+        self.assertEqual(messages, [('.t', {'short': 'a'}), ('.t', {'short': 'b'}), ('.t', {'short': 'c'})])
+        self.assertEqual(OutboxMessage.objects.count(), 0)
+
+    def test_failed_relay_keeps_messages(self):
+        OutboxMessage.objects.create(topic='.t', body='{}')
+        with mock.patch.object(self.messenger, 'send_messages', side_effect=Exception('Boom')):
+            with self.assertRaises(Exception):
+                call_command('relay_messages', once=True)
+        self.assertEqual(OutboxMessage.objects.count(), 1)
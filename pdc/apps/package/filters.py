@@ -7,12 +7,13 @@ from functools import partial
 
 from django.conf import settings
 from django.core.exceptions import FieldError
+from django.db.models import Q
 
 import django_filters
 
 from pdc.apps.common.filters import (MultiValueFilter, MultiIntFilter, MultiValueRegexFilter,
                                      NullableCharFilter, CaseInsensitiveBooleanFilter)
-from pdc.apps.common.hacks import parse_epoch_version
+from pdc.apps.common.hacks import version_sort_key
 
 from . import models
 
@@ -55,6 +56,34 @@ def dependency_predicate(op, version):
     raise FieldError('Unrecognized operator "{}" for {}'.format(op, type))
 
 
+def dependency_query(op, key):
+    """
+    Returns `Q` object selecting dependencies that satisfy given operator
+    and version. The version is given as `version_sort_key`. This is the
+    database counterpart of `dependency_predicate`.
+    """
+    if op == '=':
+        return (Q(comparison='=', version_sort_key=key) |
+                Q(comparison='<', version_sort_key__gt=key) |
+                Q(comparison='>', version_sort_key__lt=key) |
+                Q(comparison='<=', version_sort_key__gte=key) |
+                Q(comparison='>=', version_sort_key__lte=key))
+
+    if op == '>':
+        return Q(comparison__contains='>') | Q(version_sort_key__gt=key)
+
+    if op == '<':
+        return Q(comparison__contains='<') | Q(version_sort_key__lt=key)
+
+    if op == '>=':
+        return dependency_query('>', key) | dependency_query('=', key)
+
+    if op == '<=':
+        return dependency_query('<', key) | dependency_query('=', key)
+
+    raise FieldError('Unrecognized operator "{}" for {}'.format(op, type))
+
+
 def dependency_filter(type, queryset, name, value):
     m = models.Dependency.DEPENDENCY_PARSER.match(value)
     if not m:
@@ -70,16 +99,10 @@ def dependency_filter(type, queryset, name, value):
     if not version:
         return queryset
 
-    version = parse_epoch_version(version)
-    matches = dependency_predicate(op, version)
-    deps = models.Dependency.objects.filter(type=type, name=name)
-
-    for dep in deps:
-        dep_version = dep.parsed_version
-        if dep_version is not None and not matches(dep.comparison, dep_version):
-            queryset = queryset.exclude(pk=dep.rpm_id)
-
-    return queryset
+    not_matching = (models.Dependency.objects
+                    .filter(type=type, name=name, version_sort_key__isnull=False)
+                    .exclude(dependency_query(op, version_sort_key(version))))
+    return queryset.exclude(pk__in=not_matching.values('rpm_id'))
 
 
 class RPMFilter(django_filters.FilterSet):
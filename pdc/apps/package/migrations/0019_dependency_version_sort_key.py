@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+from pdc.apps.common.hacks import version_sort_key, MAX_QUERY_PARAMS
+
+
+def set_version_sort_key(apps, schema_editor):
+    # Walk the table by primary key, so that each batch is read and updated
+    # using the primary key index only.
+    Dependency = apps.get_model('package', 'Dependency')
+    last_pk = 0
+    while True:
+        rows = list(Dependency.objects.filter(pk__gt=last_pk).order_by('pk')
+                    .values_list('pk', 'version')[:MAX_QUERY_PARAMS])
+        if not rows:
+            break
+        keys = defaultdict(list)
+        for pk, version in rows:
+            if version:
+                keys[version_sort_key(version)].append(pk)
+        for key, pks in keys.iteritems():
+            Dependency.objects.filter(pk__in=pks).update(version_sort_key=key)
+        last_pk = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('package', '0018_auto_20180131_1318'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dependency',
+            name='version_sort_key',
+            field=models.TextField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(set_version_sort_key, reverse_code=migrations.RunPython.noop),
+        migrations.AlterIndexTogether(
+            name='dependency',
+            index_together=set([('type', 'name', 'version_sort_key')]),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+from pdc.apps.common.hacks import evr_sort_key, MAX_QUERY_PARAMS
+
+
+def set_evr_sort_key(apps, schema_editor):
+    # Walk the table by primary key, so that each batch is read and updated
+    # using the primary key index only.
+    RPM = apps.get_model('package', 'RPM')
+    last_pk = 0
+    while True:
+        rows = list(RPM.objects.filter(pk__gt=last_pk).order_by('pk')
+                    .values_list('pk', 'epoch', 'version', 'release')[:MAX_QUERY_PARAMS])
+        if not rows:
+            break
+        keys = defaultdict(list)
+        for pk, epoch, version, release in rows:
+            keys[evr_sort_key(epoch, version, release)].append(pk)
+        for key, pks in keys.iteritems():
+            RPM.objects.filter(pk__in=pks).update(evr_sort_key=key)
+        last_pk = rows[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('package', '0019_dependency_version_sort_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rpm',
+            name='evr_sort_key',
+            field=models.TextField(editable=False, null=True),
+        ),
+        migrations.RunPython(set_evr_sort_key, reverse_code=migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='rpm',
+            name='evr_sort_key',
+            field=models.TextField(editable=False),
+        ),
+        migrations.AlterIndexTogether(
+            name='rpm',
+            index_together=set([('name', 'evr_sort_key')]),
+        ),
+    ]
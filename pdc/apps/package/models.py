@@ -11,13 +11,16 @@ from django.db.utils import IntegrityError
 from django.core.exceptions import ValidationError
 from django.forms.models import model_to_dict
 from django.dispatch import receiver
-from django.db.models.signals import post_migrate
+from django.db.models.signals import post_migrate, pre_save
 
 from productmd import images
 
+from pdc.apps.common.idcache import IdCache
 from pdc.apps.common.models import get_cached_id
 from pdc.apps.common.validators import validate_md5, validate_sha1, validate_sha256
-from pdc.apps.common.hacks import add_returning, parse_epoch_version
+from pdc.apps.common.hacks import (add_returning, add_ignore_conflicts, chunks, insert_rows,
+                                   evr_sort_key, parse_epoch_version, temporary_table, version_sort_key,
+                                   MAX_QUERY_PARAMS)
 from pdc.apps.common.constants import ARCH_SRC
 from pdc.apps.release.models import Release
 from pdc.apps.compose.models import Compose, ComposeAcceptanceTestingState
@@ -41,6 +44,9 @@ class RPM(models.Model):
     linked_releases     = models.ManyToManyField('release.Release', related_name='linked_rpms')
     srpm_commit_hash    = models.CharField(max_length=200, db_index=True, null=True, blank=True)
     srpm_commit_branch  = models.CharField(max_length=200, db_index=True, null=True, blank=True)
+    # Encoded epoch, version and release that can be ordered in database, see
+    # `pdc.apps.common.hacks.evr_sort_key`.
+    evr_sort_key        = models.TextField(editable=False)
 
     _active_compose_ids = Compose.objects.only('compose_id').filter(deleted=False)
 
@@ -49,6 +55,9 @@ class RPM(models.Model):
         unique_together = (
             ("name", "epoch", "version", "release", "arch"),
         )
+        index_together = (
+            ("name", "evr_sort_key"),
+        )
 
     def __unicode__(self):
         return u"%s.rpm" % self.nevra
@@ -108,15 +117,16 @@ class RPM(models.Model):
         else:
             srpm_name = nvra["name"]
 
-        sql = add_returning("""INSERT INTO %s (name, epoch, version, release, arch, srpm_nevra, srpm_name, filename, srpm_commit_hash, srpm_commit_branch)
-                               VALUES (%%s, %%s, %%s, %%s, %%s, %%s, %%s, %%s, %%s, %%s)""" % RPM._meta.db_table)
+        sql = add_returning("""INSERT INTO %s (name, epoch, version, release, arch, srpm_nevra, srpm_name, filename, srpm_commit_hash, srpm_commit_branch, evr_sort_key)
+                               VALUES (%%s, %%s, %%s, %%s, %%s, %%s, %%s, %%s, %%s, %%s, %%s)""" % RPM._meta.db_table)
 
         try:
             sid = transaction.savepoint()
             RPM.check_srpm_nevra(rpm_nevra, srpm_nevra)
             cursor.execute(sql, [nvra["name"], nvra["epoch"], nvra["version"], nvra["release"],
                                  nvra["arch"], srpm_nevra, srpm_name, filename, srpm_commit_hash,
-                                 srpm_commit_branch])
+                                 srpm_commit_branch,
+                                 evr_sort_key(nvra["epoch"], nvra["version"], nvra["release"])])
             if connection.features.can_return_id_from_insert:
                 insert_id = connection.ops.fetch_returned_insert_id(cursor)
             else:
@@ -130,6 +140,51 @@ class RPM(models.Model):
         transaction.savepoint_commit(sid)
         return insert_id
 
+    @staticmethod
+    def bulk_get_or_insert(cursor, rpms):
+        """
+        Make sure all given RPMs exist in database and return a dict mapping
+        NEVRA of each of them to its id. The `rpms` argument should be an
+        iterable of `(rpm_nevra, filename, srpm_nevra)` triples. RPMs that are
+        already in the database are not modified.
+
+        The RPMs are staged in a temporary table, the missing ones are inserted
+        with a single statement and all ids are resolved with one join. The
+        cost depends on the number of given RPMs, not on the size of the RPM
+        table.
+        """
+        staged = {}
+        for rpm_nevra, filename, srpm_nevra in rpms:
+            if rpm_nevra in staged:
+                continue
+            nvra = parse_nvra(rpm_nevra)
+            if srpm_nevra:
+                srpm_name = parse_nvra(srpm_nevra)["name"]
+            else:
+                srpm_name = nvra["name"]
+            staged[rpm_nevra] = (nvra["name"], int(nvra["epoch"] or 0), nvra["version"], nvra["release"],
+                                 nvra["arch"], srpm_nevra, srpm_name, filename,
+                                 evr_sort_key(nvra["epoch"], nvra["version"], nvra["release"]))
+        if not staged:
+            return {}
+
+        key_columns = ["name", "epoch", "version", "release", "arch"]
+        columns = key_columns + ["srpm_nevra", "srpm_name", "filename", "evr_sort_key"]
+        join = " AND ".join("r.%s = t.%s" % (column, column) for column in key_columns)
+        with temporary_table(cursor, "tmp_rpm_import",
+                             ["name varchar(200)", "epoch integer", "version varchar(200)",
+                              "release varchar(200)", "arch varchar(200)", "srpm_nevra varchar(200)",
+                              "srpm_name varchar(200)", "filename varchar(4096)", "evr_sort_key text"]) as tmp:
+            insert_rows(cursor, tmp, columns, staged.values())
+            cursor.execute(add_ignore_conflicts(
+                """INSERT INTO %s (%s) SELECT %s FROM %s t LEFT JOIN %s r ON %s WHERE r.id IS NULL"""
+                % (RPM._meta.db_table, ", ".join(columns), ", ".join("t." + c for c in columns),
+                   tmp, RPM._meta.db_table, join)))
+            cursor.execute("""SELECT %s, r.id FROM %s t JOIN %s r ON %s"""
+                           % (", ".join("t." + c for c in key_columns), tmp, RPM._meta.db_table, join))
+            ids = dict((tuple(row[:-1]), row[-1]) for row in cursor.fetchall())
+        return dict((rpm_nevra, ids[values[:len(key_columns)]]) for rpm_nevra, values in staged.iteritems())
+
     @property
     def sort_key(self):
         return (self.epoch, parse_epoch_version(self.version), parse_epoch_version(self.release))
@@ -171,8 +226,16 @@ class Dependency(models.Model):
     name = models.CharField(max_length=200)
     version = models.CharField(max_length=200, blank=True, null=True)
     comparison = models.CharField(max_length=50, blank=True, null=True)
+    # Encoded version that can be compared in database, see
+    # `pdc.apps.common.hacks.version_sort_key`.
+    version_sort_key = models.TextField(blank=True, null=True, editable=False)
     rpm = models.ForeignKey(RPM, on_delete=models.CASCADE)
 
+    class Meta:
+        index_together = (
+            ('type', 'name', 'version_sort_key'),
+        )
+
     def __unicode__(self):
         base_str = self.name
         if self.version:
@@ -203,7 +266,7 @@ class ImageFormat(models.Model):
     def __unicode__(self):
         return u"%s" % self.name
 
-    CACHE = {}
+    CACHE = IdCache("name")
 
     @classmethod
     def get_cached_id(cls, value):
@@ -217,7 +280,7 @@ class ImageType(models.Model):
     def __unicode__(self):
         return u"%s" % self.name
 
-    CACHE = {}
+    CACHE = IdCache("name")
 
     @classmethod
     def get_cached_id(cls, value):
@@ -259,6 +322,33 @@ class Image(models.Model):
         """Return a set of all composes that this image belongs to."""
         return set([ci.variant_arch.variant.compose for ci in self.composeimage_set.all()])
 
+    @classmethod
+    def bulk_get_or_create(cls, images):
+        """
+        Make sure all given images exist and return a dict mapping
+        `(file_name, sha256)` of each of them to its id. The `images` should
+        be an iterable of dicts with values for all fields. Images that are
+        already in the database are not modified.
+        """
+        images = dict(((image['file_name'], image['sha256']), image) for image in images)
+        ids = cls._get_ids(images.keys())
+        missing = [cls(**image) for key, image in images.iteritems() if key not in ids]
+        if missing:
+            cls.objects.bulk_create(missing)
+            ids.update(cls._get_ids([(image.file_name, image.sha256) for image in missing]))
+        return ids
+
+    @classmethod
+    def _get_ids(cls, keys):
+        keys = set(keys)
+        ids = {}
+        for names in chunks(sorted(set(file_name for file_name, _ in keys)), MAX_QUERY_PARAMS):
+            for pk, file_name, sha256 in cls.objects.filter(file_name__in=names).values_list('pk', 'file_name',
+                                                                                             'sha256'):
+                if (file_name, sha256) in keys:
+                    ids[(file_name, sha256)] = pk
+        return ids
+
 
 class Archive(models.Model):
     build_nvr           = models.CharField(max_length=200, db_index=True)
@@ -367,6 +457,18 @@ def sync_image_formats_and_types():
         logger.info("Created image type %s" % image_type)
 
 
+@receiver(pre_save, sender=RPM)
+def set_rpm_evr_sort_key(sender, instance, **kwargs):
+    # Fixtures are loaded as raw, so this is done here instead of in save().
+    instance.evr_sort_key = evr_sort_key(instance.epoch, instance.version, instance.release)
+
+
+@receiver(pre_save, sender=Dependency)
+def set_dependency_version_sort_key(sender, instance, **kwargs):
+    # Fixtures are loaded as raw, so this is done here instead of in save().
+    instance.version_sort_key = version_sort_key(instance.version)
+
+
 @receiver(post_migrate)
 def sync_image_formats_and_types_when_post_migrate(sender, **kwargs):
     if isinstance(sender, PackageConfig):
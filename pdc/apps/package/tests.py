@@ -3,20 +3,23 @@
 # Licensed under The MIT License (MIT)
 # http://opensource.org/licenses/MIT
 #
-from django.test import TestCase
+import json
+
+from django.test import TestCase, override_settings
 from rest_framework.test import APITestCase
 from rest_framework import status
 from django.urls import reverse
 from django.core.exceptions import ValidationError
 from django.apps import apps
+from django.db import connection
 
 from pdc.apps.bindings import models as binding_models
-from pdc.apps.common.hacks import parse_epoch_version
+from pdc.apps.common.hacks import evr_sort_key, parse_epoch_version, version_sort_key
 from pdc.apps.common.test_utils import TestCaseWithChangeSetMixin
 from pdc.apps.component import models as component_models
 from pdc.apps.release import models as release_models
 from . import models
-from .filters import dependency_predicate
+from .filters import dependency_predicate, RPMFilter
 
 
 class VersionComparison(TestCase):
@@ -151,6 +154,43 @@ class VersionComparison(TestCase):
         self.assertFalse(less_1_2_3(">=", v('1.2.4')))
 
 
+class VersionSortKeyTestCase(TestCase):
+    def test_order_matches_parsed_version(self):
+        versions = ['1', '1.0', '1.0.0', '1.0a', '1.0rc1', '1.0.dev3', '1.0-1', '1.0.post1',
+                    '1.0+abc.5', '1.0+5', '2.9', '2.17', '2.17.1', '10', '20180131',
+                    '3.0-1.fc22', '3.0-2.fc22', '0.9.9-1.el7_4', 'abc', '0:1.0', '1:2.0', '2:0.1']
+        for v1 in versions:
+            for v2 in versions:
+                self.assertEqual(cmp(parse_epoch_version(v1), parse_epoch_version(v2)),
+                                 cmp(version_sort_key(v1), version_sort_key(v2)),
+                                 '{} vs {}'.format(v1, v2))
+
+    def test_empty_version(self):
+        self.assertIsNone(version_sort_key(None))
+        self.assertIsNone(version_sort_key(''))
+
+    def test_key_is_stored_on_save(self):
+        rpm = models.RPM.objects.create(name='test-pkg', epoch=0, version='1.0',
+                                        release='1', arch='x86_64', srpm_name='test-pkg',
+                                        srpm_nevra='test-pkg-1.0.1.x86_64', filename='dummy')
+        dep = rpm.dependency_set.create(name='pkg', version='1:2.0',
+                                        type=models.Dependency.REQUIRES, comparison='>=')
+        self.assertEqual(dep.version_sort_key, version_sort_key('1:2.0'))
+        dep = rpm.dependency_set.create(name='pkg', type=models.Dependency.PROVIDES)
+        self.assertIsNone(dep.version_sort_key)
+
+    def test_key_is_stored_on_raw_save(self):
+        rpm = models.RPM.objects.create(name='test-pkg', epoch=0, version='1.0',
+                                        release='1', arch='x86_64', srpm_name='test-pkg',
+                                        srpm_nevra='test-pkg-1.0.1.x86_64', filename='dummy')
+        # This is how loaddata saves fixtures.
+        dep = models.Dependency(rpm=rpm, name='pkg', version='2.17',
+                                type=models.Dependency.REQUIRES, comparison='>=')
+        dep.save_base(raw=True)
+        self.assertEqual(models.Dependency.objects.get(pk=dep.pk).version_sort_key,
+                         version_sort_key('2.17'))
+
+
 class RPMSortKeyTestCase(TestCase):
     def test_sort_key_precedence(self):
         data = [((0, "10", "10"), (1, "1", "1")),
@@ -186,6 +226,26 @@ class RPMSortKeyTestCase(TestCase):
             p2 = models.RPM(epoch=v2[0], version=v2[1], release=v2[2])
             self.assertTrue(p1.sort_key < p2.sort_key, msg="%s < %s" % (v1, v2))
 
+    def test_stored_key_orders_like_sort_key(self):
+        evrs = [(0, "1.0.1", "10"), (1, "1.0.2", "1"), (0, "1.11.1", "10"), (0, "1.100.1", "1"),
+                (0, "svn24104.0.92", "1"), (0, "3.2.5d", "1"), (0, "2.1a15", "1"), (0, "2.1", "1")]
+        for i, (epoch, version, release) in enumerate(evrs):
+            models.RPM.objects.create(name='pkg', epoch=epoch, version=version, release=release,
+                                      arch='x86_64', srpm_name='pkg', srpm_nevra='pkg-%d.src' % i,
+                                      filename='pkg-%d.rpm' % i)
+        rpms = list(models.RPM.objects.all())
+        self.assertEqual(list(models.RPM.objects.order_by('evr_sort_key')),
+                         sorted(rpms, key=lambda rpm: rpm.sort_key))
+
+    def test_bulk_inserted_rpms_have_key(self):
+        cursor = connection.cursor()
+        ids = models.RPM.bulk_get_or_insert(cursor, [('bash-1:4.3.42-2.x86_64', 'bash.rpm', 'bash-1:4.3.42-2.src')])
+        models.RPM.bulk_insert(cursor, 'kernel-0:3.19.3-100.x86_64', 'kernel.rpm', 'kernel-0:3.19.3-100.src')
+        bash = models.RPM.objects.get(pk=ids['bash-1:4.3.42-2.x86_64'])
+        kernel = models.RPM.objects.get(name='kernel')
+        self.assertEqual(bash.evr_sort_key, evr_sort_key(1, '4.3.42', '2'))
+        self.assertEqual(kernel.evr_sort_key, evr_sort_key(0, '3.19.3', '100'))
+
 
 class RPMSaveValidationTestCase(TestCase):
     def test_empty_srpm_nevra_with_arch_is_src(self):
@@ -474,6 +534,12 @@ class RPMDepsFilterAPITestCase(APITestCase):
         self.assertItemsEqual([pkg['name'] for pkg in response.data['results']],
                               ['test-{}'.format(i) for i in [0, 1, 2, 3, 4, 5, 6, 8, 9, 11, 13]])
 
+    def test_filter_with_version_is_single_query(self):
+        filterset = RPMFilter({'requires': 'pkg>=2.0'}, queryset=models.RPM.objects.all())
+        with self.assertNumQueries(1):
+            names = list(filterset.qs.values_list('name', flat=True))
+        self.assertItemsEqual(names, ['test-{}'.format(i) for i in [2, 4, 5, 7, 8, 9, 10, 11, 12, 13, 14]])
+
 
 class RPMDepsFilterWithReleaseTestCase(APITestCase):
     @classmethod
@@ -906,6 +972,53 @@ class RPMAPIRESTTestCase(TestCaseWithChangeSetMixin, APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data.get('count'), 3)
 
+    def test_query_with_cursor(self):
+        response = self.client.get(reverse('rpms-list'), {'cursor': '', 'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('count', response.data)
+        self.assertIsNone(response.data['previous'])
+        ids = [rpm['id'] for rpm in response.data['results']]
+        self.assertEqual(len(ids), 2)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data['next'])
+        self.assertIsNotNone(response.data['previous'])
+        ids += [rpm['id'] for rpm in response.data['results']]
+        self.assertEqual(ids, sorted(models.RPM.objects.values_list('id', flat=True)))
+
+    def test_query_with_cursor_can_not_disable_pagination(self):
+        response = self.client.get(reverse('rpms-list'), {'cursor': '', 'page_size': -1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertIsNone(response.data['next'])
+
+    @override_settings(STREAMING_LIST_CHUNK_SIZE=2)
+    def test_query_without_pagination_is_streamed(self):
+        paged = self.client.get(reverse('rpms-list'), {'page_size': 100}).data['results']
+        response = self.client.get(reverse('rpms-list'), {'page_size': -1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), json.loads(json.dumps(paged)))
+
+    @override_settings(STREAMING_LIST_CHUNK_SIZE=2)
+    def test_query_without_pagination_as_ndjson(self):
+        response = self.client.get(reverse('rpms-list'), {'page_size': -1, 'arch': 'x86_64'},
+                                   HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), models.RPM.objects.filter(arch='x86_64').count())
+        self.assertEqual([json.loads(line)['arch'] for line in lines], ['x86_64'] * len(lines))
+
+    def test_query_without_pagination_reports_bad_filter(self):
+        response = self.client.get(reverse('rpms-list'), {'page_size': -1, 'provides': 'pkg=<1'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_query_with_invalid_cursor(self):
+        response = self.client.get(reverse('rpms-list'), {'cursor': 'foo'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_query_with_params(self):
         url = reverse('rpms-list')
         response = self.client.get(url + '?name=^bash$', format='json')
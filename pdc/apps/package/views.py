@@ -20,7 +20,7 @@ class RPMViewSet(pdc_viewsets.StrictQueryParamMixin,
                  pdc_viewsets.ChangeSetCreateModelMixin,
                  pdc_viewsets.ChangeSetUpdateModelMixin,
                  mixins.RetrieveModelMixin,
-                 mixins.ListModelMixin,
+                 pdc_viewsets.StreamingListModelMixin,
                  viewsets.GenericViewSet):
     """
     API endpoint that allows RPMs to be viewed.
@@ -18,6 +18,9 @@ router.register(r'release-groups', views.ReleaseGroupsViewSet, base_name='releas
 router.register('releases/(?P<release_id>[^/]+)/rpm-mapping',
                 views.ReleaseRPMMappingView,
                 base_name='releaserpmmapping')
+router.register('releases/(?P<release_id>[^/]+)/rpm-mapping-snapshot',
+                views.ReleaseRPMMappingSnapshotView,
+                base_name='releaserpmmappingsnapshot')
 router.register(r'rpc/release/import-from-composeinfo',
                 views.ReleaseImportView,
                 base_name='releaseimportcomposeinfo')
@@ -9,8 +9,12 @@ import time
 
 from rest_framework.test import APITestCase
 from rest_framework import status
+from django.core.cache import cache
+from django.db import connection
 from django.urls import reverse
+from django.test import override_settings
 from django.test.client import Client
+from django.test.utils import CaptureQueriesContext
 
 from pdc.apps.common.test_utils import TestCaseWithChangeSetMixin
 from . import models
@@ -1121,11 +1125,158 @@ class ReleaseRPMMappingViewSetTestCase(APITestCase):
                                    args=['release-1.0', 'ponies']))
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    def _get_mappings(self, release_id, query=''):
+        response = self.client.get(reverse('releaserpmmapping-list', args=[release_id]) + query)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return json.loads(''.join(response.streaming_content))
+
+    def test_list_for_packages(self):
+        compose_models.OverrideRPM.objects.create(release_id=1, variant='Server', arch='x86_64',
+                                                  srpm_name='zsh', rpm_name='zsh', rpm_arch='x86_64',
+                                                  include=True)
+        with CaptureQueriesContext(connection) as queries:
+            data = self._get_mappings('release-1.0', '?package=bash&package=zsh&package=ponies')
+        # RPMs and overrides of all packages are loaded at once.
+        self.assertEqual(len([q for q in queries if 'compose_composerpm' in q['sql']]), 1)
+        self.assertEqual(len([q for q in queries if 'compose_overriderpm' in q['sql']]), 1)
+        self.assertEqual(data, {
+            'compose': 'compose-1',
+            'mappings': {
+                'bash': {'Server': {'x86_64': {'bash': ['x86_64']}}},
+                'zsh': {'Server': {'x86_64': {'zsh': ['x86_64']}}},
+            }
+        })
+
+    def test_list_matches_detail(self):
+        data = self._get_mappings('release-1.0')
+        response = self.client.get(reverse('releaserpmmapping-detail', args=['release-1.0', 'bash']))
+        self.assertEqual(data['mappings'], {'bash': response.data['mapping']})
+
+    def test_list_with_disabled_overrides(self):
+        data = self._get_mappings('release-1.0', '?disable_overrides=1')
+        self.assertEqual(data['mappings']['bash']['Server']['x86_64'],
+                         {'bash': ['x86_64'], 'bash-doc': ['x86_64']})
+
+    def test_list_does_not_delete_useless_overrides(self):
+        compose_models.OverrideRPM.objects.create(release_id=1, variant='Server', arch='x86_64',
+                                                  srpm_name='bash', rpm_name='bash', rpm_arch='x86_64',
+                                                  include=True)
+        self._get_mappings('release-1.0')
+        self.assertEqual(compose_models.OverrideRPM.objects.count(), 2)
+
+    def test_list_for_no_compose_with_include(self):
+        compose_models.OverrideRPM.objects.filter(id=1).update(include=True)
+        compose_models.Compose.objects.filter(release__release_id='release-1.0').delete()
+        data = self._get_mappings('release-1.0')
+        self.assertEqual(data, {'compose': None,
+                                'mappings': {'bash': {'Server': {'x86_64': {'bash-doc': ['x86_64']}}}}})
+
+    def test_list_for_nonexisting_release(self):
+        response = self.client.get(reverse('releaserpmmapping-list', args=['product-1.1']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_snapshot_not_built(self):
+        response = self.client.get(reverse('releaserpmmappingsnapshot-list', args=['release-1.0']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_build_snapshot(self):
+        response = self.client.post(reverse('releaserpmmappingsnapshot-list', args=['release-1.0']))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['compose'], 'compose-1')
+        self.assertEqual(response.data['latest_compose'], 'compose-1')
+        self.assertTrue(response.data['fresh'])
+        self.assertEqual(response.data['packages'], 1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('releaserpmmapping-detail', args=['release-1.0', 'bash']))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'compose': 'compose-1',
+                                         'mapping': {'Server': {'x86_64': {'bash': ['x86_64']}}}})
+        self.assertFalse([q for q in queries if 'compose_composerpm' in q['sql']])
+
+    def test_snapshot_updated_by_override_change(self):
+        self.client.post(reverse('releaserpmmappingsnapshot-list', args=['release-1.0']))
+        release = models.Release.objects.get(release_id='release-1.0')
+        compose_models.OverrideRPM.update_object('delete', release, {
+            'variant': 'Server', 'arch': 'x86_64', 'srpm_name': 'bash',
+            'rpm_name': 'bash-doc', 'rpm_arch': 'x86_64', 'include': False,
+        })
+        response = self.client.get(reverse('releaserpmmapping-detail', args=['release-1.0', 'bash']))
+        self.assertEqual(response.data['mapping'],
+                         {'Server': {'x86_64': {'bash': ['x86_64'], 'bash-doc': ['x86_64']}}})
+
+    def test_snapshot_not_fresh_with_newer_compose(self):
+        self.client.post(reverse('releaserpmmappingsnapshot-list', args=['release-1.0']))
+        compose_models.Compose.objects.create(
+            release=models.Release.objects.get(release_id='release-1.0'),
+            compose_respin=0,
+            compose_date='2015-01-30',
+            compose_id='ComposeWithNoRPMs',
+            compose_type=compose_models.ComposeType.objects.get(name='production'),
+            acceptance_testing=compose_models.ComposeAcceptanceTestingState.objects.get(name='untested'),
+        )
+        response = self.client.get(reverse('releaserpmmappingsnapshot-list', args=['release-1.0']))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['compose'], 'compose-1')
+        self.assertEqual(response.data['latest_compose'], 'ComposeWithNoRPMs')
+        self.assertFalse(response.data['fresh'])
+        response = self.client.get(reverse('releaserpmmapping-detail', args=['release-1.0', 'bash']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.post(reverse('releaserpmmappingsnapshot-list', args=['release-1.0']))
+        self.assertTrue(response.data['fresh'])
+        self.assertEqual(response.data['packages'], 0)
+
+    def test_refresh_stale_snapshot(self):
+        self.client.post(reverse('releaserpmmappingsnapshot-list', args=['release-1.0']))
+        release = models.Release.objects.get(release_id='release-1.0')
+        compose_models.ReleaseRPMMappingSnapshot.refresh_stale([release])
+        self.assertEqual(compose_models.ReleaseRPMMapping.objects.filter(release=release).count(), 1)
+        compose_models.Compose.objects.create(
+            release=models.Release.objects.get(release_id='release-1.0'),
+            compose_respin=0,
+            compose_date='2015-01-30',
+            compose_id='ComposeWithNoRPMs',
+            compose_type=compose_models.ComposeType.objects.get(name='production'),
+            acceptance_testing=compose_models.ComposeAcceptanceTestingState.objects.get(name='untested'),
+        )
+        compose_models.ReleaseRPMMappingSnapshot.refresh_stale([release])
+        snapshot = compose_models.ReleaseRPMMappingSnapshot.objects.get(release=release)
+        self.assertEqual(snapshot.compose.compose_id, 'ComposeWithNoRPMs')
+        self.assertEqual(compose_models.ReleaseRPMMapping.objects.filter(release=release).count(), 0)
+
+    def test_changing_release_variants_drops_snapshot(self):
+        self.client.post(reverse('releaserpmmappingsnapshot-list', args=['release-1.0']))
+        models.VariantArch.objects.filter(variant__release__release_id='release-1.0').delete()
+        self.assertFalse(compose_models.ReleaseRPMMappingSnapshot.objects.exists())
+        response = self.client.get(reverse('releaserpmmapping-detail', args=['release-1.0', 'bash']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_options_on_list_url(self):
         response = self.client.options(reverse('release-list'))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
+@override_settings(API_RESPONSE_CACHE='default')
+class ReleaseCachedListTestCase(TestCaseWithChangeSetMixin, APITestCase):
+    fixtures = [
+        'pdc/apps/release/fixtures/tests/release.json',
+    ]
+
+    def setUp(self):
+        super(ReleaseCachedListTestCase, self).setUp()
+        cache.clear()
+
+    def test_change_of_bugzilla_mapping_invalidates_cache(self):
+        url = reverse('release-list')
+        response = self.client.get(url, format='json')
+        self.assertIsNone(response.data['results'][0]['bugzilla'])
+        response = self.client.patch(reverse('release-detail', args=['release-1.0']),
+                                     {'bugzilla': {'product': 'Fedora'}}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(url, format='json')
+        self.assertEqual(response.data['results'][0]['bugzilla'], {'product': 'Fedora'})
+
+
 class ReleaseUpdateRESTTestCase(TestCaseWithChangeSetMixin, APITestCase):
     fixtures = [
         "pdc/apps/common/fixtures/test/sigkey.json",
@@ -2497,6 +2648,27 @@ class ProductLastModifiedResponseTestCase(TestCaseWithChangeSetMixin, APITestCas
         after_time = self._get_last_modified_epoch(response)
         self.assertGreaterEqual(after_time - before_time, 3)
 
+    def test_conditional_get_with_etag(self):
+        response = self.client.get(reverse('product-list'))
+        etag = response['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('product-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_304_NOT_MODIFIED, response.status_code)
+        # Only last modification time is looked up, changes are not queried.
+        changeset_queries = [q['sql'] for q in queries if 'changeset_' in q['sql']]
+        self.assertEqual(len(changeset_queries), 1)
+        self.assertIn('changeset_lastmodified', changeset_queries[0])
+
+        response = self.client.get(reverse('product-list'), {'short': 'product'})
+        self.assertNotEqual(etag, response['ETag'])
+
+        args = {"name": "Fedora", "short": "f"}
+        response = self.client.post(reverse('product-list'), args)
+        self.assertEqual(status.HTTP_201_CREATED, response.status_code)
+        response = self.client.get(reverse('product-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(status.HTTP_200_OK, response.status_code)
+        self.assertNotEqual(etag, response['ETag'])
+
 
 class AllowedPushTargetsRESTTestCase(TestCaseWithChangeSetMixin, APITestCase):
     fixtures = [
@@ -4,6 +4,7 @@
 # http://opensource.org/licenses/MIT
 #
 import json
+from collections import OrderedDict
 
 from django.shortcuts import render, get_object_or_404
 from django.conf import settings
@@ -11,7 +12,7 @@ from kobo.django.views.generic import DetailView, SearchView
 from rest_framework.reverse import reverse
 from rest_framework import viewsets, mixins, status
 from rest_framework.response import Response
-from django.http import Http404
+from django.http import Http404, StreamingHttpResponse
 from . import filters
 from . import signals
 from . import models
@@ -26,7 +27,8 @@ from .serializers import (ProductSerializer, ProductVersionSerializer,
 from pdc.apps.compose import models as compose_models
 from pdc.apps.repository import models as repo_models
 from pdc.apps.common.constants import PUT_OPTIONAL_PARAM_WARNING
-from pdc.apps.common.viewsets import (ChangeSetModelMixin,
+from pdc.apps.common.viewsets import (CachedListMixin,
+                                      ChangeSetModelMixin,
                                       ChangeSetCreateModelMixin,
                                       ChangeSetUpdateModelMixin,
                                       MultiLookupFieldMixin,
@@ -210,6 +212,7 @@ class ReleaseViewSet(NotificationMixin,
                      ChangeSetCreateModelMixin,
                      ChangeSetUpdateModelMixin,
                      ConditionalProcessingMixin,
+                     CachedListMixin,
                      StrictQueryParamMixin,
                      mixins.ListModelMixin,
                      mixins.RetrieveModelMixin,
@@ -235,7 +238,10 @@ class ReleaseViewSet(NotificationMixin,
     filter_class = filters.ReleaseFilter
     permission_classes = (APIPermission,)
     docstring_macros = PUT_OPTIONAL_PARAM_WARNING
-    related_model_classes = (Release, BaseProduct, ProductVersion)
+    # Compose imports are recorded as notices. Bindings of bugzilla and
+    # dist-git are logged as their own changes.
+    related_model_classes = (Release, BaseProduct, ProductVersion, compose_models.Compose, 'notice',
+                             'releasebugzillamapping', 'releasedistgitmapping')
 
     def filter_queryset(self, qs):
         """
@@ -560,11 +566,60 @@ class ReleaseComponentCloneViewSet(StrictQueryParamMixin, viewsets.GenericViewSe
         return Response({'url': target_url}, status=status.HTTP_201_CREATED)
 
 
+def _stream_mappings(compose_id, results):
+    yield '{"compose": %s, "mappings": {' % json.dumps(compose_id)
+    for i, (package, mapping) in enumerate(results):
+        if i:
+            yield ','
+        yield '%s: %s' % (json.dumps(package), json.dumps(mapping))
+    yield '}}'
+
+
 class ReleaseRPMMappingView(StrictQueryParamMixin, viewsets.GenericViewSet):
     lookup_field = 'package'
     queryset = models.Release.objects.none()   # Required for permissions
     permission_classes = (APIPermission,)
-    extra_query_params = ['disable_overrides']
+    extra_query_params = ['disable_overrides', 'package']
+
+    def list(self, request, **kwargs):
+        """
+        __URL__: $LINK:releaserpmmapping-list:release_id$
+
+        Returns RPM mappings of multiple packages in the latest compose for
+        given release. The mappings are the same as the ones returned for a
+        single package (see below), the same `?disable_overrides=1` query
+        parameter is available.
+
+        Packages are selected with the `package` query parameter, which can
+        be repeated (`?package=foo&package=bar`). Without it, mappings of all
+        packages in the compose and in the release overrides are returned.
+        Packages not present in the release are not included in the result.
+
+        __Response__:
+
+            {
+                "compose": string,
+                "mappings": {
+                    "package": object,
+                    ...
+                }
+            }
+
+        The `compose` key contains compose id of the compose used to populate
+        the mappings. If the release has no compose, 'compose' is null.
+        """
+        release = get_object_or_404(models.Release, release_id=kwargs['release_id'])
+        compose = release.get_latest_compose()
+        mappings = compose_models.ComposeRPMMapping.load_many(
+            release, compose=compose,
+            packages=request.query_params.getlist('package') or None,
+            disable_overrides=bool(request.query_params.get('disable_overrides', False)))
+        compose_id = compose.compose_id if compose else None
+        results = ((package, mapping.get_pure_dict()) for package, mapping in mappings)
+        results = ((package, result) for package, result in results if result)
+        if request.accepted_renderer.format != 'json':
+            return Response(data={'compose': compose_id, 'mappings': OrderedDict(results)})
+        return StreamingHttpResponse(_stream_mappings(compose_id, results), content_type='application/json')
 
     def retrieve(self, request, **kwargs):
         """
@@ -597,12 +652,29 @@ class ReleaseRPMMappingView(StrictQueryParamMixin, viewsets.GenericViewSet):
 
         The `compose` key contains compose id of the compose used to populate
         the mapping. If the release has no compose, 'compose' is null.
+
+        Once RPMs of a compose are imported, the mappings with applied
+        overrides are stored and read from a snapshot, see
+        $LINK:releaserpmmappingsnapshot-list:release_id$. A snapshot that was
+        not built from the latest compose is not used.
         """
         release = get_object_or_404(models.Release, release_id=kwargs['release_id'])
+        disable_overrides = bool(request.query_params.get('disable_overrides', False))
         compose = release.get_latest_compose()
+        snapshot = None
+        if not disable_overrides:
+            snapshot = compose_models.ReleaseRPMMappingSnapshot.objects.filter(release=release).first()
+        if snapshot and snapshot.compose_id == (compose.pk if compose else None):
+            stored = (compose_models.ReleaseRPMMapping.objects
+                      .filter(release=release, srpm_name=kwargs['package']).first())
+            if stored:
+                return Response(data={'compose': compose.compose_id if compose else None,
+                                      'mapping': stored.get_mapping()})
+            return self._not_found(kwargs)
+
         if compose:
             mapping, _ = compose.get_rpm_mapping(kwargs['package'],
-                                                 bool(request.query_params.get('disable_overrides', False)),
+                                                 disable_overrides,
                                                  release=release)
             result = mapping.get_pure_dict()
             if result:
@@ -610,18 +682,82 @@ class ReleaseRPMMappingView(StrictQueryParamMixin, viewsets.GenericViewSet):
         else:
             mapping = compose_models.ComposeRPMMapping()
             mapping.get_rpm_mapping_only_with_overrides(kwargs['package'],
-                                                        bool(request.query_params.get('disable_overrides', False)),
+                                                        disable_overrides,
                                                         release=release)
             result = mapping.get_pure_dict()
             if result:
                 return Response(data={'compose': None, 'mapping': result})
 
         # no result
+        return self._not_found(kwargs)
+
+    def _not_found(self, kwargs):
         return Response(status=status.HTTP_404_NOT_FOUND,
                         data={'detail': 'Package %s not present in release %s'
                                         % (kwargs['package'], kwargs['release_id'])})
 
 
+class ReleaseRPMMappingSnapshotView(StrictQueryParamMixin, viewsets.GenericViewSet):
+    queryset = models.Release.objects.none()   # Required for permissions
+    permission_classes = (APIPermission,)
+
+    def list(self, request, **kwargs):
+        """
+        __URL__: $LINK:releaserpmmappingsnapshot-list:release_id$
+
+        Returns state of the stored RPM mappings of the release. The snapshot
+        is built when RPMs of a compose are imported and is updated whenever
+        RPM overrides of the release change or a compose is linked to the
+        release. Changing variants or arches of the release drops the
+        snapshot. Mappings of single packages
+        ($LINK:releaserpmmapping-detail:release_id:package$) are then read from
+        it as long as it is fresh.
+
+        The response is `404 NOT FOUND` if the release has no snapshot yet.
+
+        __Response__:
+
+            {
+                "compose": string,
+                "latest_compose": string,
+                "fresh": bool,
+                "refreshed_on": datetime,
+                "packages": int
+            }
+
+        The `compose` key contains compose id of the compose the snapshot was
+        built from, `latest_compose` is the current latest compose of the
+        release. The snapshot is `fresh` when they are the same; otherwise it
+        should be rebuilt.
+        """
+        release = get_object_or_404(models.Release, release_id=kwargs['release_id'])
+        snapshot = get_object_or_404(compose_models.ReleaseRPMMappingSnapshot.objects.select_related('compose'),
+                                     release=release)
+        return Response(self._serialize(snapshot))
+
+    def create(self, request, **kwargs):
+        """
+        __URL__: $LINK:releaserpmmappingsnapshot-list:release_id$
+
+        Build the snapshot of RPM mappings of the release from its latest
+        compose, or bring an existing snapshot up to date. No data is
+        needed. The response has the same format as `GET`.
+        """
+        release = get_object_or_404(models.Release, release_id=kwargs['release_id'])
+        snapshot = compose_models.ReleaseRPMMappingSnapshot.refresh(release)
+        return Response(self._serialize(snapshot), status=status.HTTP_200_OK)
+
+    def _serialize(self, snapshot):
+        latest = snapshot.release.get_latest_compose()
+        return {
+            'compose': snapshot.compose.compose_id if snapshot.compose else None,
+            'latest_compose': latest.compose_id if latest else None,
+            'fresh': latest == snapshot.compose,
+            'refreshed_on': snapshot.refreshed_on,
+            'packages': compose_models.ReleaseRPMMapping.objects.filter(release=snapshot.release).count(),
+        }
+
+
 class ReleaseTypeViewSet(StrictQueryParamMixin,
                          mixins.ListModelMixin,
                          viewsets.GenericViewSet):
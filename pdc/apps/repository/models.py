@@ -9,6 +9,7 @@
 from django.db import models
 from django.core.exceptions import ValidationError
 
+from pdc.apps.common.idcache import IdCache
 from pdc.apps.common.models import get_cached_id
 
 
@@ -20,7 +21,7 @@ class Service(models.Model):
     def __unicode__(self):
         return u"%s" % self.name
 
-    CACHE = {}
+    CACHE = IdCache("name")
 
     @classmethod
     def get_cached_id(cls, value):
@@ -52,7 +53,7 @@ class ContentCategory(models.Model):
     def __unicode__(self):
         return u"%s" % self.name
 
-    CACHE = {}
+    CACHE = IdCache("name")
 
     @classmethod
     def get_cached_id(cls, value):
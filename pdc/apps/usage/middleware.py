@@ -8,15 +8,16 @@ from django.conf import settings
 from django.utils.deprecation import MiddlewareMixin
 import re
 
-from . import models
+from .recorder import recorder
 
 
 class UsageMiddleware(MiddlewareMixin):
     """
-    This middleware class updates tracking information in the database on each
-    request to the API. The information stored is last access time for each
-    user and last access details about each resource (user, time, resource
-    name, method). Super users are excluded from resource tracking.
+    This middleware class records tracking information on each request to the
+    API. The information stored is last access time for each user and last
+    access details about each resource (user, time, resource name, method).
+    Super users are excluded from resource tracking. The data is buffered and
+    written to the database periodically, see `pdc.apps.usage.recorder`.
     """
     def process_view(self, request, view_func, *args, **kwargs):
         # If user authenticates with a token, the user identity can not be
@@ -36,17 +37,8 @@ class UsageMiddleware(MiddlewareMixin):
         user = None
         if request.user and request.user.is_authenticated:
             user = request.user
-            user.last_connected = data['now']
-            user.save()
 
-            if request.user.is_superuser:
-                # We don't want to log accesses by superusers
-                return response
-
-        models.ResourceUsage.objects.update_or_create(
-            resource=data['resource'],
-            method=request.method,
-            defaults={'user': user, 'time': data['now']}
-        )
+        recorder.record(user, data['resource'], request.method, data['now'])
+        recorder.flush_if_due()
 
         return response
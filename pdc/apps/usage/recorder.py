@@ -0,0 +1,142 @@
+#
+# Copyright (c) 2018 Red Hat
+# Licensed under The MIT License (MIT)
+# http://opensource.org/licenses/MIT
+#
+"""
+Buffering of usage tracking data.
+
+Updating last access time of the user and of the resource on every request
+adds writes to read-only requests, and concurrent requests fight for the same
+`ResourceUsage` rows. Instead, each process only remembers the latest access
+of each user and each resource and writes them all at once after
+`USAGE_FLUSH_INTERVAL` seconds. Whatever is pending is also written when the
+process exits.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Case, DateTimeField, IntegerField, Value, When
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+def _chunks(items, size=BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class UsageRecorder(object):
+    """
+    Collects latest access time of users and latest access details of
+    resources and writes them to the database in batches.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = {}
+        self._resources = {}
+        self._last_flush = time.time()
+
+    def record(self, user, resource, method, now):
+        """
+        Remember access to `resource` with given `method`. The `user` may be
+        `None` for anonymous access; accesses of super users only update
+        their last access time.
+        """
+        with self._lock:
+            if user is not None:
+                if user.pk not in self._users or self._users[user.pk] < now:
+                    self._users[user.pk] = now
+                if user.is_superuser:
+                    return
+            key = (resource, method)
+            if key not in self._resources or self._resources[key][1] < now:
+                self._resources[key] = (user.pk if user else None, now)
+
+    def __len__(self):
+        return len(self._users) + len(self._resources)
+
+    def flush_if_due(self):
+        interval = getattr(settings, 'USAGE_FLUSH_INTERVAL', 60)
+        if not interval or time.time() - self._last_flush >= interval:
+            self.flush()
+
+    def flush(self):
+        """Write all pending data to the database."""
+        with self._lock:
+            users, self._users = self._users, {}
+            resources, self._resources = self._resources, {}
+            self._last_flush = time.time()
+        if not users and not resources:
+            return
+        try:
+            with transaction.atomic():
+                self._write_users(users)
+                self._write_resources(resources)
+        except Exception:
+            logger.exception('Could not store usage data, will retry on next flush')
+            self._restore(users, resources)
+
+    def _restore(self, users, resources):
+        with self._lock:
+            for pk, now in users.iteritems():
+                if pk not in self._users or self._users[pk] < now:
+                    self._users[pk] = now
+            for key, value in resources.iteritems():
+                if key not in self._resources or self._resources[key][1] < value[1]:
+                    self._resources[key] = value
+
+    def _write_users(self, users):
+        for chunk in _chunks(users.iteritems()):
+            get_user_model().objects.filter(pk__in=[pk for pk, _ in chunk]).update(
+                last_connected=Case(*[When(pk=pk, then=Value(now)) for pk, now in chunk],
+                                    output_field=DateTimeField())
+            )
+
+    def _write_resources(self, resources):
+        existing = {}
+        for chunk in _chunks(set(resource for resource, _ in resources)):
+            for pk, resource, method in (models.ResourceUsage.objects
+                                         .filter(resource__in=chunk)
+                                         .values_list('pk', 'resource', 'method')):
+                existing[(resource, method)] = pk
+
+        updates = [(existing[key], value) for key, value in resources.iteritems() if key in existing]
+        for chunk in _chunks(updates):
+            models.ResourceUsage.objects.filter(pk__in=[pk for pk, _ in chunk]).update(
+                user=Case(*[When(pk=pk, then=Value(user_id)) for pk, (user_id, _) in chunk],
+                          output_field=IntegerField()),
+                time=Case(*[When(pk=pk, then=Value(now)) for pk, (_, now) in chunk],
+                          output_field=DateTimeField()),
+            )
+
+        missing = [models.ResourceUsage(resource=resource, method=method, user_id=user_id, time=now)
+                   for (resource, method), (user_id, now) in resources.iteritems()
+                   if (resource, method) not in existing]
+        if not missing:
+            return
+        try:
+            with transaction.atomic():
+                models.ResourceUsage.objects.bulk_create(missing, batch_size=BATCH_SIZE)
+        except IntegrityError:
+            # Another process created some of the rows in the meantime.
+            for usage in missing:
+                models.ResourceUsage.objects.update_or_create(
+                    resource=usage.resource,
+                    method=usage.method,
+                    defaults={'user_id': usage.user_id, 'time': usage.time}
+                )
+
+
+recorder = UsageRecorder()
+atexit.register(recorder.flush)
@@ -8,11 +8,13 @@ import mock
 from rest_framework.test import APITestCase
 from django.urls import reverse
 from django.contrib.auth import get_user_model
+from django.test import override_settings
 from django.utils import timezone
 
 from rest_framework.authtoken.models import Token
 from pdc.apps.common.test_utils import create_user
 from . import models
+from .recorder import recorder
 
 
 class UsageTestCase(APITestCase):
@@ -51,3 +53,56 @@ class UsageTestCase(APITestCase):
         record = models.ResourceUsage.objects.get(resource='APIRoot', method='GET')
         self.assertEqual(record.user, user)
         self.assertEqual(record.time, self.now)
+
+
+@override_settings(USAGE_FLUSH_INTERVAL=3600)
+class BufferedUsageTestCase(APITestCase):
+    def setUp(self):
+        recorder.flush()
+        self.user = create_user('user')
+        user_token, _ = Token.objects.get_or_create(user=self.user)
+        self.user_token = 'Token %s' % user_token
+        self.now = timezone.now()
+
+    def tearDown(self):
+        recorder.flush()
+
+    def test_usage_is_not_written_before_flush(self):
+        self.client.get(reverse('api-root'), HTTP_AUTHORIZATION=self.user_token)
+        self.assertEqual(0, models.ResourceUsage.objects.count())
+        self.assertIsNone(get_user_model().objects.get(username='user').last_connected)
+        self.assertEqual(2, len(recorder))
+
+    @mock.patch('django.utils.timezone.now')
+    def test_flush_writes_latest_access(self, time_mock):
+        for minutes in (1, 3, 2):
+            time_mock.return_value = self.now + timezone.timedelta(minutes=minutes)
+            self.client.get(reverse('api-root'), HTTP_AUTHORIZATION=self.user_token)
+        recorder.flush()
+        latest = self.now + timezone.timedelta(minutes=3)
+        self.assertEqual(get_user_model().objects.get(username='user').last_connected, latest)
+        record = models.ResourceUsage.objects.get(resource='APIRoot', method='GET')
+        self.assertEqual(record.user, self.user)
+        self.assertEqual(record.time, latest)
+        self.assertEqual(0, len(recorder))
+
+    def test_flush_updates_existing_records(self):
+        models.ResourceUsage.objects.create(resource='APIRoot', method='GET', time=self.now)
+        recorder.record(None, 'APIRoot', 'GET', self.now + timezone.timedelta(minutes=1))
+        recorder.record(self.user, 'ReleaseViewSet', 'GET', self.now)
+        with self.assertNumQueries(8):
+            # 4 savepoint queries, update of users, lookup of existing
+            # records, update of existing and insert of new records
+            recorder.flush()
+        self.assertEqual(2, models.ResourceUsage.objects.count())
+        record = models.ResourceUsage.objects.get(resource='APIRoot', method='GET')
+        self.assertIsNone(record.user)
+        self.assertEqual(record.time, self.now + timezone.timedelta(minutes=1))
+
+    def test_failed_flush_keeps_data(self):
+        recorder.record(self.user, 'APIRoot', 'GET', self.now)
+        with mock.patch.object(recorder, '_write_resources', side_effect=Exception('boom')):
+            recorder.flush()
+        self.assertEqual(2, len(recorder))
+        recorder.flush()
+        self.assertEqual(1, models.ResourceUsage.objects.count())
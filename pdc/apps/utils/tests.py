@@ -108,7 +108,7 @@ class APIRootTestCase(APITestCase):
         key = 'releases/{release_id}/rpm-mapping'
         self.assertIn(key, response.data)
         self.assertEqual(response.data[key],
-                         'http://testserver/rest_api/v1/releases/{release_id}/rpm-mapping/{package}/')
+                         'http://testserver/rest_api/v1/releases/{release_id}/rpm-mapping/')
 
 
 class TestCacheRESTTestCase(APITestCase):
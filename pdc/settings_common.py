@@ -65,11 +65,61 @@ ITEMS_PER_PAGE = 50
 ALLOW_ALL_USER_READ = True
 # enable all resource permissions
 DISABLE_RESOURCE_PERMISSION_CHECK = False
-
+# Resources and permissions granted to groups are cached in each process and
+# dropped when they change. Changes done by other processes are noticed
+# after this number of seconds.
+PERMISSION_CACHE_TIMEOUT = 60
+# Last access times of users and resources are collected in memory and
+# written to the database at most once per this number of seconds. Set to 0
+# to write them after each request.
+USAGE_FLUSH_INTERVAL = 60
+
+
+# Parse bodies of compose import requests incrementally, so that big RPM
+# manifests are never loaded into memory as a whole. Requires `ijson`.
+COMPOSE_IMPORT_STREAMING = False
+
+# Number of threads in each server process running background compose
+# imports (see compose-import-jobs API). Set to 0 when jobs are run by
+# separate `run_compose_import_jobs` processes instead. Idle workers look for
+# queued jobs every COMPOSE_IMPORT_POLL_INTERVAL seconds.
+COMPOSE_IMPORT_WORKERS = 2
+COMPOSE_IMPORT_POLL_INTERVAL = 10
+# Alias from CACHES keeping progress of running import jobs. It has to be
+# shared by all server and worker processes for the progress to be visible.
+COMPOSE_IMPORT_PROGRESS_CACHE = 'default'
+
+# Ids of rows in lookup tables used by imports (paths, signing keys, content
+# categories, image formats and types) are cached. Each process keeps at most
+# ID_CACHE_SIZE entries per table. Set ID_CACHE_BACKEND to an alias from
+# CACHES to share the entries between processes instead.
+ID_CACHE_SIZE = 10000
+ID_CACHE_BACKEND = None
+
+# List responses of some API endpoints (releases, components, ...) can be
+# cached in API_RESPONSE_CACHE, an alias from CACHES. Cached responses are
+# dropped when related data are changed via API, so CACHE_MIDDLEWARE_SECONDS
+# can be set to 0. Changes done outside of API are visible after
+# API_RESPONSE_CACHE_TIMEOUT seconds.
+API_RESPONSE_CACHE = None
+API_RESPONSE_CACHE_TIMEOUT = 300
 
 # send email to admin if one changeset's change is equal or greater than CHANGESET_SIZE_ANNOUNCE
 CHANGESET_SIZE_ANNOUNCE = 1000
 
+# Lists requested with page_size=-1 as JSON or NDJSON are streamed. This is
+# the number of objects loaded and serialized at once.
+STREAMING_LIST_CHUNK_SIZE = 1000
+
+# Number of changes inserted by a single query when a changeset is committed.
+# Backends with a limit on number of query parameters may use smaller batches.
+CHANGESET_COMMIT_BATCH_SIZE = 1000
+
+# Pending changes of a changeset are moved from memory to a temporary file
+# once their old and new values have more than this number of characters.
+# None keeps all pending changes in memory.
+CHANGESET_SPOOL_THRESHOLD = None
+
 # Application definition
 
 INSTALLED_APPS = (
@@ -126,6 +176,7 @@ REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': (
         'rest_framework.renderers.JSONRenderer',
         'pdc.apps.common.renderers.ReadOnlyBrowsableAPIRenderer',
+        'pdc.apps.common.renderers.NDJSONRenderer',
     ),
 
     'EXCEPTION_HANDLER': 'pdc.apps.common.handlers.exception_handler',
@@ -347,6 +398,22 @@ MESSAGE_BUS = {
     # 'TOPIC': 'pdc',
     # 'CERT_FILE': '',
     # 'KEY_FILE': '',
+    #
+    # # Send messages from a background thread instead of before the response
+    # # is returned. All keys are optional.
+    # 'ASYNC': {
+    #     'QUEUE_SIZE': 10000,
+    #     'ENQUEUE_TIMEOUT': 5,
+    #     'BATCH_SIZE': 100,
+    #     'RETRIES': 5,
+    #     'RETRY_DELAY': 1,
+    #     'SPOOL_FILE': '/var/lib/pdc/messages.spool',
+    #     'STATS_INTERVAL': 300,
+    # },
+    #
+    # # Store messages in database together with the changes and let
+    # # `django-admin relay_messages` send them.
+    # 'OUTBOX': True,
 }
 
 # ======== Email configuration =========
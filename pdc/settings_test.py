@@ -38,6 +38,7 @@ REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': (
         'rest_framework.renderers.JSONRenderer',
         'pdc.apps.common.renderers.ReadOnlyBrowsableAPIRenderer',
+        'pdc.apps.common.renderers.NDJSONRenderer',
     ),
 
     'EXCEPTION_HANDLER': 'pdc.apps.common.handlers.exception_handler',
@@ -50,6 +51,9 @@ REST_FRAMEWORK = {
 COMPONENT_BRANCH_NAME_BLACKLIST_REGEX = r'^epel\d+$'
 DISABLE_RESOURCE_PERMISSION_CHECK = True
 SKIP_RESOURCE_CREATION = True
+USAGE_FLUSH_INTERVAL = 0
+# Tests run compose import jobs explicitly.
+COMPOSE_IMPORT_WORKERS = 0
 
 MESSAGE_BUS = {
     'BACKEND': 'pdc.apps.messaging.backends.capture.TestMessenger'